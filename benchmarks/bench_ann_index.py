@@ -0,0 +1,99 @@
+"""
+Recall / latency / memory benchmark of the FAISS index types.
+
+For each corpus size and index type, reports the build time (training + adding),
+recall@k against the exact flat index, p50 / p99 single-query latency and the
+index size in memory.
+
+Usage:
+    python -m benchmarks.bench_ann_index --sizes 10000 100000 1000000 --dim 1024
+    python -m benchmarks.bench_ann_index --types flat hnsw --nprobe 8 32 --json results.json
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic import clustered_vectors, perturbed_queries
+from rag_poc import config, faiss_index
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """ Fraction of the true top-k found in the approximate top-k. """
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+def bench_index(index_type, vectors, queries, truth, k, nprobe=None, ef_search=None) -> dict:
+    start = time.perf_counter()
+    index, params = faiss_index.create_index(index_type, vectors, nprobe=nprobe, ef_search=ef_search)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+
+    return {
+        "index_type": params["index_type"],
+        "n_vectors": len(vectors),
+        "dim": vectors.shape[1],
+        "nprobe": params.get("nprobe"),
+        "efSearch": params.get("efSearch"),
+        "build_s": round(build_s, 3),
+        f"recall@{k}": round(recall_at_k(np.array(found), truth), 4),
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(1000 * float(np.percentile(latencies, 99)), 4),
+        "index_mb": round(faiss_index.index_bytes(index) / 1024 ** 2, 2),
+    }
+
+def run(sizes, dim, types, k, n_queries, nprobes, ef_searches) -> list:
+    results = []
+    for size in sizes:
+        vectors = clustered_vectors(size, dim)
+        queries = perturbed_queries(vectors, n_queries)
+
+        flat = faiss.IndexFlatL2(dim)
+        flat.add(vectors)
+        _, truth = flat.search(queries, k)
+
+        for index_type in types:
+            if index_type.startswith("ivf"):
+                settings = [{"nprobe": n} for n in nprobes]
+            elif index_type == "hnsw":
+                settings = [{"ef_search": ef} for ef in ef_searches]
+            else:
+                settings = [{}]
+
+            for setting in settings:
+                result = bench_index(index_type, vectors, queries, truth, k, **setting)
+                print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark the FAISS index types.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    p.add_argument("--dim", type=int, default=256, help="Vector dimension (mistral-embed: 1024).")
+    p.add_argument("--types", nargs="+", default=list(config.INDEX_TYPES), choices=config.INDEX_TYPES)
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--nprobe", type=int, nargs="+", default=[config.ANN_NPROBE])
+    p.add_argument("--ef-search", type=int, nargs="+", default=[config.ANN_EF_SEARCH])
+    p.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    faiss.omp_set_num_threads(args.threads)
+    results = run(args.sizes, args.dim, args.types, args.k, args.queries, args.nprobe, args.ef_search)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
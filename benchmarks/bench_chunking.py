@@ -0,0 +1,108 @@
+"""
+Benchmark of the chunked indexing of scripts.indexing against one vector per event.
+
+Builds a store of N synthetic events with long descriptions (--words words)
+without chunking and with each --chunk-size, then searches queries made of
+--query-words consecutive words taken anywhere in the description of an event.
+Reports the number of vectors, the size of the store on disk, the build time
+(documents, chunks, embeddings, index and save) and the retrieval quality: the
+recall at 1 and 5 and the MRR at 10 of the event the passage comes from, found
+by the dense search and collapsed to distinct events, and the search latency.
+
+Usage:
+    python -m benchmarks.bench_chunking --events 5000 --words 400
+    python -m benchmarks.bench_chunking --chunk-size 500 1000 2000 --overlap 150 --json chunking.json
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_hybrid import timed
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.synthetic import event_frame
+from rag_poc import config, faiss_index
+from rag_poc.vector_store import VectorStore, save_store
+from scripts.indexing import chunk_documents, documents_frame, iter_texts
+
+def build(folder, df, embeddings, chunk_size, overlap) -> float:
+    start = time.perf_counter()
+    documents = documents_frame(df.drop("uid"), config.COLUMN_EMBEDDING, df.get_column("uid").to_list())
+    chunking = {"size": chunk_size, "overlap": overlap} if chunk_size else None
+    if chunking:
+        documents = chunk_documents(documents, chunk_size, overlap)
+    vectors = np.concatenate([np.asarray(embeddings.embed_documents(texts), dtype=np.float32) for texts in iter_texts(documents)])
+    index, params = faiss_index.create_index("flat", vectors)
+    index.add_with_ids(vectors, documents.column("faiss_id").to_numpy())
+    save_store(folder, index, documents.sort_by("faiss_id"), params, config.EMBEDDING_MODEL, chunking=chunking)
+    return time.perf_counter() - start
+
+def search(store, vector, k) -> list:
+    n_results = k * config.CHUNK_OVERFETCH if store.chunking else k
+    found = store.parent_documents(store.similarity_search_with_score_by_vector(vector, n_results), k)
+    return [doc.id for doc, _ in found]
+
+def run(n_events, words, chunk_sizes, overlap, n_queries, query_words, dim) -> list:
+    df = event_frame(n_events, words)
+    embeddings = HashEmbeddings(dim)
+
+    rng = np.random.default_rng(1)
+    targets = rng.integers(0, n_events, n_queries)
+    queries = []
+    for target in targets:
+        tokens = df["longdescription_fr"][int(target)].split()
+        start = int(rng.integers(0, len(tokens) - query_words))
+        queries.append((f"event{target}", " ".join(tokens[start:start + query_words])))
+    query_vectors = np.asarray(embeddings.embed_documents([text for _, text in queries]), dtype=np.float32)
+
+    results = []
+    for chunk_size in [None, *chunk_sizes]:
+        with tempfile.TemporaryDirectory() as tmp:
+            build_s = build(tmp, df, embeddings, chunk_size, overlap)
+            store = VectorStore.load(tmp, embeddings)
+            size = sum(path.stat().st_size for path in pathlib.Path(tmp).rglob("*") if path.is_file())
+
+            ranks = []
+            for (target, _), vector in zip(queries, query_vectors):
+                found = search(store, vector, 10)
+                ranks.append(found.index(target) + 1 if target in found else None)
+            result = {
+                "events": n_events,
+                "chunk_size": chunk_size,
+                "vectors": store.index.ntotal,
+                "store_mb": round(size / 1e6, 1),
+                "build_s": round(build_s, 2),
+                "recall_at_1": round(sum(r == 1 for r in ranks) / len(ranks), 3),
+                "recall_at_5": round(sum(r is not None and r <= 5 for r in ranks) / len(ranks), 3),
+                "mrr_at_10": round(sum(1 / r for r in ranks if r) / len(ranks), 3),
+            }
+            result.update({
+                f"search_{key}": value for key, value in
+                timed(lambda vector: search(store, vector, 3), [(vector,) for vector in query_vectors]).items()
+            })
+        print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+        results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark of the chunked indexing against one vector per event.")
+    p.add_argument("--events", type=int, default=5_000)
+    p.add_argument("--words", type=int, default=400, help="Words of the long description of each event.")
+    p.add_argument("--chunk-size", type=int, nargs="+", default=[500, 1000, 2000])
+    p.add_argument("--overlap", type=int, default=config.CHUNK_OVERLAP)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--query-words", type=int, default=8)
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.events, args.words, args.chunk_size, args.overlap, args.queries, args.query_words, args.dim)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput benchmark of the HTML cleaning stage of rag_poc.html_text.
+
+Generates N long descriptions with markup (paragraphs, links, lists, entities),
+then cleans them with BeautifulSoup as `Event` did, with `html_to_text` in the
+calling process, and with `clean_texts` in process pools of --workers workers
+by chunks of --chunk texts. Reports texts, chunks and megabytes per second; the
+pool timings include the dispatch of every chunk, not the start of the pool.
+
+Usage:
+    python -m benchmarks.bench_cleaning --texts 20000
+    python -m benchmarks.bench_cleaning --texts 20000 --workers 1 2 4 --chunk 16 64 256 --json cleaning.json
+"""
+import argparse
+import json
+import time
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import html_descriptions
+from rag_poc import config
+from rag_poc.html_text import clean_html, clean_texts, cleaning_pool
+
+def measure(name, clean, texts, chunk_size=None) -> dict:
+    start = time.perf_counter()
+    cleaned = clean(texts)
+    seconds = time.perf_counter() - start
+    result = {"method": name, "texts": len(texts), "chunk": chunk_size, "texts_per_s": round(len(texts) / seconds)}
+    if chunk_size:
+        result["chunks_per_s"] = round(len(texts) / chunk_size / seconds, 1)
+    result["mb_per_s"] = round(sum(len(v.encode()) for v in texts) / 1e6 / seconds, 2)
+    print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+    return result, cleaned
+
+def run(n_texts, words, workers, chunk_sizes) -> list:
+    texts = html_descriptions(n_texts, words)
+    results = []
+
+    result, expected = measure(
+        "beautifulsoup", lambda texts: [BeautifulSoup(v, "html.parser").get_text(separator=" ").strip() for v in texts], texts
+    )
+    results.append(result)
+    result, cleaned = measure("html_to_text", lambda texts: [clean_html(v) for v in texts], texts)
+    assert cleaned == expected
+    results.append(result)
+
+    for n_workers in workers:
+        with cleaning_pool(n_workers) as pool:
+            clean_texts(texts[:n_workers], executor=pool, chunk_size=1)  # starts the processes
+            for chunk_size in chunk_sizes:
+                result, cleaned = measure(
+                    f"clean_texts_{n_workers}_workers", lambda texts: clean_texts(texts, pool, chunk_size), texts, chunk_size
+                )
+                assert cleaned == expected
+                results.append({**result, "workers": n_workers})
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Throughput benchmark of the HTML cleaning stage.")
+    p.add_argument("--texts", type=int, default=20_000)
+    p.add_argument("--words", type=int, default=200)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--chunk", type=int, nargs="+", default=[config.CLEAN_CHUNK_SIZE])
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.texts, args.words, args.workers, args.chunk)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Cold start benchmark of the vector store.
+
+For each corpus size, builds a synthetic store, then opens it in a fresh Python
+process and reports the time to open it, the time of the first query, and the
+resident memory added by the store. The LangChain `FAISS.load_local` layout
+(pickled docstore, index read in RAM) can be measured for comparison.
+
+Usage:
+    python -m benchmarks.bench_cold_start --sizes 10000 100000 --dim 1024
+    python -m benchmarks.bench_cold_start --types flat ivf-flat --legacy --json cold.json
+"""
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+from langchain.schema import Document
+import numpy as np
+
+from benchmarks.synthetic import clustered_vectors
+from rag_poc import config, faiss_index
+from rag_poc.vector_store import documents_table, faiss_id, save_store
+
+TEXT = "Concert de musique bretonne au festival, entrée libre. " * 10
+
+# Run in the child process: prints the timings and RSS of opening the store at argv[1]
+PROBE = """
+import sys, time, json
+import numpy as np
+# Fixed import costs, paid by any process (pyarrow imports pandas on first use), are left out
+import faiss, pandas
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS")) / 1024
+
+folder, layout, dim = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if layout == "legacy":
+    from langchain_community.vectorstores import FAISS
+else:
+    from rag_poc.vector_store import VectorStore
+query = np.random.default_rng(2).standard_normal(dim).astype("float32")
+
+before = rss_mb()
+start = time.perf_counter()
+if layout == "legacy":
+    store = FAISS.load_local(folder, None, allow_dangerous_deserialization=True)
+else:
+    store = VectorStore.load(folder)
+open_s = time.perf_counter() - start
+
+start = time.perf_counter()
+docs = store.similarity_search_with_score_by_vector(query, k=5)
+query_s = time.perf_counter() - start
+print(json.dumps({"open_ms": 1000 * open_s, "first_query_ms": 1000 * query_s, "rss_mb": rss_mb() - before}))
+"""
+
+def build_stores(folder: pathlib.Path, size: int, dim: int, index_type: str, legacy: bool) -> dict:
+    vectors = clustered_vectors(size, dim)
+    doc_ids = [f"event{i}" for i in range(size)]
+    documents = {
+        doc_id: Document(page_content=f"{doc_id} {TEXT}", metadata={"content_hash": doc_id, "canonicalurl": f"https://example.com/{doc_id}"})
+        for doc_id in doc_ids
+    }
+    int_ids = np.array([faiss_id(doc_id) for doc_id in doc_ids], dtype=np.int64)
+
+    stores = {}
+    index, params = faiss_index.create_index(index_type, vectors)
+    index.add_with_ids(vectors, int_ids)
+    save_store(folder / "store", index, documents_table(documents), params, "synthetic")
+    stores["store"] = folder / "store"
+
+    if legacy:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        import faiss
+
+        flat = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        flat.add_with_ids(vectors, int_ids)
+        FAISS(
+            embedding_function=None, index=flat, docstore=InMemoryDocstore(documents),
+            index_to_docstore_id=dict(zip(int_ids.tolist(), doc_ids)),
+        ).save_local(folder / "legacy")
+        stores["legacy"] = folder / "legacy"
+    return stores
+
+def probe(folder: pathlib.Path, layout: str, dim: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, str(folder), layout, str(dim)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return {key: round(value, 2) for key, value in json.loads(output.splitlines()[-1]).items()}
+
+def run(sizes, dim, types, legacy) -> list:
+    results = []
+    for size in sizes:
+        for index_type in types:
+            with tempfile.TemporaryDirectory() as tmp:
+                stores = build_stores(pathlib.Path(tmp), size, dim, index_type, legacy and index_type == types[0])
+                for layout, folder in stores.items():
+                    result = {"layout": layout, "index_type": index_type if layout == "store" else "flat",
+                              "n_vectors": size, "dim": dim, **probe(folder, layout, dim)}
+                    print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                    results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark the cold start of the vector store.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000])
+    p.add_argument("--dim", type=int, default=256, help="Vector dimension (mistral-embed: 1024).")
+    p.add_argument("--types", nargs="+", default=["flat", "ivf-flat"], choices=config.INDEX_TYPES)
+    p.add_argument("--legacy", action="store_true", help="Also measure the LangChain FAISS.load_local layout.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.sizes, args.dim, args.types, args.legacy)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory / latency / recall benchmark of the compressed vectors (rag_poc.faiss_index).
+
+For a corpus of N clustered vectors, and each combination of a PCA dimension
+(0: none) and a quantization ("none", "fp16", "int8"), builds the index
+(`create_index(index_type, pca_dim=, quantize=)`) and reports the build time,
+the index size per million vectors, the p50 / p99 single-query latency and the
+recall@k against the exact float32 search, with its loss against the
+uncompressed index of the same type.
+
+The recall of a PCA depends on how the variance of the vectors spreads over
+their dimensions: --decay gives the synthetic vectors a decaying spectrum, like
+text embeddings; with --decay 0 the variance is spread evenly, the worst case.
+
+Usage:
+    python -m benchmarks.bench_compression --size 100000 --dim 1024
+    python -m benchmarks.bench_compression --index-type hnsw --pca-dims 0 256 --quantize none int8 --json compression.json
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann_index import recall_at_k
+from benchmarks.synthetic import clustered_vectors, perturbed_queries
+from rag_poc import config, faiss_index
+
+def bench_compression(index_type, vectors, queries, truth, k, pca_dim=None, quantize=None) -> dict:
+    start = time.perf_counter()
+    index, params = faiss_index.create_index(index_type, vectors, pca_dim=pca_dim, quantize=quantize)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+
+    return {
+        "index_type": params["index_type"],
+        "pca_dim": params.get("pca_dim"),
+        "quantize": params.get("quantize"),
+        "build_s": round(build_s, 3),
+        "mb_per_million": round(faiss_index.index_bytes(index) / len(vectors) * 1e6 / 1024 ** 2, 1),
+        f"recall@{k}": round(recall_at_k(np.array(found), truth), 4),
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(1000 * float(np.percentile(latencies, 99)), 3),
+    }
+
+def run(size, dim, index_type, pca_dims, quantizers, k, n_queries, decay) -> list:
+    vectors = clustered_vectors(size, dim, decay=decay)
+    queries = perturbed_queries(vectors, n_queries)
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+    del flat
+
+    results = []
+    for pca_dim in pca_dims:
+        for quantize in quantizers:
+            result = bench_compression(
+                index_type, vectors, queries, truth, k,
+                pca_dim=pca_dim or None, quantize=None if quantize == "none" else quantize
+            )
+            baseline = results[0][f"recall@{k}"] if results else result[f"recall@{k}"]
+            result["recall_loss"] = round(baseline - result[f"recall@{k}"], 4)
+            print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+            results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark the PCA and scalar quantization of the vectors.")
+    p.add_argument("--size", type=int, default=100_000)
+    p.add_argument("--dim", type=int, default=1024, help="Vector dimension (mistral-embed: 1024).")
+    p.add_argument("--index-type", default="flat", choices=("flat", "ivf-flat", "hnsw"))
+    p.add_argument("--pca-dims", type=int, nargs="+", default=[0, 512, 256, 128], help="PCA dimensions, 0 for none (first: the baseline).")
+    p.add_argument("--quantize", nargs="+", default=["none", *config.VECTOR_QUANTIZE_TYPES], choices=["none", *config.VECTOR_QUANTIZE_TYPES])
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--decay", type=float, default=0.5, help="Spectrum decay of the synthetic vectors (0: even).")
+    p.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    faiss.omp_set_num_threads(args.threads)
+    results = run(args.size, args.dim, args.index_type, args.pca_dims, args.quantize, args.k, args.queries, args.decay)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark of the raw events store: a single Parquet file against the dataset
+partitioned by region and month (rag_poc.dataset).
+
+Builds a synthetic corpus of N events over the 13 regions and a year of
+`firstdate_begin` (benchmarks.synthetic), written:
+    file    : one Parquet file, as `fetch_data` wrote it (`DataFrame.write_parquet`)
+    dataset : `dataset.write_region` of each region
+
+Then times the reads of the index (best of --repeat), for each scan:
+    full         : every event and column
+    index        : every event, the embedded, id and metadata columns read by `build_index`
+    month        : one month of events, the index columns
+    region       : one region, the index columns
+    region_month : one month of one region, the index columns
+read from:
+    file_read : `pl.read_parquet` of the whole file, then filtered (the former `read_source`)
+    file_scan : `dataset.scan_events` of the file, filters and projection pushed down
+    dataset   : `dataset.scan_events` of the dataset
+
+The bytes read are those of the column chunks a scan cannot skip: in the files
+of the partitions kept, of the columns read, in the row groups whose
+`firstdate_begin` statistics overlap the window (the compressed sizes of the
+Parquet metadata; a cold read also reads the footers).
+
+Usage:
+    python -m benchmarks.bench_dataset --events 200000
+    python -m benchmarks.bench_dataset --events 50000 --repeat 5 --json dataset.json
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import pathlib
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import unquote
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from benchmarks.synthetic import REGIONS, event_frame
+from rag_poc import config, dataset
+
+INDEX_COLUMNS = list(dict.fromkeys([*config.COLUMN_EMBEDDING, config.ID_COLUMN, *config.METADATA_COLUMNS]))
+MONTH = (datetime(2025, 6, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc))
+
+# name -> (regions, start, end, columns)
+SCANS = {
+    "full": (None, None, None, None),
+    "index": (None, None, None, INDEX_COLUMNS),
+    "month": (None, *MONTH, INDEX_COLUMNS),
+    "region": (["Bretagne"], None, None, INDEX_COLUMNS),
+    "region_month": (["Bretagne"], *MONTH, INDEX_COLUMNS),
+}
+
+def corpus(n: int, words: int) -> pl.DataFrame:
+    """ `n` synthetic events, spread over the REGIONS, with the other dates of the export. """
+    regions = np.random.default_rng(0).integers(0, len(REGIONS), n)
+    return event_frame(n, words).with_columns(
+        pl.Series("location_region", [REGIONS[r] for r in regions]),
+        firstdate_end=pl.col("firstdate_begin") + pl.duration(hours=2),
+        lastdate_begin=pl.col("lastdate_end") - pl.duration(hours=2),
+    )
+
+def read_file(path: pathlib.Path, regions, start, end, columns) -> pl.DataFrame:
+    """ The former read of the index: the whole file, then filtered in memory. """
+    df = pl.read_parquet(path)
+    if regions is not None:
+        df = df.filter(pl.col("location_region").is_in(regions))
+    if start is not None:
+        df = df.filter(pl.col("firstdate_begin").is_between(start, end, closed="left"))
+    return df.select([column for column in columns if column in df.columns]) if columns else df
+
+def bytes_read(files: Sequence[pathlib.Path], start: Optional[datetime], end: Optional[datetime], columns) -> int:
+    """ Compressed size of the column chunks of `files` that a scan of the window and `columns` reads. """
+    total = 0
+    for file in files:
+        metadata = pq.ParquetFile(file).metadata
+        paths = [metadata.schema.column(i).path.split(".")[0] for i in range(metadata.num_columns)]
+        read = {i for i, name in enumerate(paths) if columns is None or name in columns or (start and name == "firstdate_begin")}
+        date = paths.index("firstdate_begin")
+        for g in range(metadata.num_row_groups):
+            row_group = metadata.row_group(g)
+            statistics = row_group.column(date).statistics
+            if start is not None and statistics is not None and statistics.has_min_max \
+                    and (statistics.max < start or statistics.min >= end):
+                continue
+            total += sum(row_group.column(i).total_compressed_size for i in read)
+    return total
+
+def dataset_files(folder: pathlib.Path, regions, start, end) -> List[pathlib.Path]:
+    """ The files of the partitions of `folder` kept by the region and month filters. """
+    files = []
+    for file in sorted(folder.glob("*/*/*.parquet")):
+        region = unquote(file.parent.parent.name.split("=", 1)[1])
+        month = file.parent.name.split("=", 1)[1]
+        if regions is not None and region not in regions:
+            continue
+        if start is not None and not f"{start:%Y-%m}" <= month < f"{end:%Y-%m}":
+            continue
+        files.append(file)
+    return files
+
+def best_ms(read, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        times.append(1000 * (time.perf_counter() - start))
+    return round(min(times), 2)
+
+def run(n: int, words: int, repeat: int) -> Dict[str, dict]:
+    df = corpus(n, words)
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        file, folder = pathlib.Path(tmp) / "events.parquet", pathlib.Path(tmp) / "events"
+
+        start = time.perf_counter()
+        df.write_parquet(file)
+        write_file_ms = 1000 * (time.perf_counter() - start)
+        start = time.perf_counter()
+        for region in REGIONS:
+            dataset.write_region(df.lazy(), folder, region)
+        write_dataset_ms = 1000 * (time.perf_counter() - start)
+
+        files = sorted(folder.glob("*/*/*.parquet"))
+        print(
+            f"events={n} | file_mb={file.stat().st_size / 2**20:.1f} | dataset_mb={sum(f.stat().st_size for f in files) / 2**20:.1f}"
+            f" | dataset_files={len(files)} | write_file_ms={write_file_ms:.0f} | write_dataset_ms={write_dataset_ms:.0f}",
+            flush=True,
+        )
+
+        for name, (regions, begin, end, columns) in SCANS.items():
+            rows = dataset.scan_events(folder, begin, end, regions, columns).collect().height
+            results[name] = {
+                "rows": rows,
+                "file_read_ms": best_ms(lambda: read_file(file, regions, begin, end, columns), repeat),
+                "file_scan_ms": best_ms(lambda: dataset.scan_events(file, begin, end, regions, columns).collect(), repeat),
+                "dataset_ms": best_ms(lambda: dataset.scan_events(folder, begin, end, regions, columns).collect(), repeat),
+                "file_read_mb": round(bytes_read([file], None, None, None) / 2**20, 2),
+                "file_scan_mb": round(bytes_read([file], begin, end, columns) / 2**20, 2),
+                "dataset_mb": round(bytes_read(dataset_files(folder, regions, begin, end), begin, end, columns) / 2**20, 2),
+            }
+            print(f"{name:<12} | " + " | ".join(f"{key}={value}" for key, value in results[name].items()), flush=True)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Scan time and bytes read of a single Parquet file against the partitioned dataset.")
+    p.add_argument("--events", type=int, default=100_000)
+    p.add_argument("--words", type=int, default=60, help="Words of the synthetic texts.")
+    p.add_argument("--repeat", type=int, default=3, help="Reads per scan, the best is kept.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.events, args.words, args.repeat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
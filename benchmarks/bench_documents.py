@@ -0,0 +1,110 @@
+"""
+Throughput and memory benchmark of the document construction of scripts.indexing.
+
+Writes a synthetic OpenAgenda-like Parquet file of N events, then, each in a
+fresh process, reads it and turns it into the documents sidecar table and the
+texts to embed:
+    - columnar : `documents_frame` (Polars / Arrow columns), texts read by `iter_texts` chunks
+    - legacy   : one dict and one Document per row (`df.to_dicts()`), then `documents_table`
+and reports the rows per second and the growth of the peak resident memory once
+the frame is loaded. A run killed by the OS (out of memory) is reported as such.
+
+Usage:
+    python -m benchmarks.bench_documents --sizes 10000 100000 1000000
+    python -m benchmarks.bench_documents --sizes 100000 --legacy-max 0 --json documents.json
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import json
+import multiprocessing
+import pathlib
+import resource
+import tempfile
+import time
+
+def legacy_documents(df, columns, ids):
+    """ The documents of `df` as built before the columnar path, for comparison. """
+    from langchain.schema import Document
+    from rag_poc.vector_store import content_hash, documents_table
+
+    documents = []
+    for doc in df.to_dicts():
+        text = "\n\n".join(filter(None, [doc.get(col) or "" for col in columns]))
+        meta = {k: v for k, v in doc.items() if k not in columns}
+        documents.append(Document(page_content=text, metadata=meta))
+    for doc in documents:
+        doc.metadata["content_hash"] = content_hash(doc.page_content)
+    documents_by_id = dict(zip(map(str, ids), documents))
+    texts = [doc.page_content for doc in documents_by_id.values()]
+    return documents_table(documents_by_id), len(texts)
+
+def columnar_documents(df, columns, ids):
+    from scripts.indexing import documents_frame, iter_texts
+
+    table = documents_frame(df, columns, ids)
+    return table, sum(len(texts) for texts in iter_texts(table))
+
+def measure(path: str, method: str) -> dict:
+    """ Run `method` on the Parquet file in this (fresh) process: seconds and peak RSS growth. """
+    import polars as pl
+    from rag_poc import config
+    importlib.import_module("scripts.indexing")  # imported before the clock starts
+
+    build = columnar_documents if method == "columnar" else legacy_documents
+    df = pl.read_parquet(path)
+    ids = df.get_column(config.ID_COLUMN).to_list()
+    df = df.drop(config.ID_COLUMN)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    table, n_texts = build(df, config.COLUMN_EMBEDDING, ids)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert n_texts == len(table) == len(ids)
+    return {"seconds": seconds, "peak_mb": (peak - baseline) / 1024}
+
+def run(sizes, legacy_max) -> list:
+    from benchmarks.synthetic import event_frame
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = pathlib.Path(tmp) / f"events_{size}.parquet"
+            event_frame(size).write_parquet(path)
+            for method in ("columnar", "legacy"):
+                if method == "legacy" and size > legacy_max:
+                    continue
+                result = {"n_rows": size, "method": method}
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        measured = executor.submit(measure, str(path), method).result()
+                except BrokenProcessPool:
+                    # Killed by the OS, most likely out of memory
+                    result["error"] = "killed"
+                else:
+                    result.update({
+                        "seconds": round(measured["seconds"], 3),
+                        "rows_per_s": round(size / measured["seconds"]),
+                        "peak_mb": round(measured["peak_mb"], 1),
+                    })
+                print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Throughput and memory benchmark of the document construction.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--legacy-max", type=int, default=1_000_000, help="Largest size run with the legacy path.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.sizes, args.legacy_max)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Latency benchmark of the filtered search of rag_poc.vector_store.
+
+Builds a synthetic store of N events (dates over a year, ten Breton towns) and,
+for each index type and filter, reports the number of matching events, the time
+to resolve the filter into rows and an ID selector (on first use, then cached),
+and the p50 / p99 latency of the search with the FAISS ID selector. As a baseline, `postfilter_full` is the share of queries
+for which over-fetching 10*k unfiltered results and filtering them in Python
+still finds k matching events.
+
+Usage:
+    python -m benchmarks.bench_filters --sizes 100000
+    python -m benchmarks.bench_filters --sizes 10000 100000 --types flat ivf-flat hnsw --json results.json
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import tempfile
+import time
+
+from langchain.schema import Document
+import numpy as np
+
+from benchmarks.synthetic import TOWN_COORDINATES, clustered_vectors, event_metadata, perturbed_queries
+from rag_poc import config, faiss_index
+from rag_poc.filters import EventFilter
+from rag_poc.vector_store import VectorStore, documents_table, faiss_id, save_store
+
+FILTERS = {
+    "selective: Brest, one weekend": EventFilter(
+        start=datetime(2025, 6, 7, tzinfo=timezone.utc), end=datetime(2025, 6, 9, tzinfo=timezone.utc), cities=("Brest",)
+    ),
+    "geo: 15 km around Rennes": EventFilter(near=TOWN_COORDINATES["Rennes"], radius_km=15),
+    "broad: six months": EventFilter(
+        start=datetime(2025, 1, 1, tzinfo=timezone.utc), end=datetime(2025, 7, 1, tzinfo=timezone.utc)
+    ),
+}
+
+def percentiles(latencies) -> dict:
+    return {
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(1000 * float(np.percentile(latencies, 99)), 3),
+    }
+
+def bench_filter(store: VectorStore, queries: np.ndarray, filters: EventFilter, k: int) -> dict:
+    start = time.perf_counter()
+    rows, _ = store._selections(filters)  # first use: rows and ID selector, then cached
+    select_ms = 1000 * (time.perf_counter() - start)
+    allowed = set(store._ids[rows].tolist())
+
+    latencies, full = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        store.similarity_search_with_score_by_vector(query, k, filters)
+        latencies.append(time.perf_counter() - start)
+
+        _, ids = store.search_vectors(query, 10 * k)
+        full += sum(i in allowed for i in ids[0].tolist()) >= k
+    return {
+        "matching": len(rows),
+        "select_ms": round(select_ms, 3),
+        **percentiles(latencies),
+        "postfilter_full": round(full / len(queries), 3),
+    }
+
+def run(sizes, dim, types, k, n_queries) -> list:
+    results = []
+    for size in sizes:
+        vectors = clustered_vectors(size, dim)
+        queries = perturbed_queries(vectors, n_queries)
+        metadata = event_metadata(size)
+        documents = documents_table({
+            f"event{i}": Document(page_content=f"Évènement {i}", metadata={"content_hash": str(i), **meta})
+            for i, meta in enumerate(metadata)
+        })
+        ids = np.array([faiss_id(f"event{i}") for i in range(size)], dtype=np.int64)
+
+        for index_type in types:
+            index, params = faiss_index.create_index(index_type, vectors)
+            index.add_with_ids(vectors, ids)
+            with tempfile.TemporaryDirectory() as tmp:
+                save_store(tmp, index, documents, params, config.EMBEDDING_MODEL)
+                store = VectorStore.load(tmp)
+                unfiltered = []
+                for query in queries:
+                    start = time.perf_counter()
+                    store.similarity_search_with_score_by_vector(query, k)
+                    unfiltered.append(time.perf_counter() - start)
+                base = {"n_documents": size, "index_type": params["index_type"]}
+                result = {**base, "filter": "none", "matching": size, **percentiles(unfiltered)}
+                print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                results.append(result)
+
+                for name, filters in FILTERS.items():
+                    result = {**base, "filter": name, **bench_filter(store, queries, filters, k)}
+                    print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                    results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Latency benchmark of the filtered search.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--types", nargs="+", choices=config.INDEX_TYPES, default=["flat", "ivf-flat", "hnsw"])
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.sizes, args.dim, args.types, args.k, args.queries)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Latency benchmark of the hybrid (dense + BM25) search of rag_poc.vector_store.
+
+Builds a synthetic store of N events (Zipf-distributed texts, a town and
+keywords per event) with its lexical index, then reports the lexical index
+build time and size, and the p50 / p99 latency of the BM25, dense and fused
+searches (the query embeddings are computed beforehand).
+
+Usage:
+    python -m benchmarks.bench_hybrid --sizes 10000 100000
+    python -m benchmarks.bench_hybrid --sizes 100000 --candidates 20 50 100 --json results.json
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+import time
+
+from langchain.schema import Document
+import numpy as np
+
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.synthetic import event_records
+from rag_poc import config, faiss_index
+from rag_poc.lexical import LEXICAL_FOLDER
+from rag_poc.vector_store import VectorStore, documents_table, faiss_id, save_store
+
+def folder_mb(folder: pathlib.Path) -> float:
+    return sum(f.stat().st_size for f in folder.rglob("*") if f.is_file()) / 1024 ** 2
+
+def timed(function, queries) -> dict:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        function(*query)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(1000 * float(np.percentile(latencies, 99)), 3),
+    }
+
+def run(sizes, dim, k, n_queries, candidates) -> list:
+    results = []
+    embeddings = HashEmbeddings(dim)
+    for size in sizes:
+        records = event_records(size)
+        documents = {
+            f"event{i}": Document(page_content=text, metadata={"content_hash": str(i), "location_city": town, "keywords_fr": keywords})
+            for i, (text, town, keywords) in enumerate(records)
+        }
+        vectors = np.array(embeddings.embed_documents([text for text, _, _ in records]), dtype=np.float32)
+        index, params = faiss_index.create_index("flat", vectors)
+        index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in documents], dtype=np.int64))
+        table = documents_table(documents)
+
+        rng = np.random.default_rng(1)
+        texts = [" ".join(records[i][0].split()[:3] + [records[i][1]]) for i in rng.integers(0, size, n_queries)]
+        query_vectors = embeddings.embed_documents(texts)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            manifest = save_store(tmp, index, table, params, config.EMBEDDING_MODEL, lexical_fields=config.LEXICAL_FIELDS)
+            save_s = time.perf_counter() - start
+            store = VectorStore.load(tmp, embeddings)
+            lexical_mb = folder_mb(pathlib.Path(tmp) / manifest["path"] / LEXICAL_FOLDER)
+            queries = list(zip(texts, query_vectors))
+
+            for n_candidates in candidates:
+                result = {
+                    "n_documents": size,
+                    "candidates": n_candidates,
+                    "terms": manifest["lexical"]["terms"],
+                    "save_s": round(save_s, 2),
+                    "lexical_mb": round(lexical_mb, 1),
+                }
+                for name, function in (
+                    ("bm25", lambda text, vector: store.lexical.search(text, n_candidates)),
+                    ("dense", lambda text, vector: store.similarity_search_with_score_by_vector(vector, k)),
+                    ("hybrid", lambda text, vector: store.hybrid_search_with_score(text, k, vector=vector, candidates=n_candidates)),
+                ):
+                    result.update({f"{name}_{key}": value for key, value in timed(function, queries).items()})
+                print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Latency benchmark of the hybrid search.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--candidates", type=int, nargs="+", default=[config.HYBRID_CANDIDATES])
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.sizes, args.dim, args.k, args.queries, args.candidates)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
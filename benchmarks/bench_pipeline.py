@@ -0,0 +1,222 @@
+"""
+End-to-end benchmark of the pipeline: fetch, index and chat queries, offline.
+
+Generates N raw OpenAgenda records (benchmarks.synthetic), serves them from a
+local stand-in of the export endpoint and replaces the Mistral clients by the
+local fakes (benchmarks.fakes), in a temporary data folder. Then times:
+    fetch : `fetching.fetch_data` (or `fetch_data_paginated` with --paginated),
+            split in request / validate / write
+    index : `indexing.build_index` of the fetched dataset, split in read / documents /
+            embed / create_index / add / save, the embedding requests limited to
+            --rate per second (the API limit, `EMBED_REQUESTS_PER_SECOND`, would
+            hide the time of the code)
+    chat  : the recommendations of `generate_recommendation` (scripts/chat.py),
+            through `retrieval.stream_recommendation`: the store load, then per
+            question embed / search / ttft / generate / total (p50 and p95)
+
+A stage time is the sum of its calls: with concurrent calls (--paginated), it
+can exceed the wall time of the step, reported as total_ms.
+
+The results are a flat dict "step.stage_ms" -> ms. With --baseline, they are
+compared to the JSON of a previous run: a stage slower by more than --tolerance
+(relative) and --min-ms (absolute) is reported as a regression, and the command
+exits with status 1.
+
+Usage:
+    python -m benchmarks.bench_pipeline --events 20000 --json pipeline.json
+    python -m benchmarks.bench_pipeline --events 20000 --baseline pipeline.json --tolerance 0.2
+    python -m benchmarks.bench_pipeline --events 5000 --paginated --api-latency 0.05 --llm-latency 0.3
+"""
+import argparse
+from contextlib import contextmanager
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import polars as pl
+
+from benchmarks.fakes import HashEmbeddings, OpenAgendaServer, SlowChatModel
+from benchmarks.synthetic import openagenda_records
+from rag_poc import config, dataset, faiss_index, retrieval, validation
+import scripts.fetching as fetching
+import scripts.indexing as indexing
+
+QUESTIONS = [
+    "concert de jazz ce week-end", "exposition de peinture à Rennes", "activités pour enfants",
+    "festival de musique bretonne", "marché de noël", "théâtre en plein air", "randonnée guidée",
+]
+
+# (object, attribute, stage) of the calls timed in each step
+FETCH_STAGES = [
+    (fetching, "get_json_from_api", "request"),
+    (validation, "validate_batch", "validate"),
+    (dataset, "write_region", "write"),
+]
+INDEX_STAGES = [
+    (indexing, "read_source", "read"),
+    (indexing, "documents_frame", "documents"),
+    (indexing, "embed_documents", "embed"),
+    (faiss_index, "create_index", "create_index"),
+    (indexing, "add_documents_with_ids", "add"),
+    (indexing, "save_store", "save"),
+]
+
+@contextmanager
+def timed_calls(stages: List[Tuple[object, str, str]], times: Dict[str, float]) -> Iterator[None]:
+    """ Add to `times[stage]` the milliseconds spent in each call of the `stages` attributes. """
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in stages]
+
+    def timed(function, stage):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[stage] = times.get(stage, 0.0) + 1000 * (time.perf_counter() - start)
+        return wrapper
+
+    for (owner, name, function), (_, _, stage) in zip(originals, stages):
+        setattr(owner, name, timed(function, stage))
+    try:
+        yield
+    finally:
+        for owner, name, function in originals:
+            setattr(owner, name, function)
+
+def step(name: str, stages: List[Tuple[object, str, str]], run) -> Dict[str, float]:
+    """ Run `run()`, return its total and `stages` milliseconds, keyed "name.stage_ms". """
+    times: Dict[str, float] = {}
+    with timed_calls(stages, times):
+        start = time.perf_counter()
+        run()
+        times["total"] = 1000 * (time.perf_counter() - start)
+    return {f"{name}.{stage}_ms": round(ms, 2) for stage, ms in times.items()}
+
+def use_folder(folder: pathlib.Path) -> None:
+    """ Point the data folders of `config` to `folder`. """
+    config.DATA = folder
+    config.RAW = folder / "raw"
+    config.EVENTS_DATASET = folder / "raw" / "events"
+    config.VECTORS_FOLDER = folder / "vectors"
+    config.ERROR_FILE = folder / "error"
+    config.EMBEDDING_CACHE_FOLDER = folder / "embedding_cache"
+    config.QUERY_EMBEDDING_CACHE_FOLDER = folder / "query_embedding_cache"
+    config.ANSWER_CACHE_FILE = folder / "answer_cache.sqlite"
+
+def chat(n_questions: int, k: int) -> Dict[str, float]:
+    """ Timings of the first load of the store and of `n_questions` streamed recommendations. """
+    start = time.perf_counter()
+    retrieval.get_vector_store()
+    results = {"chat.load_ms": round(1000 * (time.perf_counter() - start), 2)}
+
+    timings: Dict[str, List[float]] = {}
+    for i in range(n_questions):
+        start = time.perf_counter()
+        recommendation = retrieval.stream_recommendation(QUESTIONS[i % len(QUESTIONS)], k=k)
+        for _ in recommendation:
+            pass
+        recommendation.timings["total_ms"] = 1000 * (time.perf_counter() - start)
+        for stage, ms in recommendation.timings.items():
+            timings.setdefault(stage, []).append(ms)
+
+    for stage, values in timings.items():
+        for p in (50, 95):
+            results[f"chat.{stage[:-3]}_p{p}_ms"] = round(float(np.percentile(values, p)), 2)
+    return results
+
+def run(args) -> Dict[str, float]:
+    records = openagenda_records(args.events, invalid=0.0, words=args.words)
+    embeddings = HashEmbeddings(args.dim, latency=args.embed_latency)
+    chat_model = SlowChatModel(first_token_latency=args.llm_latency, token_latency=args.token_latency)
+    retrieval.clear_caches()
+    indexing.get_embeddings = lambda: embeddings
+    retrieval.get_embeddings = lambda: embeddings
+    retrieval.get_chat_model = lambda temperature: chat_model
+
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp, OpenAgendaServer(records, args.api_latency) as server:
+        folder = pathlib.Path(tmp)
+        use_folder(folder)
+        config.BASE_URL = server.base_url
+        source = config.EVENTS_DATASET
+
+        if args.paginated:
+            fetch = lambda: fetching.fetch_data_paginated(
+                config.REGION, args.events, 1, config.UNTIL, source, url=server.url, clean_workers=args.clean_workers
+            )
+        else:
+            fetch = lambda: fetching.fetch_data(
+                config.REGION, args.events, 1, config.UNTIL, source, clean_workers=args.clean_workers
+            )
+        results.update(step("fetch", FETCH_STAGES, fetch))
+        results["fetch.events"] = dataset.scan_events(source).select(pl.len()).collect().item()
+        results["fetch.requests"] = server.requests
+
+        results.update(step("index", INDEX_STAGES, lambda: indexing.build_index(
+            source=source, destination=config.VECTORS_FOLDER, columns=config.COLUMN_EMBEDDING, id_column="uid",
+            index_type=args.index_type, chunk_size=args.chunk_size, rate=args.rate,
+        )))
+        results.update(chat(args.questions, args.k))
+    return results
+
+def compare(baseline: Dict[str, float], results: Dict[str, float], tolerance: float, min_ms: float) -> List[str]:
+    """ The lines of the timings of `results` slower than in `baseline` by more than `tolerance` and `min_ms`. """
+    regressions = []
+    for key, ms in results.items():
+        before = baseline.get(key)
+        if not key.endswith("_ms") or before is None:
+            continue
+        if ms > before * (1 + tolerance) and ms - before > min_ms:
+            regressions.append(f"{key}: {before:.1f} -> {ms:.1f} ms ({100 * (ms / before - 1):+.0f}%)")
+    return regressions
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="End-to-end benchmark of the pipeline with offline stand-ins.")
+    p.add_argument("--events", type=int, default=5000)
+    p.add_argument("--words", type=int, default=60, help="Words of the synthetic texts.")
+    p.add_argument("--paginated", action="store_true", help="Time fetch_data_paginated instead of fetch_data.")
+    p.add_argument("--clean-workers", type=int, default=1, help="Processes cleaning the HTML of the fetch.")
+    p.add_argument("--index-type", type=str, default="flat", choices=faiss_index.INDEX_TYPES)
+    p.add_argument("--chunk-size", type=int, default=None)
+    p.add_argument("--rate", type=float, default=1000.0, help="Embedding requests per second.")
+    p.add_argument("--dim", type=int, default=256, help="Vector dimension (mistral-embed: 1024).")
+    p.add_argument("--questions", type=int, default=50)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--api-latency", type=float, default=0.0, help="Seconds per request of the export endpoint.")
+    p.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per call of the embeddings.")
+    p.add_argument("--llm-latency", type=float, default=0.0, help="Seconds to the first token of the LLM.")
+    p.add_argument("--token-latency", type=float, default=0.0, help="Seconds per token of the LLM.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    p.add_argument("--baseline", type=str, default=None, help="JSON of a previous run to compare with.")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    p.add_argument("--min-ms", type=float, default=5.0, help="Absolute slowdown below which nothing is reported.")
+    args = p.parse_args(argv)
+
+    results = run(args)
+    for name in ("fetch", "index", "chat"):
+        print(" | ".join(f"{key}={value}" for key, value in results.items() if key.startswith(name + ".")), flush=True)
+
+    if args.json:
+        options = {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "tolerance", "min_ms")}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "python": platform.python_version(), "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("options", {}).get("events") != args.events:
+            print(f"The baseline has {baseline.get('options', {}).get('events')} events, not {args.events}.", flush=True)
+        regressions = compare(baseline["results"], results, args.tolerance, args.min_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", flush=True)
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline}.", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Latency benchmark of the reranking stage of rag_poc.rerank.
+
+Builds a synthetic store of N events (Zipf-distributed texts, a town and
+keywords per event), then for each number of over-fetched candidates reports
+the p50 / p99 latency of the first stage (hybrid search), of the lookup of the
+candidate vectors in the --index index, and of each reranker, alone and batched.
+The query embeddings are computed beforehand. The cross-encoder is included
+with --cross-encoder, it needs sentence-transformers and the model files.
+
+Usage:
+    python -m benchmarks.bench_rerank --sizes 100000 --candidates 20 50 100
+    python -m benchmarks.bench_rerank --index hnsw --cross-encoder --json results.json
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from langchain.schema import Document
+import numpy as np
+
+from benchmarks.bench_hybrid import timed
+from benchmarks.fakes import HashEmbeddings
+from benchmarks.synthetic import event_records
+from rag_poc import config, faiss_index
+from rag_poc.rerank import CrossEncoderReranker, LexicalReranker, MMRReranker
+from rag_poc.vector_store import VectorStore, documents_table, faiss_id, save_store
+
+def run(sizes, dim, k, n_queries, candidates, index_type, cross_encoder) -> list:
+    results = []
+    embeddings = HashEmbeddings(dim)
+    rerankers = {"lexical": LexicalReranker(), "mmr": MMRReranker()}
+    if cross_encoder:
+        rerankers["cross_encoder"] = CrossEncoderReranker(budget_ms=None)
+
+    for size in sizes:
+        records = event_records(size)
+        documents = {
+            f"event{i}": Document(page_content=text, metadata={"content_hash": str(i), "location_city": town, "keywords_fr": keywords})
+            for i, (text, town, keywords) in enumerate(records)
+        }
+        vectors = np.array(embeddings.embed_documents([text for text, _, _ in records]), dtype=np.float32)
+        index, params = faiss_index.create_index(index_type, vectors)
+        index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in documents], dtype=np.int64))
+
+        rng = np.random.default_rng(1)
+        texts = [" ".join(records[i][0].split()[:3] + [records[i][1]]) for i in rng.integers(0, size, n_queries)]
+        query_vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_store(tmp, index, documents_table(documents), params, config.EMBEDDING_MODEL, lexical_fields=config.LEXICAL_FIELDS)
+            store = VectorStore.load(tmp, embeddings)
+            store.get_vectors([faiss_id("event0")])  # one-time id lookup table of IVF indexes
+
+            for n_candidates in candidates:
+                first_stage = [
+                    store.hybrid_search_with_score(text, n_candidates, vector=vector)
+                    for text, vector in zip(texts, query_vectors)
+                ]
+                queries = list(zip(texts, query_vectors, first_stage))
+                result = {"n_documents": size, "index_type": params["index_type"], "candidates": n_candidates}
+                result.update({
+                    f"first_stage_{key}": value for key, value in
+                    timed(lambda text, vector, _: store.hybrid_search_with_score(text, n_candidates, vector=vector), queries).items()
+                })
+                result.update({
+                    f"get_vectors_{key}": value for key, value in
+                    timed(lambda text, vector, found: store.get_vectors([faiss_id(doc.id) for doc, _ in found]), queries).items()
+                })
+                for name, reranker in rerankers.items():
+                    result.update({
+                        f"{name}_{key}": value for key, value in
+                        timed(lambda text, vector, found: reranker.rerank(text, vector, found, store, k), queries).items()
+                    })
+                    start = time.perf_counter()
+                    reranker.rerank_many(texts, query_vectors, first_stage, store, k)
+                    result[f"{name}_batched_ms_per_query"] = round(1000 * (time.perf_counter() - start) / len(texts), 3)
+                print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Latency benchmark of the reranking stage.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--queries", type=int, default=300)
+    p.add_argument("--candidates", type=int, nargs="+", default=[config.RERANK_CANDIDATES, 50, 100])
+    p.add_argument("--index", type=str, default="flat", choices=config.INDEX_TYPES)
+    p.add_argument("--cross-encoder", action="store_true", help=f"Also time {config.RERANK_MODEL}.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.sizes, args.dim, args.k, args.queries, args.candidates, args.index, args.cross_encoder)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Load test of the retrieval API (scripts/serve.py).
+
+Starts the API in a child process, on a synthetic store, with local stand-ins of
+the embedding model and of the LLM (benchmarks.fakes), then sends requests from
+N concurrent clients and reports the throughput, the p50 / p95 / p99 latencies
+and, for streamed recommendations, the time to the first token.
+
+Several `--batch-max` values compare the query coalescing (1 = one search per request).
+
+Usage:
+    python -m benchmarks.bench_serve --concurrency 1 16 64 --requests 500
+    python -m benchmarks.bench_serve --concurrency 1 16 128 --batch-max 1 64 --embed-latency 0.02
+    python -m benchmarks.bench_serve --endpoint recommend --stream --llm-latency 0.3
+    python -m benchmarks.bench_serve --url http://127.0.0.1:8000 --endpoint search
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import pathlib
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+from rag_poc import config
+
+QUESTIONS = [
+    "concert de jazz ce week-end", "exposition de peinture à Rennes", "activités pour enfants",
+    "festival de musique bretonne", "marché de noël", "théâtre en plein air", "randonnée guidée",
+]
+
+def serve_fake(folder: str, port: int, options: dict) -> None:
+    """ Child process: build a synthetic store in `folder` and serve it with the stand-in clients. """
+    from langchain.schema import Document
+
+    from benchmarks.fakes import HashEmbeddings, SlowChatModel
+    from benchmarks.synthetic import clustered_vectors
+    from rag_poc import config, faiss_index, retrieval
+    from rag_poc.vector_store import documents_table, faiss_id, save_store
+    from scripts import serve
+
+    size, dim = options["size"], options["dim"]
+    vectors = clustered_vectors(size, dim)
+    documents = {
+        f"event{i}": Document(page_content=f"Évènement {i} : {QUESTIONS[i % len(QUESTIONS)]}", metadata={"content_hash": str(i)})
+        for i in range(size)
+    }
+    index, params = faiss_index.create_index("flat", vectors)
+    index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in documents], dtype=np.int64))
+    save_store(folder, index, documents_table(documents), params, config.EMBEDDING_MODEL, lexical_fields=config.LEXICAL_FIELDS)
+
+    config.VECTORS_FOLDER = pathlib.Path(folder)
+    embeddings = HashEmbeddings(dim, latency=options["embed_latency"])
+    chat_model = SlowChatModel(first_token_latency=options["llm_latency"], token_latency=options["token_latency"])
+    retrieval.get_embeddings = lambda: embeddings
+    retrieval.get_chat_model = lambda temperature: chat_model
+
+    serve.run_server(
+        port=port, workers=options["workers"], max_pending=10_000,
+        batch_wait_ms=options["batch_wait_ms"], batch_max=options["batch_max"],
+    )
+
+async def wait_ready(url: str, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The API at {url} is not ready after {timeout}s.")
+            await asyncio.sleep(0.2)
+
+async def one_request(session: aiohttp.ClientSession, url: str, endpoint: str, stream: bool, i: int) -> tuple:
+    """ Send one request; returns (status, latency, time to first token). """
+    body = {"query": QUESTIONS[i % len(QUESTIONS)], "k": 3, "stream": stream}
+    start = time.perf_counter()
+    first_token = None
+
+    async with session.post(f"{url}/{endpoint}", json=body) as response:
+        if stream and response.status == 200:
+            async for line in response.content:
+                if first_token is None and b'"token"' in line:
+                    first_token = time.perf_counter() - start
+        else:
+            await response.read()
+    return response.status, time.perf_counter() - start, first_token
+
+async def load(url: str, endpoint: str, stream: bool, concurrency: int, n_requests: int) -> dict:
+    counter = iter(range(n_requests))
+    results = []
+
+    async def client(session):
+        for i in counter:
+            results.append(await one_request(session, url, endpoint, stream, i))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if r[0] == 200]
+    latencies = np.array([r[1] for r in ok]) * 1000
+    result = {
+        "endpoint": endpoint + (" (stream)" if stream else ""),
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "req_per_s": round(len(ok) / wall, 1),
+    }
+    # Without a single successful request, only the errors are reported
+    if len(latencies):
+        result["p50_ms"] = round(float(np.percentile(latencies, 50)), 1)
+        result["p95_ms"] = round(float(np.percentile(latencies, 95)), 1)
+        result["p99_ms"] = round(float(np.percentile(latencies, 99)), 1)
+    ttft = [r[2] * 1000 for r in ok if r[2] is not None]
+    if ttft:
+        result["ttft_p50_ms"] = round(float(np.percentile(ttft, 50)), 1)
+        result["ttft_p99_ms"] = round(float(np.percentile(ttft, 99)), 1)
+    return result
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Load test of the retrieval API.")
+    p.add_argument("--url", type=str, default=None, help="Target a running API instead of a local stand-in.")
+    p.add_argument("--endpoint", choices=("search", "recommend"), default="search")
+    p.add_argument("--stream", action="store_true", help="Stream the recommendations.")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128])
+    p.add_argument("--requests", type=int, default=500, help="Requests per concurrency level.")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=4, help="Search threads of the local API.")
+    p.add_argument("--batch-max", type=int, nargs="+", default=[1, config.QUERY_BATCH_MAX], help="Query batch sizes to compare.")
+    p.add_argument("--batch-wait-ms", type=float, default=config.QUERY_BATCH_WAIT_MS)
+    p.add_argument("--embed-latency", type=float, default=0.0, help="Latency of one call to the stand-in embedding model.")
+    p.add_argument("--size", type=int, default=50_000, help="Documents in the synthetic store.")
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--llm-latency", type=float, default=0.2, help="Time to first token of the stand-in LLM.")
+    p.add_argument("--token-latency", type=float, default=0.01, help="Time between tokens of the stand-in LLM.")
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = []
+    for batch_max in ([None] if args.url else args.batch_max):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = None
+            url = args.url
+            if url is None:
+                url = f"http://127.0.0.1:{args.port}"
+                options = {key: getattr(args, key) for key in ("workers", "size", "dim", "llm_latency", "token_latency", "embed_latency", "batch_wait_ms")}
+                server = multiprocessing.Process(target=serve_fake, args=(tmp, args.port, {**options, "batch_max": batch_max}), daemon=True)
+                server.start()
+
+            try:
+                asyncio.run(wait_ready(url))
+                for concurrency in args.concurrency:
+                    result = {"batch_max": batch_max, **asyncio.run(load(url, args.endpoint, args.stream, concurrency, args.requests))}
+                    print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+                    results.append(result)
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.join()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
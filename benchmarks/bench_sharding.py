@@ -0,0 +1,172 @@
+"""
+Memory and latency benchmark of the sharded vector store (rag_poc.sharding).
+
+Builds a synthetic corpus of N events spread over the 13 regions of
+metropolitan France (ten towns each) and, for each shard count S, a store of S
+shards (regions grouped round-robin, S=1 being the unsharded store) built by a
+pool of processes. Each store is then opened in a fresh Python process, which
+reports the time to open it, the resident memory it added once queried, and the
+p50 / p99 latency of the hybrid search:
+    fan_out : over every shard, merged
+    routed  : filtered on a town, so routed to the shard of its region
+
+Usage:
+    python -m benchmarks.bench_sharding --events 200000 --shards 1 4 13
+    python -m benchmarks.bench_sharding --events 50000 --shards 1 13 --workers 1 --json shards.json
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from langchain.schema import Document
+import numpy as np
+
+from benchmarks.synthetic import REGIONS, clustered_vectors, event_metadata, event_records
+from rag_poc import config, faiss_index
+from rag_poc.sharding import save_layout, shard_folder
+from rag_poc.vector_store import documents_table, faiss_id, save_store
+
+# Run in the child process: prints the timings and RSS of the store at argv[1], queried with the queries of argv[2]
+PROBE = """
+import json, os, sys, time
+import numpy as np
+# Fixed import costs, paid by any process (pyarrow imports pandas on first use), are left out
+import faiss, pandas
+from rag_poc.filters import EventFilter
+from rag_poc.sharding import ShardedStore
+from rag_poc.vector_store import VectorStore
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS")) / 1024
+
+folder, queries_file, k = sys.argv[1], sys.argv[2], int(sys.argv[3])
+queries = json.loads(open(queries_file, encoding="utf-8").read())
+vectors = np.load(queries_file + ".npy")
+
+before = rss_mb()
+start = time.perf_counter()
+store = ShardedStore.load(folder) if os.path.exists(os.path.join(folder, "shards.json")) else VectorStore.load(folder)
+open_s = time.perf_counter() - start
+
+def latencies(filtered):
+    times = []
+    for (text, town), vector in zip(queries, vectors):
+        filters = EventFilter(cities=(town,)) if filtered else None
+        start = time.perf_counter()
+        store.hybrid_search_with_score(text, k, vector=vector, filters=filters)
+        times.append(time.perf_counter() - start)
+    return [1000 * float(np.percentile(times, p)) for p in (50, 99)]
+
+fan_out, routed = latencies(False), latencies(True)
+print(json.dumps({
+    "open_ms": 1000 * open_s, "rss_mb": rss_mb() - before,
+    "fan_out_p50_ms": fan_out[0], "fan_out_p99_ms": fan_out[1], "routed_p50_ms": routed[0], "routed_p99_ms": routed[1],
+}))
+"""
+
+def corpus(n: int, dim: int) -> dict:
+    """ Vectors, texts, regions and metadata of `n` synthetic events. """
+    rng = np.random.default_rng(3)
+    regions = rng.integers(0, len(REGIONS), n)
+    towns = rng.integers(0, 10, n)
+    metadata = event_metadata(n)
+    for meta, region, town in zip(metadata, regions, towns):
+        meta["location_city"] = f"Ville {region}-{town}"
+    return {
+        "vectors": clustered_vectors(n, dim),
+        "texts": [text for text, _, _ in event_records(n, words=30)],
+        "regions": regions,
+        "metadata": metadata,
+    }
+
+def build_store(folder: pathlib.Path, vectors: np.ndarray, doc_ids: list, texts: list, metadata: list) -> None:
+    """ A flat store of the events, with its BM25 and metadata indexes. """
+    documents = documents_table({
+        doc_id: Document(page_content=text, metadata={"content_hash": doc_id, **meta})
+        for doc_id, text, meta in zip(doc_ids, texts, metadata)
+    })
+    index, params = faiss_index.create_index("flat", vectors)
+    index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in doc_ids], dtype=np.int64))
+    save_store(folder, index, documents, params, "synthetic", lexical_fields=config.LEXICAL_FIELDS)
+
+def build(folder: pathlib.Path, data: dict, n_shards: int, workers: int) -> None:
+    """ The store of `data` in `folder`: unsharded for a single shard, else regions grouped in `n_shards` shards. """
+    doc_ids = [f"event{i}" for i in range(len(data["texts"]))]
+    if n_shards == 1:
+        build_store(folder, data["vectors"], doc_ids, data["texts"], data["metadata"])
+        return
+
+    groups = data["regions"] % n_shards
+    shards = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for group in range(n_shards):
+            rows = np.flatnonzero(groups == group)
+            name = "+".join(REGIONS[r] for r in range(len(REGIONS)) if r % n_shards == group)
+            shards[name] = shard_folder(name)
+            futures.append(pool.submit(
+                build_store, folder / shards[name], data["vectors"][rows], [doc_ids[i] for i in rows],
+                [data["texts"][i] for i in rows], [data["metadata"][i] for i in rows],
+            ))
+        for future in futures:
+            future.result()
+    save_layout(folder, "region", shards)
+
+def probe(folder: pathlib.Path, queries_file: pathlib.Path, k: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, str(folder), str(queries_file), str(k)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return {key: round(value, 2) for key, value in json.loads(output.splitlines()[-1]).items()}
+
+def run(n_events, dim, shard_counts, workers, k, n_queries) -> list:
+    data = corpus(n_events, dim)
+    rng = np.random.default_rng(4)
+    picks = rng.integers(0, n_events, n_queries)
+    # A query is close to the vector of an event and names four of its words and its town
+    vectors = data["vectors"][picks] + 0.1 * rng.standard_normal((n_queries, dim), dtype=np.float32) / np.sqrt(dim)
+    queries = [(" ".join(data["texts"][i].split()[:4]), data["metadata"][i]["location_city"]) for i in picks]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        queries_file = pathlib.Path(tmp) / "queries.json"
+        queries_file.write_text(json.dumps(queries), encoding="utf-8")
+        np.save(f"{queries_file}.npy", vectors)
+        for n_shards in shard_counts:
+            folder = pathlib.Path(tmp) / f"store-{n_shards}"
+            start = time.perf_counter()
+            build(folder, data, n_shards, workers)
+            build_s = time.perf_counter() - start
+            store_mb = sum(f.stat().st_size for f in folder.rglob("*") if f.is_file()) / 2**20
+            result = {
+                "events": n_events, "shards": n_shards, "build_s": round(build_s, 2), "store_mb": round(store_mb, 1),
+                **probe(folder, queries_file, k),
+            }
+            print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+            results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Memory and latency of the sharded vector store.")
+    p.add_argument("--events", type=int, default=100_000)
+    p.add_argument("--shards", type=int, nargs="+", default=[1, 4, 13], help="Shard counts, 1 is the unsharded store.")
+    p.add_argument("--dim", type=int, default=256, help="Vector dimension (mistral-embed: 1024).")
+    p.add_argument("--workers", type=int, default=config.SHARD_WORKERS, help="Processes building the shards.")
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.events, args.dim, args.shards, args.workers, args.k, args.queries)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
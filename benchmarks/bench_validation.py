@@ -0,0 +1,65 @@
+"""
+Throughput benchmark of the validation of the raw API records, rag_poc.validation.
+
+Generates N raw records shaped like the OpenAgenda export (5% of them from
+another region), then validates them by pages of --page records, one by one
+with `Event.model_validate` (then `model_dump` and a DataFrame, as the fetch
+did) and with `validate_batch`, and reports the records per second. --html is
+the share of long descriptions holding markup.
+
+Usage:
+    python -m benchmarks.bench_validation --records 20000
+    python -m benchmarks.bench_validation --records 20000 --html 0 0.5 1 --json validation.json
+"""
+import argparse
+import json
+import time
+
+import polars as pl
+from pydantic import ValidationError
+
+from benchmarks.synthetic import openagenda_records
+from rag_poc import config, validation
+
+def one_by_one(page: list) -> int:
+    valid = []
+    for record in page:
+        try:
+            valid.append(validation.Event.model_validate(record).model_dump())
+        except ValidationError:
+            pass
+    return len(pl.DataFrame(valid, schema=validation.EVENT_SCHEMA))
+
+def batched(page: list) -> int:
+    return len(validation.validate_batch(page)[0])
+
+def run(n_records, page_size, html_shares) -> list:
+    results = []
+    for html in html_shares:
+        records = openagenda_records(n_records, html)
+        pages = [records[i:i + page_size] for i in range(0, n_records, page_size)]
+        result = {"records": n_records, "page": page_size, "html": html}
+        for name, validate in (("model", one_by_one), ("batch", batched)):
+            start = time.perf_counter()
+            result[f"{name}_valid"] = sum(validate(page) for page in pages)
+            result[f"{name}_records_per_s"] = round(n_records / (time.perf_counter() - start))
+        assert result["model_valid"] == result["batch_valid"]
+        print(" | ".join(f"{key}={value}" for key, value in result.items()), flush=True)
+        results.append(result)
+    return results
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Throughput benchmark of the record validation.")
+    p.add_argument("--records", type=int, default=20_000)
+    p.add_argument("--page", type=int, default=config.FETCH_PAGE_SIZE)
+    p.add_argument("--html", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    p.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    args = p.parse_args(argv)
+
+    results = run(args.records, args.page, args.html)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Local stand-ins of the Mistral clients and of the OpenAgenda export endpoint for
+the benchmarks: no network, no API key, deterministic outputs and configurable
+latencies.
+"""
+import asyncio
+from datetime import datetime
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import numpy as np
+
+ANSWER = (
+    "Je vous recommande le concert de jazz de samedi soir à Rennes, "
+    "ainsi que l'exposition de peinture au musée des Beaux-Arts, ouverte toute la semaine."
+)
+
+class HashEmbeddings(Embeddings):
+    """ Bag-of-words embeddings of `dim` dimensions, with a fixed `latency` per call. """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int.from_bytes(blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class SlowChatModel(BaseChatModel):
+    """
+    Chat model answering `answer` word by word, after `first_token_latency`
+    seconds and then `token_latency` seconds per word, like a remote LLM.
+    """
+    answer: str = ANSWER
+    first_token_latency: float = 0.2
+    token_latency: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _tokens(self) -> List[str]:
+        words = self.answer.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.first_token_latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.token_latency)
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.token_latency)
+
+# Conditions of the `where` clause of the fetch queries understood by `OpenAgendaServer`
+_CONDITIONS = {
+    "region": re.compile(r'location_region="([^"]+)"'),
+    "begin_from": re.compile(r'firstdate_begin >= "([^"]+)"'),
+    "begin_to": re.compile(r'firstdate_begin < "([^"]+)"'),
+    "last_begin_to": re.compile(r'lastdate_begin <= "([^"]+)"'),
+    "updated_after": re.compile(r'updatedat > "([^"]+)"'),
+}
+
+def _naive(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+class OpenAgendaServer:
+    """
+    Local HTTP server answering the export queries of scripts.fetching with
+    `records`: `where` on the region, the `firstdate_begin` window,
+    `lastdate_begin` and `updatedat`, then `offset` and `limit`. Each request
+    waits `latency` seconds. Use it as a context manager; `base_url` replaces
+    `config.BASE_URL`, `url` is the export endpoint.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], latency: float = 0.0):
+        self.records = sorted(records, key=lambda record: record["uid"])
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                selected = server.select(query.get("where", ""))
+                offset = int(query.get("offset", 0))
+                body = json.dumps(selected[offset:offset + int(query.get("limit", len(selected)))]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.url = self.base_url + "/exports/json"
+
+    def select(self, where: str) -> List[Dict[str, Any]]:
+        """ The records matching the `where` clause of a fetch query. """
+        found = {name: pattern.search(where) for name, pattern in _CONDITIONS.items()}
+        value = {name: match.group(1) for name, match in found.items() if match}
+        return [
+            record for record in self.records
+            if ("region" not in value or record["location_region"] == value["region"])
+            and ("begin_from" not in value or _naive(record["firstdate_begin"]) >= _naive(value["begin_from"]))
+            and ("begin_to" not in value or _naive(record["firstdate_begin"]) < _naive(value["begin_to"]))
+            and ("last_begin_to" not in value or _naive(record["lastdate_begin"]) <= _naive(value["last_begin_to"]))
+            and ("updated_after" not in value or record["updatedat"] > value["updated_after"])
+        ]
+
+    def __enter__(self) -> "OpenAgendaServer":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,167 @@
+"""
+Synthetic data for the benchmarks.
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from rag_poc import config
+
+def clustered_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0, decay: float = 0.0) -> np.ndarray:
+    """
+    `n` float32 vectors drawn around `n_clusters` random centers, closer to the
+    structure of text embeddings than uniform noise. With `decay`, the standard
+    deviation of the i-th dimension falls as (i + 1) ** -decay: most of the
+    variance is in a few directions, as in the spectrum of text embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    if decay:
+        vectors *= np.arange(1, dim + 1, dtype=np.float32) ** -decay
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def perturbed_queries(vectors: np.ndarray, n: int, noise: float = 0.1, seed: int = 1) -> np.ndarray:
+    """ `n` queries close to randomly chosen `vectors`. """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n)]
+    queries = queries + noise * rng.standard_normal(queries.shape, dtype=np.float32) / np.sqrt(vectors.shape[1])
+    return queries.astype(np.float32)
+
+TOWNS = ["Rennes", "Brest", "Quimper", "Vannes", "Lorient", "Saint-Malo", "Vitré", "Fougères", "Dinan", "Morlaix"]
+TOWN_COORDINATES = {
+    "Rennes": (48.11, -1.68), "Brest": (48.39, -4.49), "Quimper": (48.00, -4.10), "Vannes": (47.66, -2.76),
+    "Lorient": (47.75, -3.37), "Saint-Malo": (48.65, -2.03), "Vitré": (48.12, -1.21), "Fougères": (48.35, -1.20),
+    "Dinan": (48.45, -2.05), "Morlaix": (48.58, -3.83),
+}
+# The 13 regions of metropolitan France
+REGIONS = [
+    "Auvergne-Rhône-Alpes", "Bourgogne-Franche-Comté", "Bretagne", "Centre-Val de Loire", "Corse",
+    "Grand Est", "Hauts-de-France", "Île-de-France", "Normandie", "Nouvelle-Aquitaine", "Occitanie",
+    "Pays de la Loire", "Provence-Alpes-Côte d'Azur",
+]
+KEYWORDS = ["musique", "théâtre", "exposition", "randonnée", "festival", "enfants", "conférence", "danse", "cinéma", "marché"]
+
+def event_records(n: int, words: int = 60, vocabulary: int = 20_000, seed: int = 0) -> list:
+    """
+    `n` events (text, town, keywords) whose texts draw `words` words from a
+    Zipf-distributed `vocabulary` of synthetic French-looking words.
+    """
+    rng = np.random.default_rng(seed)
+    syllables = np.array(["ra", "te", "mon", "chan", "lu", "vé", "pei", "bre", "ton", "ma", "ri", "sé", "quin", "dor", "fê"])
+    lexicon = ["".join(rng.choice(syllables, rng.integers(2, 5))) + rng.choice(["", "s", "e", "es", "ment"]) for _ in range(vocabulary)]
+    ranks = np.minimum(rng.zipf(1.3, (n, words)), vocabulary) - 1
+    towns = rng.integers(0, len(TOWNS), n)
+    return [
+        (" ".join(lexicon[r] for r in row), TOWNS[town], [KEYWORDS[i] for i in rng.choice(len(KEYWORDS), 2, replace=False)])
+        for row, town in zip(ranks, towns)
+    ]
+
+def event_metadata(n: int, days: int = 365, seed: int = 0) -> list:
+    """
+    Town, dates and coordinates of `n` events: one of the TOWNS, a start within
+    `days` days from 2025-01-01, a duration of up to a week, and a position
+    within ~5 km of the town.
+    """
+    rng = np.random.default_rng(seed)
+    origin = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    towns = [TOWNS[i] for i in rng.integers(0, len(TOWNS), n)]
+    starts = rng.integers(0, days * 24, n)
+    durations = rng.integers(1, 7 * 24, n)
+    jitter = rng.normal(0.0, 0.03, (n, 2))
+    return [
+        {
+            "location_city": town,
+            "location_coordinates": {"lat": TOWN_COORDINATES[town][0] + dlat, "lon": TOWN_COORDINATES[town][1] + dlon},
+            "firstdate_begin": origin + timedelta(hours=int(start)),
+            "lastdate_end": origin + timedelta(hours=int(start + duration)),
+        }
+        for town, start, duration, (dlat, dlon) in zip(towns, starts, durations, jitter)
+    ]
+
+def event_frame(n: int, words: int = 60, seed: int = 0):
+    """
+    Polars frame of `n` events shaped like the OpenAgenda export: uid, the text
+    columns of `config.COLUMN_EMBEDDING` (conditions_fr missing for half of the
+    events), town, keywords, coordinates, dates and url.
+    """
+    import polars as pl
+
+    records = event_records(n, words, seed=seed)
+    metadata = event_metadata(n, seed=seed)
+    texts = [text for text, _, _ in records]
+    return pl.DataFrame({
+        "uid": [f"event{i}" for i in range(n)],
+        "title_fr": [" ".join(text.split()[:5]) for text in texts],
+        "description_fr": [" ".join(text.split()[:20]) for text in texts],
+        "longdescription_fr": texts,
+        "conditions_fr": [None if i % 2 else "Entrée libre" for i in range(n)],
+        "location_city": [town for _, town, _ in records],
+        "keywords_fr": [keywords for _, _, keywords in records],
+        "location_coordinates": [meta["location_coordinates"] for meta in metadata],
+        "firstdate_begin": [meta["firstdate_begin"] for meta in metadata],
+        "lastdate_end": [meta["lastdate_end"] for meta in metadata],
+        "canonicalurl": [f"https://openagenda.com/events/{i}" for i in range(n)],
+    })
+
+def openagenda_records(
+    n: int,
+    html: float = 1.0,
+    invalid: float = 0.05,
+    region: str = config.REGION,
+    words: int = 60,
+    seed: int = 0
+) -> list:
+    """
+    `n` raw records shaped like the OpenAgenda export: all the fields of
+    `rag_poc.validation.Event` and `updatedat`, starting within 300 days from
+    now. `html` is the share of long descriptions holding markup, and `invalid`
+    the share of records from another region, rejected by the validation.
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    records = []
+    for i, ((text, town, keywords), meta) in enumerate(zip(event_records(n, words, seed=seed), event_metadata(n, seed=seed))):
+        begin = now + timedelta(hours=int(rng.integers(0, 300 * 24)))
+        description = f"<p>{text[:200]}</p><p><b>{town}</b> &amp; alentours</p>" if rng.random() < html else text[:300]
+        records.append({
+            "uid": f"event{i}",
+            "canonicalurl": f"https://openagenda.com/events/{i}",
+            "title_fr": " ".join(text.split()[:5]),
+            "description_fr": " ".join(text.split()[:20]),
+            "longdescription_fr": description,
+            "conditions_fr": None if i % 2 else "Entrée libre",
+            "location_city": town,
+            "location_region": region if rng.random() >= invalid else "Normandie",
+            "keywords_fr": keywords,
+            "firstdate_begin": begin.isoformat(),
+            "firstdate_end": (begin + timedelta(hours=2)).isoformat(),
+            "lastdate_begin": (begin + timedelta(days=2)).isoformat(),
+            "lastdate_end": (begin + timedelta(days=2, hours=2)).isoformat(),
+            "accessibility_label_fr": None,
+            "location_coordinates": {key: float(value) for key, value in meta["location_coordinates"].items()},
+            "updatedat": now.isoformat(),
+        })
+    return records
+
+def html_descriptions(n: int, words: int = 200, seed: int = 0) -> list:
+    """
+    `n` long descriptions of `words` words laid out like the OpenAgenda ones:
+    paragraphs, bold words, line breaks, links, lists and entities.
+    """
+    rng = np.random.default_rng(seed)
+    descriptions = []
+    for text, town, keywords in event_records(n, words=words, seed=seed):
+        tokens = text.split()
+        paragraphs = []
+        for start in range(0, len(tokens), 40):
+            paragraph = tokens[start:start + 40]
+            paragraph[int(rng.integers(0, len(paragraph)))] = f"<b>{town}</b>"
+            paragraph.insert(len(paragraph) // 2, "<br>")
+            paragraphs.append(f"<p>{' '.join(paragraph)}&nbsp;!</p>")
+        items = "".join(f"<li>{keyword} &amp; co</li>" for keyword in keywords)
+        link = f'<p><a href="https://openagenda.com/?town={town}&amp;lang=fr">Réservation</a></p>'
+        descriptions.append("\n".join(paragraphs) + f"\n<ul>{items}</ul>\n" + link)
+    return descriptions
@@ -0,0 +1,252 @@
+"""
+Semantic cache of the generated answers.
+
+An answer is reused when a new question is close enough to a cached one: the
+cosine similarity of their embeddings is at least `threshold`, and they share
+the same context (vector store version, temperature, number of documents, filters),
+so a new index or other generation settings never serve a stale answer.
+
+Entries expire after `ttl` seconds, and the least recently used entries are
+evicted beyond `max_entries`. Two backends:
+    - MemoryAnswerCache : in-process, for a single app process
+    - SqliteAnswerCache : on-disk, shared by the processes of a host (Streamlit, API workers)
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+import numpy as np
+
+from rag_poc import config
+from rag_poc.filters import EventFilter
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "sqlite")
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    documents: List[Document]
+    similarity: float = 1.0
+
+def answer_context(
+    version: str,
+    temperature: float,
+    k: int,
+    filters: Optional[EventFilter] = None,
+    reranker: Optional[str] = None
+) -> str:
+    """ Key of the settings an answer depends on, besides the question. """
+    context = f"{version}|{temperature:.3f}|{k}"
+    if filters:
+        context = f"{context}|{filters.key()}"
+    return f"{context}|rerank={reranker}" if reranker else context
+
+def unit_vector(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+class AnswerCache(ABC):
+    """
+    Base class of the answer caches: similarity lookup and hit-rate metrics.
+
+    Parameters:
+        threshold: Minimum cosine similarity between two questions sharing an answer.
+        ttl: Lifetime of an entry, in seconds.
+        max_entries: Number of entries beyond which the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        threshold: float = config.ANSWER_CACHE_THRESHOLD,
+        ttl: float = config.ANSWER_CACHE_TTL,
+        max_entries: int = config.ANSWER_CACHE_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, vector: Sequence[float], context: str) -> Optional[CachedAnswer]:
+        """ The cached answer of the closest question within the threshold, or None. """
+        with self._lock:
+            found = self._get(unit_vector(vector), context, time.time())
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return found
+
+    def put(self, query: str, vector: Sequence[float], context: str, answer: str, documents: List[Document]) -> None:
+        with self._lock:
+            self._put(query, unit_vector(vector), context, answer, documents, time.time())
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _best(self, matrix: np.ndarray, vector: np.ndarray) -> Tuple[int, float]:
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+    @abstractmethod
+    def _get(self, vector: np.ndarray, context: str, now: float) -> Optional[CachedAnswer]:
+        """ The answer of the closest unexpired question of `context` within the threshold, or None. """
+
+    @abstractmethod
+    def _put(self, query: str, vector: np.ndarray, context: str, answer: str, documents: List[Document], now: float) -> None:
+        """ Store the answer of `query`, evicting the expired and least recently used entries. """
+
+@dataclass
+class _Entry:
+    query: str
+    vector: np.ndarray
+    context: str
+    answer: str
+    documents: List[Document]
+    created: float
+
+class MemoryAnswerCache(AnswerCache):
+    """ In-process answer cache; the vectors of each context are stacked in a matrix. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _matrix(self, context: str) -> Tuple[List[int], np.ndarray]:
+        if context not in self._matrices:
+            ids = [i for i, entry in self._entries.items() if entry.context == context]
+            vectors = np.stack([self._entries[i].vector for i in ids]) if ids else np.empty((0, 0), np.float32)
+            self._matrices[context] = (ids, vectors)
+        return self._matrices[context]
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._matrices.pop(entry.context, None)
+
+    def _get(self, vector, context, now):
+        ids, _ = self._matrix(context)
+        for entry_id in [i for i in ids if now - self._entries[i].created > self.ttl]:
+            self._remove(entry_id)
+        ids, matrix = self._matrix(context)
+        if not ids:
+            return None
+
+        best, similarity = self._best(matrix, vector)
+        if similarity < self.threshold:
+            return None
+
+        entry_id = ids[best]
+        entry = self._entries[entry_id]
+        self._entries.move_to_end(entry_id)
+        return CachedAnswer(entry.query, entry.answer, entry.documents, similarity)
+
+    def _put(self, query, vector, context, answer, documents, now):
+        expired = [i for i, entry in self._entries.items() if now - entry.created > self.ttl]
+        for entry_id in expired:
+            self._remove(entry_id)
+
+        self._entries[self._next_id] = _Entry(query, vector, context, answer, list(documents), now)
+        self._matrices.pop(context, None)
+        self._next_id += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+class SqliteAnswerCache(AnswerCache):
+    """
+    On-disk answer cache in a SQLite database (WAL mode), shared by several processes.
+    The hit-rate metrics are those of the current process.
+    """
+
+    def __init__(self, path: pathlib.Path = config.ANSWER_CACHE_FILE, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY, context TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL,"
+            " answer TEXT NOT NULL, documents TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_context ON answers (context, created)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _get(self, vector, context, now):
+        rows = self._db.execute(
+            "SELECT id, vector FROM answers WHERE context = ? AND created >= ?", (context, now - self.ttl)
+        ).fetchall()
+        if not rows:
+            return None
+
+        matrix = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32).reshape(len(rows), -1)
+        if matrix.shape[1] != len(vector):
+            return None
+        best, similarity = self._best(matrix, vector)
+        if similarity < self.threshold:
+            return None
+
+        entry_id = rows[best][0]
+        query, answer, documents = self._db.execute(
+            "SELECT query, answer, documents FROM answers WHERE id = ?", (entry_id,)
+        ).fetchone()
+        self._db.execute("UPDATE answers SET accessed = ? WHERE id = ?", (now, entry_id))
+        return CachedAnswer(query, answer, [document_from_json(doc) for doc in json.loads(documents)], similarity)
+
+    def _put(self, query, vector, context, answer, documents, now):
+        documents_json = json.dumps([document_to_json(doc) for doc in documents], ensure_ascii=False, default=str)
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "INSERT INTO answers (context, query, vector, answer, documents, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (context, query, vector.tobytes(), answer, documents_json, now, now),
+            )
+            self._db.execute(
+                "DELETE FROM answers WHERE id IN ("
+                " SELECT id FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+def document_to_json(doc: Document) -> Dict[str, Any]:
+    return {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata}
+
+def document_from_json(data: Dict[str, Any]) -> Document:
+    return Document(id=data["id"], page_content=data["page_content"], metadata=data["metadata"])
+
+def create_answer_cache(backend: Optional[str] = config.ANSWER_CACHE_BACKEND) -> Optional[AnswerCache]:
+    """ The answer cache of `backend` ("memory", "sqlite"), or None to disable caching. """
+    if backend is None:
+        return None
+    if backend == "memory":
+        return MemoryAnswerCache()
+    if backend == "sqlite":
+        return SqliteAnswerCache(config.ANSWER_CACHE_FILE)
+    raise ValueError(f"Unknown answer cache backend '{backend}', expected one of {BACKENDS}.")
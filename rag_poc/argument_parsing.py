@@ -1,4 +1,5 @@
 import argparse
+from datetime import datetime
 import logging
 
 from rag_poc import config
@@ -25,6 +26,26 @@ def build_parser() -> argparse.ArgumentParser:
         help="Increase log verbosity (-v, -vv for more)"
     )
 
+    # --------------------
+    # Instrumentation
+    # --------------------
+    p.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Record the spans and counters of the command, written to FILE at the end (JSON, or Prometheus text for .prom)."
+    )
+    p.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="",
+        default=None,
+        metavar="FILE",
+        help=f"Record a cProfile of the command, written to FILE (default: {config.PROFILE_FOLDER}/<command>-<time>.prof)."
+    )
+
     # --------------------
     # Run API fetching
     # --------------------
@@ -56,8 +77,42 @@ def build_parser() -> argparse.ArgumentParser:
     fetch_parser.add_argument(
         "--destination",
         type=str,
-        default=config.DATA_FILE,
-        help="Destination file to save the file to."
+        default=config.EVENTS_DATASET,
+        help="Destination dataset folder, partitioned by region and month (or a single file if it ends with .parquet)."
+    )
+    fetch_parser.add_argument(
+        "--paginated",
+        action="store_true",
+        help="Fetch the date window page by page, concurrently, streaming pages to the destination."
+    )
+    fetch_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch the events updated since the last fetch and upsert them into the destination."
+    )
+    fetch_parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.FETCH_WORKERS,
+        help="Number of pages fetched concurrently in paginated mode."
+    )
+    fetch_parser.add_argument(
+        "--page-days",
+        type=int,
+        default=config.FETCH_PAGE_DAYS,
+        help="Number of days covered by a page in paginated mode."
+    )
+    fetch_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=config.FETCH_PAGE_SIZE,
+        help="Maximum number of events requested per page in paginated mode."
+    )
+    fetch_parser.add_argument(
+        "--clean-workers",
+        type=int,
+        default=config.CLEAN_WORKERS,
+        help="Number of processes cleaning the HTML of the descriptions (1: no process pool)."
     )
     
     # --------------------
@@ -67,8 +122,20 @@ def build_parser() -> argparse.ArgumentParser:
     indexing_parser.add_argument(
         "--source",
         type=str,
-        default=config.DATA_FILE,
-        help="Path to the file source."
+        default=config.EVENTS_DATASET,
+        help="Path to the events dataset folder, Parquet file or folder of Parquet files."
+    )
+    indexing_parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only index the events beginning from this date (2025-06-01), reading only the partitions needed."
+    )
+    indexing_parser.add_argument(
+        "--end",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only index the events beginning before this date (2025-07-01)."
     )
     indexing_parser.add_argument(
         "--destination",
@@ -88,18 +155,142 @@ def build_parser() -> argparse.ArgumentParser:
         default=config.ID_COLUMN,
         help="Space-separated list of columns to use for the embedding."
     )
+    indexing_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Update the existing vector store: embed only new or changed documents and remove deleted ones."
+    )
+    indexing_parser.add_argument(
+        "--batch-tokens",
+        type=int,
+        default=config.EMBED_BATCH_TOKENS,
+        help="Maximum number of (estimated) tokens per embedding request."
+    )
+    indexing_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=config.EMBED_CONCURRENCY,
+        help="Number of embedding requests sent concurrently."
+    )
+    indexing_parser.add_argument(
+        "--rate",
+        type=float,
+        default=config.EMBED_REQUESTS_PER_SECOND,
+        help="Maximum number of embedding requests per second (0 for no limit)."
+    )
+    indexing_parser.add_argument(
+        "--index-type",
+        choices=config.INDEX_TYPES,
+        default=config.INDEX_TYPE,
+        help="FAISS index type: exact (flat) or approximate (IVF, HNSW, product or scalar quantized)."
+    )
+    indexing_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help="Number of IVF cells visited per search (IVF indexes)."
+    )
+    indexing_parser.add_argument(
+        "--ef-search",
+        type=int,
+        default=None,
+        help="Size of the HNSW candidate list per search (HNSW index)."
+    )
+    indexing_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=config.CHUNK_SIZE,
+        help="Split the documents longer than this number of characters in chunks, one vector each (default: no chunking)."
+    )
+    indexing_parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=config.CHUNK_OVERLAP,
+        help="Number of characters shared by consecutive chunks."
+    )
+    indexing_parser.add_argument(
+        "--pca-dim",
+        type=int,
+        default=config.VECTOR_PCA_DIM,
+        help="Reduce the vectors to this number of dimensions with a PCA learned on them (default: full dimension)."
+    )
+    indexing_parser.add_argument(
+        "--quantize",
+        choices=config.VECTOR_QUANTIZE_TYPES,
+        default=config.VECTOR_QUANTIZE,
+        help="Store the vectors of the flat, ivf-flat or hnsw index as fp16 or int8 codes (default: float32)."
+    )
+    indexing_parser.add_argument(
+        "--shard-by",
+        choices=config.SHARD_BY_TYPES,
+        default=config.SHARD_BY,
+        help="Build one shard per region or per month of the events (default: a single store)."
+    )
+    indexing_parser.add_argument(
+        "--shards",
+        nargs="+",
+        default=None,
+        help="Only build these shards (regions, or months as 2025-06), the others are kept."
+    )
+    indexing_parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=config.SHARD_WORKERS,
+        help="Number of processes building the shards."
+    )
 
     # --------------------
     # Run Streamlit app
     # --------------------
-    serve_parser = subparsers.add_parser("app", help="Run Streamlit RAG app")
-    serve_parser.add_argument(
+    app_parser = subparsers.add_parser("app", help="Run Streamlit RAG app")
+    app_parser.add_argument(
         "--port",
         type=int,
         default=8501,
         help="Port to serve the Streamlit app on (default: 8501)"
     )
 
+    # --------------------
+    # Run retrieval API
+    # --------------------
+    serve_parser = subparsers.add_parser("serve", help="Run the retrieval / recommendation HTTP API")
+    serve_parser.add_argument(
+        "--host",
+        type=str,
+        default=config.SERVE_HOST,
+        help="Interface to listen on."
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        default=config.SERVE_PORT,
+        help="Port to listen on."
+    )
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.SERVE_WORKERS,
+        help="Threads running the query embeddings and FAISS searches."
+    )
+    serve_parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=config.SERVE_MAX_PENDING,
+        help="Requests in flight beyond which new requests are answered 503."
+    )
+    serve_parser.add_argument(
+        "--batch-wait-ms",
+        type=float,
+        default=config.QUERY_BATCH_WAIT_MS,
+        help="Milliseconds to wait for concurrent queries to search them as one batch."
+    )
+    serve_parser.add_argument(
+        "--batch-max",
+        type=int,
+        default=config.QUERY_BATCH_MAX,
+        help="Maximum queries per batch (1 disables the batching)."
+    )
+
     return p
 
 def set_verbosity(v_count: int) -> int:
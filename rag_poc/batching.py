@@ -0,0 +1,107 @@
+"""
+Coalescing of concurrent queries.
+
+One search per request leaves most of the work on the table: FAISS searches a
+(n, dim) matrix of queries much faster than n single vectors, and the embedding
+API takes a list of texts per call. The `QueryBatcher` collects the queries
+submitted by concurrent callers for a few milliseconds, runs them as a single
+batch, and hands each caller its own results.
+
+Batches are run one at a time by a dispatcher thread: while a batch runs, the
+next queries queue up, so the batches grow with the load without adding
+latency when the service is idle (beyond `max_wait`).
+"""
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Sequence
+
+from rag_poc import config
+
+logger = logging.getLogger(__name__)
+
+class QueryBatcher:
+    """
+    Parameters:
+        search_many: Function searching a list of queries for their top-k,
+            returning one list of results per query (best first).
+        max_wait: Seconds to wait for more queries after the first one of a batch.
+        max_batch: Maximum number of queries in a batch.
+    """
+
+    def __init__(
+        self,
+        search_many: Callable[[Sequence[str], int], List[list]],
+        max_wait: float = config.QUERY_BATCH_WAIT_MS / 1000,
+        max_batch: int = config.QUERY_BATCH_MAX
+    ):
+        self.search_many = search_many
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, k: int) -> Future:
+        """ Queue `query`; the future resolves to its top-`k` results. """
+        future: Future = Future()
+        self._queue.put((query, k, future))
+        return future
+
+    def search(self, query: str, k: int) -> list:
+        return self.submit(query, k).result()
+
+    def close(self) -> None:
+        """ Run the queued queries, then stop the dispatcher thread. """
+        self._queue.put(None)
+        self._thread.join()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.queries / self.batches if self.batches else 0.0
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch: list) -> None:
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        k = max(k for _, k, _ in batch)
+        try:
+            results = self.search_many([query for query, _, _ in batch], k)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        logger.debug("Batch of %i queries searched.", len(batch))
+        for (_, query_k, future), result in zip(batch, results):
+            future.set_result(result[:query_k])
@@ -1,7 +1,6 @@
 from datetime import datetime
 from dotenv import load_dotenv
 import logging
-import logging.config
 import os
 from pathlib import Path
 from typing import Optional
@@ -22,6 +21,18 @@ UNTIL = 365
 
 HTML_COLUMN = 'longdescription_fr'
 
+# HTML cleaning of the fetched descriptions: chunks of CLEAN_CHUNK_SIZE texts with markup
+# are parsed in a pool of CLEAN_WORKERS processes (1: in the fetching process)
+CLEAN_WORKERS = min(4, os.cpu_count() or 1)
+CLEAN_CHUNK_SIZE = 64
+
+# Paginated fetching: the date window is split in pages fetched concurrently
+FETCH_WORKERS = 4
+FETCH_PAGE_DAYS = 30
+FETCH_PAGE_SIZE = 1000
+FETCH_RETRIES = 5
+FETCH_BACKOFF = 0.5
+
 WRITE_ERRORS = True
 
 #02_build_index
@@ -34,6 +45,7 @@ RAW        = DATA / "raw"
 VECTORS_FOLDER    = DATA / "vectors"
 
 DATA_FILE =  (RAW / "api_data").with_suffix(".parquet")
+EVENTS_DATASET = RAW / "events"
 ERROR_FILE =  DATA / "error"
 
 TEXTS_FILE = VECTORS_FOLDER / "texts"
@@ -41,7 +53,112 @@ EMBED_FILE = VECTORS_FOLDER / "embeddings"
 INDEX_FILE = str(VECTORS_FOLDER / "index.faiss") # Writing as str because faisse io doesnt accept Path object
 META_FILE  = VECTORS_FOLDER / "metadata"
 
+EMBEDDING_MODEL = "mistral-embed"
+EMBEDDING_CACHE_FOLDER = DATA / "embedding_cache"
+# The questions of the apps are cached apart from the documents of the index runs
+QUERY_EMBEDDING_CACHE_FOLDER = DATA / "query_embedding_cache"
+EMBEDDING_CACHE_MAX_BYTES = 1024 ** 3
+
+# Embedding requests: token-budgeted batches, sent concurrently under a rate limit
+EMBED_BATCH_TOKENS = 8000  # the Mistral API accepts up to 16k tokens per request
+EMBED_CHARS_PER_TOKEN = 3
+EMBED_CONCURRENCY = 4
+EMBED_REQUESTS_PER_SECOND = 5.0
+EMBED_MAX_RETRIES = 6
+EMBED_BACKOFF = 1.0
+
+# Indexing: rows of the documents table converted and embedded per chunk
+INDEX_CHUNK_ROWS = 10_000
+
+# FAISS index type (see rag_poc/faiss_index.py) and approximate search parameters
+INDEX_TYPES = ("flat", "ivf-flat", "hnsw", "ivf-pq", "ivf-sq8")
+INDEX_TYPE = "flat"
+ANN_NPROBE = 16
+ANN_HNSW_M = 32
+ANN_EF_SEARCH = 64
+ANN_MIN_VECTORS = 1000
+ANN_TRAIN_SAMPLE = 100_000
+
+# Vector compression (rag_poc/faiss_index.py): a PCA learned on the vectors reduces them to
+# VECTOR_PCA_DIM dimensions, and/or the flat, ivf-flat and hnsw indexes store them as "fp16"
+# or "int8" scalar-quantized codes; the PCA is saved in the index and applied to the queries
+VECTOR_QUANTIZE_TYPES = ("fp16", "int8")
+VECTOR_PCA_DIM: Optional[int] = None
+VECTOR_QUANTIZE: Optional[str] = None
+
+# Hybrid search (see rag_poc/lexical.py): the HYBRID_CANDIDATES best dense and BM25
+# matches are fused by reciprocal rank, BM25 also indexing the LEXICAL_FIELDS metadata
+HYBRID_SEARCH = True
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+LEXICAL_FIELDS = ("location_city", "keywords_fr")
+
+# Structured filters (see rag_poc/filters.py): default radius around a place, geo grid cell size
+FILTER_RADIUS_KM = 20.0
+GEO_CELL_DEG = 0.1
+
+# Reranking (see rag_poc/rerank.py): RERANKER None, "lexical", "mmr" or "cross-encoder"
+# reorders the RERANK_CANDIDATES best first stage results, the k best are kept
+RERANKER: Optional[str] = None
+RERANK_CANDIDATES = 20
+RERANK_MMR_LAMBDA = 0.7
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # multilingual, runs on CPU
+RERANK_BATCH_SIZE = 32
+RERANK_BUDGET_MS = 300.0  # cross-encoder: candidates not scored within the budget keep their rank
+
+# Retrieval API (scripts/serve.py): searches run in a pool of SERVE_WORKERS threads,
+# requests beyond SERVE_MAX_PENDING in flight are answered 503
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_WORKERS = 4
+SERVE_MAX_PENDING = 256
+
+# Query coalescing (rag_poc/batching.py): concurrent queries arriving within
+# QUERY_BATCH_WAIT_MS are embedded and searched together, up to QUERY_BATCH_MAX
+QUERY_BATCH_WAIT_MS = 2.0
+QUERY_BATCH_MAX = 64
+
+# Semantic answer cache (rag_poc/answer_cache.py): backend "memory", "sqlite" or None
+ANSWER_CACHE_BACKEND = "memory"
+ANSWER_CACHE_FILE = DATA / "answer_cache.sqlite"
+ANSWER_CACHE_THRESHOLD = 0.95  # cosine similarity between two questions sharing an answer
+ANSWER_CACHE_TTL = 6 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 10_000
+
 ID_COLUMN = 'uid'
+
+# Chunking (scripts/indexing.py): with a CHUNK_SIZE (characters), the longer documents are
+# indexed as chunks overlapping by CHUNK_OVERLAP characters; the searches fetch
+# CHUNK_OVERFETCH chunks per event asked for, then collapse them to distinct events
+CHUNK_SIZE: Optional[int] = None
+CHUNK_OVERLAP = 150
+CHUNK_OVERFETCH = 4
+
+# Sharding (scripts/indexing.py, rag_poc/sharding.py): with a SHARD_BY key, the store is
+# one shard per region (location_region) or per month (firstdate_begin), built by
+# SHARD_WORKERS processes; the searches fan out to the shards in SHARD_SEARCH_THREADS threads
+SHARD_BY_TYPES = ("region", "month")
+SHARD_BY: Optional[str] = None
+SHARD_WORKERS = min(4, os.cpu_count() or 1)
+SHARD_SEARCH_THREADS = 8
+
+# Metrics (rag_poc/metrics.py): spans timed in histograms of METRICS_BUCKETS_MS and counters,
+# off unless METRICS_ENABLED or `python -m run --metrics FILE`; `--profile` writes a cProfile
+# of the command to PROFILE_FOLDER
+METRICS_ENABLED = False
+METRICS_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PROFILE_FOLDER = DATA / "profiles"
+
+# Raw events dataset (rag_poc/dataset.py): Parquet files partitioned by region and month of
+# firstdate_begin, written in row groups of PARQUET_ROW_GROUP_SIZE rows with their statistics;
+# the index reads the COLUMN_EMBEDDING, the id and the METADATA_COLUMNS kept in the store
+PARQUET_ROW_GROUP_SIZE = 16_384
+PARQUET_COMPRESSION = "zstd"
+METADATA_COLUMNS = (
+    "canonicalurl", "title_fr", "location_city", "location_region", "location_coordinates",
+    "keywords_fr", "firstdate_begin", "lastdate_end",
+)
+
 COLUMN_EMBEDDING = [
     "title_fr",
     "longdescription_fr",
@@ -0,0 +1,143 @@
+"""
+Raw events dataset: the fetched events as Parquet files partitioned by region and month.
+
+Layout of a dataset folder (Hive partitioning, the region percent-encoded):
+    location_region=<region>/month=<YYYY-MM>/part-0.parquet
+
+The month is the one of `firstdate_begin`. The files hold the other columns of
+the events, sorted by `firstdate_begin`, compressed with `config.PARQUET_COMPRESSION`
+in row groups of `config.PARQUET_ROW_GROUP_SIZE` rows with their statistics.
+
+`scan_events` reads a dataset lazily: the region and date filters skip the
+partitions outside them, then the row groups by their statistics, and only
+the columns asked for are read. It also reads a single Parquet file, or a
+folder of Parquet files, with the same filters (row groups only).
+
+A fetch replaces the partitions of its region (`write_region`): they are written
+in a temporary folder next to the dataset, then swapped in by renames.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import pathlib
+import shutil
+from typing import Optional, Sequence, Union
+from urllib.parse import quote
+
+import polars as pl
+
+from rag_poc import config
+
+logger = logging.getLogger(__name__)
+
+REGION_KEY = "location_region"
+MONTH_KEY = "month"
+DATE_COLUMN = "firstdate_begin"
+HIVE_SCHEMA = {REGION_KEY: pl.String, MONTH_KEY: pl.String}
+
+def is_partitioned(path: pathlib.Path) -> bool:
+    """ Whether `path` is (or is to be) a dataset folder rather than a single .parquet file. """
+    return pathlib.Path(path).suffix != ".parquet"
+
+def region_folder(folder: pathlib.Path, region: str) -> pathlib.Path:
+    """ Partition folder of `region`: "Île-de-France" -> "location_region=%C3%8Ele-de-France". """
+    return pathlib.Path(folder) / f"{REGION_KEY}={quote(region, safe='')}"
+
+def write_region(events: Union[pl.DataFrame, pl.LazyFrame], folder: pathlib.Path, region: str) -> int:
+    """
+    Replace the partitions of `region` in the dataset `folder` by the `events`
+    (those of another region are left out).
+
+    Each month is streamed from `events` to its file, a scan pruned by the
+    `firstdate_begin` statistics when `events` is read from Parquet.
+
+    Returns:
+        The number of months written.
+    """
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    target = region_folder(folder, region)
+    tmp_folder = folder.with_name(f".{folder.name}.{target.name}.tmp")
+    old_folder = folder.with_name(f".{folder.name}.{target.name}.old")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+
+    events = events.lazy()
+    if REGION_KEY in events.collect_schema():
+        events = events.filter(pl.col(REGION_KEY) == region).drop(REGION_KEY)
+    months = (
+        events.select(pl.col(DATE_COLUMN).dt.truncate("1mo").unique().sort())
+        .collect().to_series().drop_nulls().to_list()
+    )
+    for begin in months:
+        end = begin.replace(year=begin.year + begin.month // 12, month=begin.month % 12 + 1)
+        file = tmp_folder / f"{MONTH_KEY}={begin:%Y-%m}" / "part-0.parquet"
+        file.parent.mkdir(parents=True)
+        (
+            events.filter((pl.col(DATE_COLUMN) >= begin) & (pl.col(DATE_COLUMN) < end))
+            .sort(DATE_COLUMN)
+            .sink_parquet(
+                file, compression=config.PARQUET_COMPRESSION, statistics=True,
+                row_group_size=config.PARQUET_ROW_GROUP_SIZE
+            )
+        )
+
+    shutil.rmtree(old_folder, ignore_errors=True)
+    if target.exists():
+        os.replace(target, old_folder)
+    if months:
+        os.replace(tmp_folder, target)
+    shutil.rmtree(old_folder, ignore_errors=True)
+    logger.info("%i months of '%s' written to '%s'", len(months), region, target)
+    return len(months)
+
+def scan_events(
+    source: pathlib.Path,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    regions: Optional[Sequence[str]] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> pl.LazyFrame:
+    """
+    The events of `source` (a dataset folder, a Parquet file or a folder of Parquet files)
+    beginning in [`start`, `end`) and in the `regions`, with only the `columns` found in them.
+    Naive datetimes are taken as UTC.
+
+    Raises:
+        FileNotFoundError if `source` holds no Parquet file.
+    """
+    source = pathlib.Path(source)
+    partitioned = _has_partitions(source)
+    if partitioned:
+        events = pl.scan_parquet(source / "**" / "*.parquet", hive_partitioning=True, hive_schema=HIVE_SCHEMA)
+    elif source.is_dir():
+        files = sorted(source.glob("*.parquet"))
+        if not files:
+            raise FileNotFoundError(f"No Parquet file in '{source}'.")
+        events = pl.concat([pl.scan_parquet(file) for file in files], how="diagonal_relaxed")
+    else:
+        events = pl.scan_parquet(source)
+
+    if regions is not None:
+        events = events.filter(pl.col(REGION_KEY).is_in(list(regions)))
+    if start is not None:
+        start = _utc(start)
+        if partitioned:
+            events = events.filter(pl.col(MONTH_KEY) >= f"{start:%Y-%m}")
+        events = events.filter(pl.col(DATE_COLUMN) >= start)
+    if end is not None:
+        end = _utc(end)
+        if partitioned:
+            events = events.filter(pl.col(MONTH_KEY) <= f"{end - timedelta(microseconds=1):%Y-%m}")
+        events = events.filter(pl.col(DATE_COLUMN) < end)
+
+    schema = events.collect_schema()
+    if columns is not None:
+        return events.select(list(dict.fromkeys(column for column in columns if column in schema)))
+    return events.drop(MONTH_KEY) if partitioned else events
+
+def _has_partitions(folder: pathlib.Path) -> bool:
+    folder = pathlib.Path(folder)
+    return folder.is_dir() and any(folder.glob(f"{REGION_KEY}=*/{MONTH_KEY}=*/*.parquet"))
+
+def _utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
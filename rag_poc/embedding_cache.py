@@ -0,0 +1,262 @@
+"""
+Persistent, content-addressed cache of embedding vectors.
+
+Vectors are keyed by the hash of the model name and of the normalized text, so
+re-indexing unchanged documents or repeating a question never calls the
+embedding backend again.
+
+On-disk layout (one folder per model):
+    - vectors.f32 : memory-mapped float32 matrix (capacity, dim)
+    - keys.u8     : memory-mapped (capacity, 16) key of each slot (zeros = free)
+    - ticks.u64   : memory-mapped last access tick of each slot, for LRU eviction
+    - meta.json   : dim, capacity, current tick and version of the key index
+    - .lock       : the file locked (`fcntl.flock`) by every read and write
+
+Several processes may share a cache (the indexer and the apps): each access holds
+the lock of the folder, and reloads the key index when another process changed
+it since (a new version in meta.json), before reading a slot or allocating one.
+"""
+from contextlib import contextmanager
+import fcntl
+from hashlib import blake2b
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+from rag_poc import config
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+INITIAL_CAPACITY = 1024
+EVICTION_RATIO = 0.1
+LOCK_FILE = ".lock"
+
+def normalize_text(text: str) -> str:
+    """ NFC unicode normalization, with runs of whitespace collapsed and stripped. """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def cache_key(model: str, text: str) -> bytes:
+    return blake2b(f"{model}\0{normalize_text(text)}".encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+class EmbeddingCache:
+    """
+    Embedding cache of one model, stored in `folder / model`.
+
+    Parameters:
+        folder: The root folder of the cache.
+        model: The name of the embedding model, part of every key.
+        max_bytes: Size budget of the vectors, keys and ticks; the least recently
+            used entries are evicted beyond it.
+    """
+
+    def __init__(self, folder: pathlib.Path, model: str, max_bytes: int = config.EMBEDDING_CACHE_MAX_BYTES):
+        self.folder = pathlib.Path(folder) / re.sub(r"[^\w.-]", "_", model)
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._slots: Dict[bytes, int] = {}
+        self._free: List[int] = []
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self.tick = 0
+        self.version: Optional[int] = None
+
+        if (self.folder / "meta.json").exists():
+            with self._locked():
+                pass  # the key index is loaded by _locked
+
+    # ------ public API ------
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """ Return the cached vector of each text, or None for the misses. """
+        keys = [cache_key(self.model, text) for text in texts]
+        with self._locked():
+            result = []
+            self.tick += 1
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    result.append(None)
+                else:
+                    self.hits += 1
+                    self._ticks[slot] = self.tick
+                    result.append(np.array(self._vectors[slot]))
+            return result
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """ Store the vector of each text, evicting the least recently used entries if needed. """
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        with self._locked():
+            if self.dim is None:
+                self._create(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}.")
+
+            self.tick += 1
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model, text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._free_slot()
+                    self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                    self._slots[key] = slot
+                self._vectors[slot] = vector
+                self._ticks[slot] = self.tick
+            self._flush()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    # ------ storage ------
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the thread lock and the lock file of the folder, with the key index
+        reloaded first if another process wrote to the cache.
+        """
+        with self._lock:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            with open(self.folder / LOCK_FILE, "ab") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        meta_file = self.folder / "meta.json"
+        if not meta_file.exists():
+            return
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        if meta.get("version", 0) != self.version or meta["capacity"] != self.capacity:
+            self._open(meta)
+
+    @property
+    def _entry_bytes(self) -> int:
+        return self.dim * 4 + KEY_SIZE + 8
+
+    @property
+    def max_entries(self) -> int:
+        return max(1, self.max_bytes // self._entry_bytes)
+
+    def _create(self, dim: int) -> None:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._map(min(INITIAL_CAPACITY, self.max_entries), mode="w+")
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._flush()
+
+    def _open(self, meta: dict) -> None:
+        self.dim, self.version = meta["dim"], meta.get("version", 0)
+        self.tick = max(self.tick, meta["tick"])
+        self._map(meta["capacity"], mode="r+")
+
+        used = self._keys.any(axis=1)
+        self._slots = {self._keys[slot].tobytes(): int(slot) for slot in np.flatnonzero(used)}
+        self._free = np.flatnonzero(~used)[::-1].tolist()
+        logger.debug("Embedding cache '%s' opened: %i entries.", self.folder, len(self._slots))
+
+    def _map(self, capacity: int, mode: str) -> None:
+        self.capacity = capacity
+        self._vectors = np.memmap(self.folder / "vectors.f32", dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+        self._keys = np.memmap(self.folder / "keys.u8", dtype=np.uint8, mode=mode, shape=(capacity, KEY_SIZE))
+        self._ticks = np.memmap(self.folder / "ticks.u64", dtype=np.uint64, mode=mode, shape=(capacity,))
+
+    def _grow(self, capacity: int) -> None:
+        """ Extend the memory-mapped files to `capacity` slots, keeping their content. """
+        for arr in (self._vectors, self._keys, self._ticks):
+            arr.flush()
+        old_capacity = self.capacity
+        del self._vectors, self._keys, self._ticks
+
+        for name, row_bytes in (("vectors.f32", self.dim * 4), ("keys.u8", KEY_SIZE), ("ticks.u64", 8)):
+            with open(self.folder / name, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self._map(capacity, mode="r+")
+        self._free = list(range(capacity - 1, old_capacity - 1, -1)) + self._free
+        logger.debug("Embedding cache grown from %i to %i slots.", old_capacity, capacity)
+
+    def _free_slot(self) -> int:
+        if not self._free:
+            if self.capacity < self.max_entries:
+                self._grow(min(self.capacity * 2, self.max_entries))
+            else:
+                self._evict(max(1, int(self.capacity * EVICTION_RATIO)))
+        return self._free.pop()
+
+    def _evict(self, count: int) -> None:
+        """ Free the `count` least recently used slots. """
+        used = np.flatnonzero(self._keys.any(axis=1))
+        victims = used[np.argsort(self._ticks[used], kind="stable")[:count]]
+        for slot in victims:
+            del self._slots[self._keys[slot].tobytes()]
+        self._keys[victims] = 0
+        self._ticks[victims] = 0
+        self._free.extend(victims.tolist())
+        logger.debug("Embedding cache: %i entries evicted.", len(victims))
+
+    def _flush(self) -> None:
+        for arr in (self._vectors, self._keys, self._ticks):
+            arr.flush()
+        self.version = (self.version or 0) + 1
+        meta_file = self.folder / "meta.json"
+        tmp_file = meta_file.with_name(".meta.json.tmp")
+        tmp_file.write_text(
+            json.dumps({
+                "model": self.model, "dim": self.dim, "capacity": self.capacity,
+                "tick": self.tick, "version": self.version,
+            }),
+            encoding="utf-8",
+        )
+        os.replace(tmp_file, meta_file)
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain `Embeddings` consulting an `EmbeddingCache` before the wrapped backend.
+    Only the texts missing from the cache are sent to the backend, once each.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+        if missing:
+            computed = self.embeddings.embed_documents(missing)
+            self.cache.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+        return [list(map(float, vector)) for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many([text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([text], [vector])
+        return list(map(float, vector))
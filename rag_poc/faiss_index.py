@@ -0,0 +1,210 @@
+"""
+FAISS index types for the vector store.
+
+    - flat     : exact brute-force search (a single IVF cell, scanned entirely)
+    - ivf-flat : inverted lists over k-means cells, full vectors (search `nprobe` cells)
+    - hnsw     : graph index (search with `efSearch`), no removal
+    - ivf-pq   : inverted lists with product-quantized vectors
+    - ivf-sq8  : inverted lists with 8-bit scalar-quantized vectors
+
+Vectors are addressed by document id: IVF indexes store the ids in their
+inverted lists, HNSW is wrapped in an IndexIDMap. Flat search uses a one-cell
+IVF rather than IndexFlat, because FAISS can only memory-map inverted lists
+(see rag_poc.vector_store). Approximate indexes are trained on a sample of the
+vectors; their search parameters are persisted in the store manifest.
+
+The vectors can be compressed before they enter the index:
+    - pca_dim  : a PCA learned on the training sample projects them to `pca_dim`
+                 dimensions, the index is then an IndexPreTransform applying it to
+                 the added and the query vectors (saved in the index file)
+    - quantize : the flat, ivf-flat and hnsw indexes store "fp16" (2 bytes per
+                 dimension) or "int8" (1 byte, SQ8) codes instead of float32
+"""
+import logging
+import math
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+from rag_poc import config
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = config.INDEX_TYPES
+QUANTIZE_TYPES = config.VECTOR_QUANTIZE_TYPES
+
+_SCALAR_QUANTIZERS = {"fp16": "SQfp16", "int8": "SQ8"}
+
+def default_params(index_type: str, n_vectors: int, dim: int) -> Dict[str, Any]:
+    """ Build and search parameters of `index_type` for `n_vectors` vectors of `dim` dimensions. """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}.")
+
+    params: Dict[str, Any] = {"index_type": index_type}
+
+    if index_type.startswith("ivf"):
+        # ~4 sqrt(n) cells, with at least 39 training points per cell
+        params["nlist"] = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+        params["nprobe"] = min(params["nlist"], config.ANN_NPROBE)
+
+    if index_type == "ivf-pq":
+        params["pq_m"] = pq_subquantizers(dim)
+
+    if index_type == "hnsw":
+        params["hnsw_m"] = config.ANN_HNSW_M
+        params["efSearch"] = config.ANN_EF_SEARCH
+
+    return params
+
+def pq_subquantizers(dim: int, max_m: int = 64) -> int:
+    """ Largest number of PQ sub-quantizers dividing `dim`, with at least 4 dimensions each. """
+    return max(m for m in range(1, min(max_m, dim // 4 or 1) + 1) if dim % m == 0)
+
+def factory_string(params: Dict[str, Any]) -> str:
+    return (f"PCA{params['pca_dim']}," if params.get("pca_dim") else "") + _index_string(params)
+
+def _index_string(params: Dict[str, Any]) -> str:
+    index_type = params["index_type"]
+    storage = _SCALAR_QUANTIZERS.get(params.get("quantize"), "Flat")
+    if index_type == "flat":
+        return f"IVF1,{storage}"
+    if index_type == "hnsw":
+        return f"IDMap,HNSW{params['hnsw_m']}" + (f"_{storage}" if storage != "Flat" else "")
+    if index_type == "ivf-flat":
+        return f"IVF{params['nlist']},{storage}"
+    if index_type == "ivf-pq":
+        return f"IVF{params['nlist']},PQ{params['pq_m']}"
+    return f"IVF{params['nlist']},SQ8"
+
+def create_index(
+    index_type: str,
+    vectors: np.ndarray,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    pca_dim: Optional[int] = None,
+    quantize: Optional[str] = None,
+) -> tuple:
+    """
+    Create an empty index of `index_type` accepting ids, trained on a sample of `vectors`,
+    storing them reduced to `pca_dim` dimensions and / or `quantize`d.
+
+    Approximate indexes need enough vectors to be trained; below
+    `config.ANN_MIN_VECTORS`, a flat index is used instead. The PCA is left out
+    when `pca_dim` is not below the dimension or above the number of vectors.
+
+    Returns:
+        The index and its parameters (to persist in the store manifest).
+
+    Raises:
+        ValueError for an unknown `quantize`, or with the already quantized ivf-pq and ivf-sq8.
+    """
+    n_vectors, dim = vectors.shape
+    requested_type = index_type
+
+    if quantize is not None and quantize not in QUANTIZE_TYPES:
+        raise ValueError(f"Unknown quantization '{quantize}', expected one of {QUANTIZE_TYPES}.")
+    if quantize and index_type in ("ivf-pq", "ivf-sq8"):
+        raise ValueError(f"The '{index_type}' index already quantizes the vectors, quantize applies to flat, ivf-flat and hnsw.")
+
+    if index_type != "flat" and n_vectors < config.ANN_MIN_VECTORS:
+        logger.warning(
+            "Only %i vectors, below %i: using a flat index instead of '%s'.",
+            n_vectors, config.ANN_MIN_VECTORS, index_type
+        )
+        index_type = "flat"
+
+    requested_pca_dim = pca_dim
+    if pca_dim and not pca_dim < dim:
+        logger.warning("The vectors have %i dimensions, not more than %i: no PCA.", dim, pca_dim)
+        pca_dim = None
+    if pca_dim and n_vectors < pca_dim:
+        logger.warning("Only %i vectors, too few to learn a PCA to %i dimensions: no PCA.", n_vectors, pca_dim)
+        pca_dim = None
+
+    params = default_params(index_type, n_vectors, pca_dim or dim)
+    params["requested_type"] = requested_type
+    if requested_pca_dim:
+        params["requested_pca_dim"] = requested_pca_dim
+    if pca_dim:
+        params["pca_dim"] = pca_dim
+    if quantize:
+        params["quantize"] = quantize
+    if nprobe and "nprobe" in params:
+        params["nprobe"] = min(nprobe, params["nlist"])
+    if ef_search and "efSearch" in params:
+        params["efSearch"] = ef_search
+
+    index = faiss.index_factory(dim, factory_string(params), faiss.METRIC_L2)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        # Polysemous codes are not used at search time and multiply the training time
+        base.do_polysemous_training = False
+    if index_type == "flat":
+        # The single centroid does not change the (exhaustive) search, any sample size will do
+        base.cp.min_points_per_centroid = 1
+
+    if not index.is_trained:
+        sample = vectors
+        if n_vectors > config.ANN_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n_vectors, config.ANN_TRAIN_SAMPLE, replace=False)]
+        logger.info("Training '%s' index on %i vectors.", params["index_type"], len(sample))
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+    apply_search_params(index, params)
+    logger.debug("Index created: %s", params)
+    return index, params
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """ The IVF or HNSW index holding the vectors, inside the IndexPreTransform (PCA) and IndexIDMap wrappers. """
+    while isinstance(index, (faiss.IndexPreTransform, faiss.IndexIDMap)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def transform(index: faiss.Index, vectors: np.ndarray) -> np.ndarray:
+    """ `vectors` as stored in `index`: projected by its PCA, if any. """
+    if isinstance(index, faiss.IndexPreTransform):
+        for i in range(index.chain.size()):
+            vectors = faiss.downcast_VectorTransform(index.chain.at(i)).apply(vectors)
+    return vectors
+
+def reverse_transform(index: faiss.Index, vectors: np.ndarray) -> np.ndarray:
+    """ Vectors stored in `index` back in the space of the embeddings (an approximation with a PCA). """
+    if isinstance(index, faiss.IndexPreTransform):
+        for i in reversed(range(index.chain.size())):
+            vectors = faiss.downcast_VectorTransform(index.chain.at(i)).reverse_transform(vectors)
+    return vectors
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    """ Set the persisted search parameters (nprobe, efSearch) on `index`. """
+    space = faiss.ParameterSpace()
+    for name in ("nprobe", "efSearch"):
+        if name in params:
+            space.set_index_parameter(index, name, params[name])
+
+def id_selector(ids: np.ndarray) -> faiss.IDSelector:
+    """ Selector of the vectors of `ids` (any 64-bit ids), for `selector_params`. """
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+
+def selector_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Search parameters of `index` restricting the search to the vectors of `selector`.
+    The current nprobe / efSearch are carried over, the defaults of the
+    parameter objects would override them. IndexIDMap swaps the selector of the
+    parameters during a search: create them for each search. An IndexPreTransform
+    passes them on to its index.
+    """
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+def supports_removal(params: Dict[str, Any]) -> bool:
+    return params.get("index_type", "flat") != "hnsw"
+
+def index_bytes(index: faiss.Index) -> int:
+    """ Size of the serialized index, a close estimate of its memory footprint. """
+    return faiss.serialize_index(index).nbytes
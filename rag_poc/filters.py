@@ -0,0 +1,238 @@
+"""
+Structured pre-filtering of the events by date, city and distance.
+
+An `EventFilter` is resolved against a `MetadataIndex`, columnar indexes of the
+documents table built with the store (one version folder each):
+    begin, begin_rows  : firstdate_begin of the events (epoch seconds), sorted, and their rows
+    end, end_rows      : lastdate_end, likewise
+    city_indptr, city_rows : rows of each city (CSR), the city names in the metadata file
+    cells, cell_rows   : geo grid cell of the events (`config.GEO_CELL_DEG` degrees), sorted
+    lat, lon           : coordinates of every row (NaN when unknown)
+
+The matching rows become a FAISS ID selector, so the vector search itself
+skips the other events instead of over-fetching and filtering the results.
+The bounds of these indexes (`MetadataIndex.may_match`) tell whether a filter
+can match any event at all, to route the searches of a sharded store.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import json
+import pathlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from rag_poc import config
+from rag_poc.lexical import fold
+
+FILTERS_FOLDER = "filters"
+ARRAYS = ("begin", "begin_rows", "end", "end_rows", "city_indptr", "city_rows", "cells", "cell_rows", "lat", "lon")
+META_FILE = "filters.json"
+EARTH_RADIUS_KM = 6371.0
+# Longitude cells per latitude band of the grid keys
+_LON_CELLS = 1 << 20
+
+@dataclass(frozen=True)
+class EventFilter:
+    """
+    Conditions on the events, all optional and combined with AND.
+
+    Parameters:
+        start: Keep the events still running at `start` or later (lastdate_end >= start).
+        end: Keep the events beginning before `end` (firstdate_begin < end).
+        cities: Keep the events in one of these towns (case and accents ignored).
+        near: (lat, lon) of a point; keep the events within `radius_km` of it.
+        radius_km: Radius around `near`, in kilometres.
+    """
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    cities: Tuple[str, ...] = field(default_factory=tuple)
+    near: Optional[Tuple[float, float]] = None
+    radius_km: float = config.FILTER_RADIUS_KM
+
+    def __bool__(self) -> bool:
+        return bool(self.start or self.end or self.cities or self.near)
+
+    def key(self) -> str:
+        """ Stable text key of the filter, for the caches. """
+        near = f"{self.near[0]:.4f},{self.near[1]:.4f},{self.radius_km:g}" if self.near else ""
+        cities = ",".join(sorted(fold(city) for city in self.cities))
+        dates = [timestamp(d) if d else "" for d in (self.start, self.end)]
+        return f"{dates[0]}~{dates[1]}|{cities}|{near}"
+
+def timestamp(value: datetime) -> int:
+    """ Epoch seconds of `value`, naive datetimes being UTC. """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def grid_cells(lat: np.ndarray, lon: np.ndarray, cell_deg: float) -> np.ndarray:
+    """ Key of the grid cell of each (lat, lon): latitude band * _LON_CELLS + longitude cell. """
+    band = np.floor((lat + 90.0) / cell_deg).astype(np.int64)
+    column = np.floor((lon + 180.0) / cell_deg).astype(np.int64)
+    return band * _LON_CELLS + column
+
+def haversine_km(lat: np.ndarray, lon: np.ndarray, lat0: float, lon0: float) -> np.ndarray:
+    lat, lon, lat0, lon0 = map(np.radians, (lat, lon, lat0, lon0))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def _epoch_seconds(documents: pa.Table, column: str) -> Tuple[np.ndarray, np.ndarray]:
+    """ Epoch seconds of a date column and the rows where it is set. """
+    if column not in documents.column_names:
+        return np.empty(0, np.int64), np.empty(0, np.int32)
+    # ISO strings are parsed, timestamps converted to UTC
+    micros = pc.cast(pc.cast(documents.column(column), pa.timestamp("us", "UTC")), pa.int64())
+    rows = np.flatnonzero(pc.is_valid(micros).to_numpy(zero_copy_only=False)).astype(np.int32)
+    seconds = pc.fill_null(micros, 0).to_numpy() // 1_000_000
+    return seconds[rows], rows
+
+class MetadataIndex:
+    """
+    Columnar indexes of the dates, cities and coordinates of the documents, see the module docstring.
+
+    Parameters:
+        arrays: The index arrays, by name (see `ARRAYS`).
+        cities: The name of each city id.
+        n_documents: Number of rows of the indexed table.
+        cell_deg: Size of the geo grid cells, in degrees.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], cities: List[str], n_documents: int, cell_deg: float = config.GEO_CELL_DEG):
+        self.arrays = arrays
+        self.cities = cities
+        self.n_documents = n_documents
+        self.cell_deg = cell_deg
+        self._city_ids = {fold(city): i for i, city in enumerate(cities)}
+        self._bounds: Optional[Tuple[float, float, float, float]] = None
+
+    @classmethod
+    def build(cls, documents: pa.Table, cell_deg: float = config.GEO_CELL_DEG) -> "MetadataIndex":
+        n = len(documents)
+        arrays = {}
+        for name, column in (("begin", "firstdate_begin"), ("end", "lastdate_end")):
+            seconds, rows = _epoch_seconds(documents, column)
+            order = np.argsort(seconds, kind="stable")
+            arrays[name], arrays[f"{name}_rows"] = seconds[order], rows[order]
+
+        # City ids in the order of the folded names, each city named by its most common spelling
+        values = documents.column("location_city").to_pylist() if "location_city" in documents.column_names else [None] * n
+        keys = [fold(city).strip() if city else None for city in values]
+        spellings: Dict[str, Counter] = {}
+        for key, city in zip(keys, values):
+            if key:
+                spellings.setdefault(key, Counter())[city.strip()] += 1
+        ids = {key: i for i, key in enumerate(sorted(spellings))}
+        cities = [max(spellings[key].items(), key=lambda s: (s[1], s[0][:1].isupper()))[0] for key in sorted(spellings)]
+        city_ids = np.array([ids[key] if key else -1 for key in keys], dtype=np.int64)
+        known = np.flatnonzero(city_ids >= 0)
+        order = known[np.argsort(city_ids[known], kind="stable")]
+        arrays["city_rows"] = order.astype(np.int32)
+        arrays["city_indptr"] = np.concatenate([[0], np.cumsum(np.bincount(city_ids[known], minlength=len(cities)))]).astype(np.int64)
+
+        lat, lon = np.full(n, np.nan), np.full(n, np.nan)
+        if "location_coordinates" in documents.column_names:
+            coordinates = documents.column("location_coordinates")
+            lat = pc.struct_field(coordinates, "lat").to_numpy(zero_copy_only=False).astype(np.float64)
+            lon = pc.struct_field(coordinates, "lon").to_numpy(zero_copy_only=False).astype(np.float64)
+        located = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        cells = grid_cells(lat[located], lon[located], cell_deg)
+        order = np.argsort(cells, kind="stable")
+        arrays["cells"], arrays["cell_rows"] = cells[order], located[order].astype(np.int32)
+        arrays["lat"], arrays["lon"] = lat.astype(np.float32), lon.astype(np.float32)
+        return cls(arrays, cities, n, cell_deg)
+
+    @classmethod
+    def load(cls, folder: pathlib.Path, mmap: bool = True) -> "MetadataIndex":
+        """ Open the index saved in `folder` (a store version folder), memory-mapped with `mmap`. """
+        folder = pathlib.Path(folder) / FILTERS_FOLDER
+        meta = json.loads((folder / META_FILE).read_text(encoding="utf-8"))
+        arrays = {name: np.load(folder / f"{name}.npy", mmap_mode="r" if mmap else None) for name in ARRAYS}
+        return cls(arrays, meta["cities"], meta["documents"], meta["cell_deg"])
+
+    def save(self, folder: pathlib.Path) -> Dict[str, Any]:
+        folder = pathlib.Path(folder) / FILTERS_FOLDER
+        folder.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(folder / f"{name}.npy", self.arrays[name])
+        meta = {"cities": self.cities, "documents": self.n_documents, "cell_deg": self.cell_deg}
+        (folder / META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        return meta
+
+    def select(self, filters: EventFilter) -> np.ndarray:
+        """ Sorted rows of the documents matching `filters`. """
+        mask = np.ones(self.n_documents, dtype=bool)
+        for rows in self._clauses(filters):
+            clause = np.zeros(self.n_documents, dtype=bool)
+            clause[rows] = True
+            mask &= clause
+        return np.flatnonzero(mask)
+
+    def may_match(self, filters: EventFilter) -> bool:
+        """
+        Whether some documents may match `filters`, from the bounds of the indexes
+        alone: date range, known cities and bounding box of the coordinates.
+        False means `select` is empty, True that it may not be.
+        """
+        a = self.arrays
+        if filters.start is not None and not (len(a["end"]) and a["end"][-1] >= timestamp(filters.start)):
+            return False
+        if filters.end is not None and not (len(a["begin"]) and a["begin"][0] < timestamp(filters.end)):
+            return False
+        if filters.cities and not any(fold(city).strip() in self._city_ids for city in filters.cities):
+            return False
+        if filters.near is not None:
+            lat0, lon0 = filters.near
+            south, north, west, east = self.bounds
+            dlat = np.degrees(filters.radius_km / EARTH_RADIUS_KM)
+            dlon = dlat / max(np.cos(np.radians(lat0)), 1e-6)
+            # NaN bounds (no coordinates) fail the comparisons
+            return bool(south - dlat <= lat0 <= north + dlat and west - dlon <= lon0 <= east + dlon)
+        return True
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """ South, north, west and east bounds of the coordinates, NaN without any. """
+        if self._bounds is None:
+            lat, lon = self.arrays["lat"], self.arrays["lon"]
+            located = ~(np.isnan(lat) | np.isnan(lon))
+            if located.any():
+                self._bounds = (float(lat[located].min()), float(lat[located].max()),
+                                float(lon[located].min()), float(lon[located].max()))
+            else:
+                self._bounds = (np.nan,) * 4
+        return self._bounds
+
+    def _clauses(self, filters: EventFilter):
+        """ Rows matching each condition of `filters`. """
+        a = self.arrays
+        if filters.start is not None:
+            yield a["end_rows"][np.searchsorted(a["end"], timestamp(filters.start), "left"):]
+        if filters.end is not None:
+            yield a["begin_rows"][:np.searchsorted(a["begin"], timestamp(filters.end), "left")]
+        if filters.cities:
+            ids = {self._city_ids.get(fold(city).strip()) for city in filters.cities} - {None}
+            yield np.concatenate(
+                [a["city_rows"][a["city_indptr"][i]:a["city_indptr"][i + 1]] for i in sorted(ids)] or [np.empty(0, np.int32)]
+            )
+        if filters.near is not None:
+            yield self._within(*filters.near, filters.radius_km)
+
+    def _within(self, lat0: float, lon0: float, radius_km: float) -> np.ndarray:
+        """ Rows within `radius_km` of (lat0, lon0): the grid cells of the bounding box, then the exact distance. """
+        a = self.arrays
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(np.cos(np.radians(lat0)), 1e-6)
+        low = grid_cells(np.array([lat0 - dlat]), np.array([lon0 - dlon]), self.cell_deg)[0]
+        high = grid_cells(np.array([lat0 + dlat]), np.array([lon0 + dlon]), self.cell_deg)[0]
+
+        candidates = []
+        for band in range(low // _LON_CELLS, high // _LON_CELLS + 1):
+            first = np.searchsorted(a["cells"], band * _LON_CELLS + low % _LON_CELLS, "left")
+            last = np.searchsorted(a["cells"], band * _LON_CELLS + high % _LON_CELLS, "right")
+            candidates.append(a["cell_rows"][first:last])
+        rows = np.concatenate(candidates) if candidates else np.empty(0, np.int32)
+        return rows[haversine_km(a["lat"][rows], a["lon"][rows], lat0, lon0) <= radius_km]
@@ -0,0 +1,188 @@
+"""
+HTML to text cleaning of the event descriptions.
+
+`html_to_text` streams the markup through `html.parser` and keeps the strings
+`BeautifulSoup(markup, "html.parser").get_text(separator=" ")` would keep,
+without building the tree: same tokenizer, same entity references, same
+whitespace-only strings, same strings left out (comments, scripts, styles...).
+`clean_texts` cleans a column of texts, the ones holding markup by chunks in a
+process pool (`cleaning_pool`), the others without parsing.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+import contextlib
+from html.parser import HTMLParser
+import multiprocessing
+import re
+from typing import List, Optional, Sequence
+
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+from rag_poc import config
+
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+VOID_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+PRESERVE_WHITESPACE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+# BeautifulSoup stores the strings of these tags in other classes than NavigableString, out of get_text
+STRING_CONTAINER_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+
+_DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+_HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+class _TextParser(HTMLParser):
+    """ Collects the text strings of the markup, following the tree BeautifulSoup would build. """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings: List[str] = []
+        self.data: List[str] = []
+        self.stack: List[str] = []
+        self.open_tags = {}
+        self.preserve_whitespace = 0
+        self.containers = 0
+        self.already_closed: List[str] = []
+
+    def end_data(self, kept: bool = True) -> None:
+        if not self.data:
+            return
+        text = "".join(self.data)
+        self.data = []
+        if not self.preserve_whitespace and not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        if kept:
+            self.strings.append(text)
+
+    def end_text(self) -> None:
+        self.end_data(kept=not self.containers)
+
+    def push(self, tag: str) -> None:
+        self.stack.append(tag)
+        self.open_tags[tag] = self.open_tags.get(tag, 0) + 1
+        self.preserve_whitespace += tag in PRESERVE_WHITESPACE_TAGS
+        self.containers += tag in STRING_CONTAINER_TAGS
+
+    def pop_to(self, tag: str) -> None:
+        while self.open_tags.get(tag):
+            popped = self.stack.pop()
+            self.open_tags[popped] -= 1
+            self.preserve_whitespace -= popped in PRESERVE_WHITESPACE_TAGS
+            self.containers -= popped in STRING_CONTAINER_TAGS
+            if popped == tag:
+                break
+
+    def handle_starttag(self, tag, attrs, handle_empty_element: bool = True) -> None:
+        self.end_text()
+        self.push(tag)
+        if tag in VOID_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs) -> None:
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed: bool = True) -> None:
+        if check_already_closed and tag in self.already_closed:
+            self.already_closed.remove(tag)
+        else:
+            self.end_text()
+            self.pop_to(tag)
+
+    def handle_data(self, data) -> None:
+        self.data.append(data)
+
+    def handle_charref(self, name) -> None:
+        extra = ""
+        base, reference = (16, _HEX_REFERENCE) if name[:1] in ("x", "X") else (10, _DECIMAL_REFERENCE)
+        number = name[1:] if base == 16 else name
+        try:
+            code = int(number, base)
+        except ValueError:
+            match = reference.search(number)
+            code, extra = (int(match.group(1), base), match.group(2)) if match else (None, number)
+        self.data.append(UnicodeDammit.numeric_character_reference(code)[0] if code is not None else "")
+        self.data.append(extra)
+
+    def handle_entityref(self, name) -> None:
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.data.append(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data) -> None:
+        self.end_text()
+        self.data.append(data)
+        self.end_data(kept=False)
+
+    def handle_decl(self, decl) -> None:
+        self.handle_comment(decl)
+
+    def handle_pi(self, data) -> None:
+        self.handle_comment(data)
+
+    def unknown_decl(self, data) -> None:
+        self.end_text()
+        if data.upper().startswith("CDATA["):
+            self.data.append(data[len("CDATA["):])
+            self.end_data()
+        else:
+            self.data.append(data)
+            self.end_data(kept=False)
+
+def html_to_text(markup: str) -> str:
+    """ `BeautifulSoup(markup, "html.parser").get_text(separator=" ")`, without the tree. """
+    parser = _TextParser()
+    parser.feed(markup)
+    parser.close()
+    parser.end_text()
+    return " ".join(parser.strings)
+
+def has_markup(v: str) -> bool:
+    """ Whether `v` may hold tags or references, the text of others is `v` itself. """
+    return "<" in v or "&" in v
+
+def clean_html(v: Optional[str]) -> Optional[str]:
+    """ Text of the HTML `v`, None for an empty value. Text without markup or entities is only stripped. """
+    if not v:
+        return None
+    if not has_markup(v):
+        return v.strip()
+    return html_to_text(v).strip()
+
+def _clean_chunk(texts: List[str]) -> List[Optional[str]]:
+    return [clean_html(v) for v in texts]
+
+def clean_texts(
+    texts: Sequence[Optional[str]],
+    executor: Optional[Executor] = None,
+    chunk_size: int = config.CLEAN_CHUNK_SIZE
+) -> List[Optional[str]]:
+    """
+    `clean_html` of every text, in order.
+
+    The texts holding markup are parsed by chunks of `chunk_size` in `executor`
+    (see `cleaning_pool`), or here without one. The others are only stripped.
+    """
+    cleaned: List[Optional[str]] = []
+    marked: List[int] = []
+    for v in texts:
+        if v and has_markup(v):
+            marked.append(len(cleaned))
+            cleaned.append(None)
+        else:
+            cleaned.append(clean_html(v))
+
+    chunks = [[texts[i] for i in marked[start:start + chunk_size]] for start in range(0, len(marked), chunk_size)]
+    results = executor.map(_clean_chunk, chunks) if executor is not None else map(_clean_chunk, chunks)
+    for start, chunk in zip(range(0, len(marked), chunk_size), results):
+        for i, text in zip(marked[start:start + chunk_size], chunk):
+            cleaned[i] = text
+    return cleaned
+
+def cleaning_pool(workers: int = config.CLEAN_WORKERS):
+    """
+    Context manager of the process pool of `clean_texts`, holding `workers` processes.
+    With a single worker it gives None: the texts are cleaned in the calling process.
+    """
+    if workers <= 1:
+        return contextlib.nullcontext()
+    # Spawned rather than forked: the fetch opens the pool next to its download threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
@@ -0,0 +1,201 @@
+"""
+Lexical (BM25) index of the documents, fused with the dense search by reciprocal-rank fusion.
+
+The text of a document is its page_content plus some metadata fields
+(`config.LEXICAL_FIELDS`: town, keywords), so that exact names missed by the
+embeddings still match. Texts are accent-folded, lower-cased, split in words,
+stripped of French stop words and stemmed with a light French stemmer.
+
+The index is an inverted index in CSR form, four flat arrays saved as .npy and
+memory-mapped at load:
+    terms   : sorted 64-bit hashes of the terms (uint64)
+    indptr  : postings of terms[i] are rows[indptr[i]:indptr[i + 1]] (int64)
+    rows    : row of the document in the documents table (int32)
+    weights : BM25 weight of the term in the document, idf included (float32)
+
+A query costs a binary search per term and a vectorized sum over its postings.
+"""
+from collections import Counter
+from functools import lru_cache
+from hashlib import blake2b
+import json
+import pathlib
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+LEXICAL_FOLDER = "lexical"
+ARRAYS = ("terms", "indptr", "rows", "weights")
+META_FILE = "lexical.json"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "oe", "æ": "ae", "Æ": "ae", "’": "'"})
+
+STOP_WORDS = frozenset("""
+a ai au aux avec ce ces cet cette ci dans de des du elle en est et etc il ils je la le les leur leurs
+lui ma mais me meme mes moi mon ne nos notre nous on ou par pas plus pour qu que qui sa se ses son
+sont sur ta te tes toi ton tu un une vos votre vous y
+""".split())
+
+# Longest first: the first matching suffix is removed
+_SUFFIXES = (
+    "issements", "issement", "atrices", "ements", "ations", "ateurs", "atrice",
+    "ement", "ation", "ateur", "euses", "euse", "eurs", "eur", "ique", "isme", "iste",
+    "ites", "ite", "ives", "ive", "ifs", "if", "ees", "ee", "er", "ez", "es", "e",
+)
+
+def fold(text: str) -> str:
+    """ Lower-case `text` and remove its accents: "Théâtre Œuvre" -> "theatre oeuvre". """
+    text = unicodedata.normalize("NFKD", text.translate(_LIGATURES))
+    return text.encode("ascii", "ignore").decode("ascii").lower()
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """
+    Light French stemmer of a folded word: plural, then one inflectional or
+    derivational suffix, keeping a stem of at least 4 letters.
+    "chanteuses", "chanteur", "chanter" -> "chant"; "festivaux" -> "festival".
+    """
+    if len(word) < 5 or not word.isalpha():
+        return word
+    if word.endswith("aux"):
+        word = word[:-3] + "al"
+    elif word.endswith(("s", "x")):
+        word = word[:-1]
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 4 and word[-1] == word[-2]:  # "musicienn" -> "musicien"
+        word = word[:-1]
+    return word
+
+def analyze(text: str) -> List[str]:
+    """ The terms of `text`: folded, tokenized, without stop words, stemmed. """
+    return [stem(token) for token in _TOKEN.findall(fold(text)) if token not in STOP_WORDS and len(token) > 1]
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def document_texts(documents: pa.Table, fields: Sequence[str]) -> List[str]:
+    """ The indexed text of each row of `documents`: page_content and the `fields` present. """
+    columns = [documents.column("page_content").to_pylist()]
+    for field in fields:
+        if field in documents.column_names:
+            columns.append([
+                " ".join(filter(None, value)) if isinstance(value, list) else (value or "")
+                for value in documents.column(field).to_pylist()
+            ])
+    return [" ".join(filter(None, parts)) for parts in zip(*columns)]
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the rows of a documents table, see the module docstring.
+
+    Parameters:
+        terms, indptr, rows, weights: The CSR arrays of the index.
+        n_documents: Number of rows of the indexed table.
+    """
+
+    def __init__(self, terms: np.ndarray, indptr: np.ndarray, rows: np.ndarray, weights: np.ndarray, n_documents: int):
+        self.terms = terms
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+        self.n_documents = n_documents
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "LexicalIndex":
+        """ Index `texts`, the text of each row in order, with the BM25 parameters `k1` and `b`. """
+        vocabulary: Dict[str, int] = {}
+        term_ids, rows, tfs, lengths = [], [], [], []
+        for row, text in enumerate(texts):
+            tokens = analyze(text)
+            counts = Counter(tokens)
+            term_ids.extend(vocabulary.setdefault(term, len(vocabulary)) for term in counts)
+            tfs.extend(counts.values())
+            rows.extend([row] * len(counts))
+            lengths.append(len(tokens))
+
+        n_documents = len(lengths)
+        hashes = np.fromiter((term_hash(term) for term in vocabulary), dtype=np.uint64, count=len(vocabulary))
+        order = np.argsort(hashes, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+        rows = np.asarray(rows, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        postings = np.lexsort((rows, term_ids))
+        term_ids, rows, tfs = term_ids[postings], rows[postings], tfs[postings]
+
+        df = np.bincount(term_ids, minlength=len(order))
+        indptr = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        lengths = np.asarray(lengths, dtype=np.float32)
+        norms = k1 * (1 - b + b * lengths / (lengths.mean() if n_documents else 1.0))
+        idf = np.log1p((n_documents - df + 0.5) / (df + 0.5))
+        weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norms[rows])).astype(np.float32)
+        return cls(hashes[order], indptr, rows, weights, n_documents)
+
+    @classmethod
+    def load(cls, folder: pathlib.Path, mmap: bool = True) -> "LexicalIndex":
+        """ Open the index saved in `folder` (a store version folder), memory-mapped with `mmap`. """
+        folder = pathlib.Path(folder) / LEXICAL_FOLDER
+        meta = json.loads((folder / META_FILE).read_text(encoding="utf-8"))
+        arrays = [np.load(folder / f"{name}.npy", mmap_mode="r" if mmap else None) for name in ARRAYS]
+        return cls(*arrays, meta["documents"])
+
+    def save(self, folder: pathlib.Path, meta: Dict[str, Any]) -> None:
+        folder = pathlib.Path(folder) / LEXICAL_FOLDER
+        folder.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(folder / f"{name}.npy", getattr(self, name))
+        (folder / META_FILE).write_text(json.dumps({**meta, "documents": self.n_documents}), encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def search(self, query: str, k: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows and BM25 scores of the `k` best matches of `query`, best first;
+        rows without any term, or not in `rows` when given, are left out.
+        """
+        hashes = np.unique(np.fromiter((term_hash(term) for term in analyze(query)), dtype=np.uint64))
+        positions = np.searchsorted(self.terms, hashes)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == hashes[found]
+        positions = positions[found]
+
+        scores = np.zeros(self.n_documents, dtype=np.float32)
+        for position in positions:
+            start, end = self.indptr[position], self.indptr[position + 1]
+            scores[self.rows[start:end]] += self.weights[start:end]  # a row appears once per term
+        if rows is not None:
+            allowed = np.zeros(self.n_documents, dtype=bool)
+            allowed[rows] = True
+            scores[~allowed] = 0.0
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return matches, scores[matches]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse several rankings (best first) of the same items: an item scores
+    sum(1 / (k + rank)) over the rankings it appears in, rank starting at 1.
+
+    Returns:
+        (item, score) pairs, best first; ties keep the order of the first rankings.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[int(item)] = scores.get(int(item), 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
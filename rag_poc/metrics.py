@@ -0,0 +1,180 @@
+"""
+Lightweight instrumentation of the pipeline: timed spans and counters.
+
+A span adds the milliseconds of its block to the histogram of its name, a
+counter adds up values. Everything is off by default (`config.METRICS_ENABLED`):
+`span` then returns a shared no-op context manager and `count` returns at once,
+the cost of a function call. `enable()` turns them on for the process, e.g.
+`python -m run --metrics metrics.json <command>`.
+
+Spans of the pipeline:
+    fetch : fetch_http, validate, html_clean, parquet_write
+    index : embed_batch, faiss_add
+    query : query_embed, query_search (FAISS and BM25), query_rerank, query_retrieval (API), prompt_build,
+            query_ttft (time to the first token), query_generate
+Counters: fetched_records, rejected_records, embedded_texts, searched_queries, generated_chunks.
+The query spans are the `timings` of rag_poc.retrieval and scripts/serve.py.
+
+The spans of the processes of a pool are not collected: `html_clean` times the
+whole cleaning of a batch, in the calling process.
+
+The metrics are exported in the Prometheus text format (`render_prometheus`,
+served at /metrics by scripts/serve.py) or as JSON (`save`), with the
+approximate p50 / p95 / p99 of each histogram.
+
+`profiling` records a cProfile of a block (`python -m run --profile <command>`):
+deterministic, of the calling thread only, and with an overhead of its own.
+"""
+from bisect import bisect_left
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pathlib
+import pstats
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from rag_poc import config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "rag_poc_"
+
+_lock = threading.Lock()
+_enabled = config.METRICS_ENABLED
+_histograms: Dict[str, "Histogram"] = {}
+_counters: Dict[str, float] = {}
+_noop = contextlib.nullcontext()
+
+class Histogram:
+    """ Count, sum and bucket counts of the milliseconds observed under a name, buckets bounded by `bounds`. """
+
+    def __init__(self, bounds: Sequence[float] = config.METRICS_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Upper bound of the bucket holding the `q` quantile, None without observations or beyond the last bound. """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.name, 1000 * (time.perf_counter() - self.start))
+
+def enable(enabled: bool = True) -> None:
+    """ Turn the metrics of the process on (or off), keeping those already recorded. """
+    global _enabled
+    _enabled = enabled
+
+def enabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    """ Drop the recorded metrics. """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def span(name: str):
+    """ Context manager timing its block in the histogram `name`, a no-op when disabled. """
+    return _Span(name) if _enabled else _noop
+
+def observe(name: str, ms: float) -> None:
+    """ Add `ms` milliseconds to the histogram `name`. """
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(ms)
+
+def count(name: str, value: float = 1) -> None:
+    """ Add `value` to the counter `name`. """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def snapshot() -> Dict[str, Any]:
+    """ The counters and the histograms (count, sum, mean and quantiles in ms) recorded so far. """
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "histograms": {
+                name: {
+                    "count": h.count, "sum_ms": round(h.sum, 3), "mean_ms": round(h.sum / h.count, 3),
+                    "p50_ms": h.quantile(0.5), "p95_ms": h.quantile(0.95), "p99_ms": h.quantile(0.99),
+                }
+                for name, h in sorted(_histograms.items())
+            },
+        }
+
+def render_prometheus() -> str:
+    """ The metrics in the Prometheus text exposition format. """
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines += [f"# TYPE {PREFIX}{name}_total counter", f"{PREFIX}{name}_total {value:g}"]
+        for name, h in sorted(_histograms.items()):
+            metric = f"{PREFIX}{name}_ms"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(h.bounds, h.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+            lines += [f"{metric}_sum {h.sum:.3f}", f"{metric}_count {h.count}"]
+    return "\n".join(lines) + "\n"
+
+def save(path: pathlib.Path) -> None:
+    """ Write the `snapshot` to `path`, or the Prometheus text if its suffix is .prom. """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.tmp")
+    if path.suffix == ".prom":
+        tmp_file.write_text(render_prometheus(), encoding="utf-8")
+    else:
+        tmp_file.write_text(json.dumps(snapshot(), indent=2), encoding="utf-8")
+    os.replace(tmp_file, path)
+
+@contextlib.contextmanager
+def profiling(path: pathlib.Path, top: int = 20):
+    """ Profile the block with cProfile, write the stats to `path` and log its `top` functions by cumulative time. """
+    path = pathlib.Path(path)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top)
+        logger.info("Profile written to '%s' (`python -m pstats %s`):\n%s", path, path, summary.getvalue())
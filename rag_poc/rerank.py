@@ -0,0 +1,162 @@
+"""
+Second retrieval stage: rerank the over-fetched candidates, keep the top k.
+
+The first stage (FAISS, or the hybrid search) returns `config.RERANK_CANDIDATES`
+candidates; a reranker scores them against the query, all on CPU and offline:
+    - lexical       : share of the query terms found in the candidate (rag_poc.lexical analyzer)
+    - mmr           : maximal marginal relevance, relevance to the query traded
+                      against the similarity to the candidates already kept
+    - cross-encoder : a local cross-encoder model scoring (query, candidate) pairs,
+                      optional dependency `sentence-transformers`
+
+The candidates of several queries are scored together: one matrix product per
+query for MMR, one model call for all the pairs of a batch for the cross-encoder.
+"""
+from abc import ABC, abstractmethod
+import logging
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+import numpy as np
+
+from rag_poc import config
+from rag_poc.lexical import analyze
+from rag_poc.vector_store import faiss_id
+
+logger = logging.getLogger(__name__)
+
+RERANKERS = ("lexical", "mmr", "cross-encoder")
+
+Results = List[Tuple[Document, float]]
+
+class Reranker(ABC):
+    """ Reorder the candidates of queries, best first, with a reranking score (higher is better). """
+
+    def rerank_many(self, queries: Sequence[str], query_vectors: np.ndarray, candidates: Sequence[Results], store, k: int) -> List[Results]:
+        """
+        The `k` best of the `candidates` of each query.
+
+        Parameters:
+            queries: The query texts.
+            query_vectors: The (n, dim) embeddings of the queries.
+            candidates: The first stage results of each query, best first.
+            store: The VectorStore of the candidates, for their vectors.
+            k: Number of results to keep per query.
+        """
+        return [
+            self.rerank(query, vector, results, store, k)
+            for query, vector, results in zip(queries, query_vectors, candidates)
+        ]
+
+    @abstractmethod
+    def rerank(self, query: str, query_vector: np.ndarray, candidates: Results, store, k: int) -> Results:
+        """ The `k` best of the `candidates` of one query. """
+
+class LexicalReranker(Reranker):
+    """ Share of the distinct query terms present in the candidate; ties keep the first stage order. """
+
+    def rerank(self, query, query_vector, candidates, store, k):
+        terms = set(analyze(query))
+        if not terms or not candidates:
+            return list(candidates[:k])
+        scores = np.array([len(terms.intersection(analyze(doc.page_content))) / len(terms) for doc, _ in candidates])
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(candidates[i][0], float(scores[i])) for i in order]
+
+class MMRReranker(Reranker):
+    """
+    Maximal marginal relevance: each pick maximizes
+    `diversity * sim(query, d) - (1 - diversity) * max sim(d, picked)`, cosine similarities.
+
+    Parameters:
+        diversity: Weight of the relevance, 1 keeps the first stage order by similarity.
+    """
+
+    def __init__(self, diversity: float = config.RERANK_MMR_LAMBDA):
+        self.diversity = diversity
+
+    def rerank(self, query, query_vector, candidates, store, k):
+        if not candidates:
+            return []
+        vectors = store.get_vectors([faiss_id(doc.id) for doc, _ in candidates])
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        relevance = vectors @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+        similarity = vectors @ vectors.T
+
+        picked: List[int] = []
+        scores: List[float] = []
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        for _ in range(min(k, len(candidates))):
+            mmr = self.diversity * relevance - (1 - self.diversity) * np.maximum(redundancy, 0.0)
+            mmr[picked] = -np.inf
+            best = int(np.argmax(mmr))
+            picked.append(best)
+            scores.append(float(mmr[best]))
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [(candidates[i][0], score) for i, score in zip(picked, scores)]
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores the (query, candidate text) pairs with a local cross-encoder, in
+    batches of `batch_size` pairs. Once `budget_ms` is spent, the remaining
+    candidates are not scored and keep their first stage order after the scored ones.
+
+    Raises:
+        ImportError if `sentence-transformers` is not installed.
+    """
+
+    def __init__(
+        self,
+        model: str = config.RERANK_MODEL,
+        batch_size: int = config.RERANK_BATCH_SIZE,
+        budget_ms: Optional[float] = config.RERANK_BUDGET_MS,
+        max_chars: int = 2000
+    ):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("The cross-encoder reranker needs `pip install sentence-transformers`.") from e
+        self.model = CrossEncoder(model, device="cpu")
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.max_chars = max_chars
+
+    def rerank_many(self, queries, query_vectors, candidates, store, k):
+        # Pairs in first stage rank order across the queries, so a spent budget cuts the lowest ranks
+        pairs = sorted((i, q) for q, results in enumerate(candidates) for i in range(len(results)))
+        scores = [np.full(len(results), -np.inf, dtype=np.float32) for results in candidates]
+        start = time.perf_counter()
+        for first in range(0, len(pairs), self.batch_size):
+            if self.budget_ms is not None and first and 1000 * (time.perf_counter() - start) > self.budget_ms:
+                logger.info("Rerank budget spent: %i of %i candidates scored.", first, len(pairs))
+                break
+            batch = pairs[first:first + self.batch_size]
+            texts = [(queries[q], candidates[q][i][0].page_content[:self.max_chars]) for i, q in batch]
+            for (i, q), score in zip(batch, self.model.predict(texts, batch_size=self.batch_size)):
+                scores[q][i] = score
+
+        reranked = []
+        for results, result_scores in zip(candidates, scores):
+            order = np.argsort(-result_scores, kind="stable")[:k]
+            # Unscored candidates get the lowest score, in JSON they could not be -inf
+            scored = result_scores[np.isfinite(result_scores)]
+            result_scores[~np.isfinite(result_scores)] = scored.min() if len(scored) else 0.0
+            reranked.append([(results[i][0], float(result_scores[i])) for i in order])
+        return reranked
+
+    def rerank(self, query, query_vector, candidates, store, k):
+        return self.rerank_many([query], [query_vector], [candidates], store, k)[0]
+
+def create_reranker(name: Optional[str] = config.RERANKER) -> Optional[Reranker]:
+    """ The reranker `name` (see RERANKERS), or None for no reranking. """
+    if name is None:
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "mmr":
+        return MMRReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker()
+    raise ValueError(f"Unknown reranker '{name}', expected one of {RERANKERS}.")
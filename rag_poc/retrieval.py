@@ -0,0 +1,385 @@
+"""
+Retrieval and generation setup shared by the apps.
+
+The clients, the embeddings and the vector store are process-wide resources:
+they are created once, on first use, and reused by every Streamlit rerun and
+session. The vector store is reopened only when the manifest of the store
+folder changes on disk (a new `index` run), so a rerun costs the query alone.
+
+With `config.RERANKER`, the search is two-stage: the `config.RERANK_CANDIDATES`
+best documents are reranked (rag_poc.rerank) and the k best kept. The search
+functions fill an optional `timings` dict with the milliseconds of each stage.
+
+On a chunked store, `config.CHUNK_OVERFETCH` chunks are searched per event asked
+for (more when they are not enough), and collapsed to distinct events
+(`VectorStore.parent_documents`), so the prompt and `format_context_markdown`
+get whole events, each one once.
+
+A sharded store (rag_poc.sharding) is searched through the same calls, routed
+to the shards matching the filters and fanned out to them.
+
+`stream_recommendation` retrieves the events first and streams the answer
+afterwards, recording the time to first token and the generation time.
+"""
+from contextlib import contextmanager
+from functools import lru_cache
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from langchain.schema import Document
+from langchain_mistralai import MistralAIEmbeddings
+from langchain_mistralai.chat_models import ChatMistralAI
+import numpy as np
+
+from rag_poc import config, metrics
+from rag_poc.answer_cache import AnswerCache, CachedAnswer, answer_context, create_answer_cache
+from rag_poc.embedding_cache import CachedEmbeddings, EmbeddingCache
+from rag_poc.filters import EventFilter
+from rag_poc.rerank import Reranker, create_reranker
+from rag_poc.sharding import ShardedStore, read_layout
+from rag_poc.vector_store import MANIFEST_FILE, VectorStore
+
+logger = logging.getLogger(__name__)
+
+_store_lock = threading.Lock()
+_stores: dict = {}
+
+@lru_cache(maxsize=None)
+def get_api_key() -> str:
+    return config.load_api_key()
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> CachedEmbeddings:
+    return CachedEmbeddings(
+        MistralAIEmbeddings(api_key=get_api_key(), model=config.EMBEDDING_MODEL),
+        EmbeddingCache(config.QUERY_EMBEDDING_CACHE_FOLDER, config.EMBEDDING_MODEL)
+    )
+
+@lru_cache(maxsize=16)
+def get_chat_model(temperature: float) -> ChatMistralAI:
+    model = ChatMistralAI(temperature=temperature, api_key=get_api_key())
+    # Remove obselete attribute 'language' from the model
+    if hasattr(model, "language"):
+        model.language = None
+    return model
+
+@lru_cache(maxsize=None)
+def get_answer_cache() -> Optional[AnswerCache]:
+    return create_answer_cache(config.ANSWER_CACHE_BACKEND)
+
+@lru_cache(maxsize=None)
+def get_reranker() -> Optional[Reranker]:
+    return create_reranker(config.RERANKER)
+
+def get_vector_store(folder: Optional[pathlib.Path] = None) -> Union[VectorStore, ShardedStore]:
+    """
+    The vector store of `folder` (default `config.VECTORS_FOLDER`), opened once
+    per process and reopened when its manifest is replaced. A sharded store is
+    opened shard by shard, so rebuilding a shard reopens only that one.
+    """
+    folder = pathlib.Path(folder or config.VECTORS_FOLDER)
+    layout = read_layout(folder)
+    if layout is None:
+        return _open_store(folder)
+    shards = {name: _open_store(folder / path) for name, path in layout["shards"].items()}
+    return ShardedStore(layout, shards, get_embeddings())
+
+def _open_store(folder: pathlib.Path) -> VectorStore:
+    try:
+        stat = os.stat(folder / MANIFEST_FILE)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        key = None
+
+    with _store_lock:
+        cached = _stores.get(folder)
+        if cached is None or cached[0] != key:
+            store = VectorStore.load(folder, get_embeddings())
+            _stores[folder] = cached = (key, store)
+            logger.info("Vector store version %s loaded from '%s'.", store.version, folder)
+        return cached[1]
+
+def clear_caches() -> None:
+    """ Drop every cached resource, they are recreated on next use. """
+    with _store_lock:
+        _stores.clear()
+    for cached in (get_api_key, get_embeddings, get_chat_model, get_answer_cache, get_reranker):
+        cached.cache_clear()
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str):
+    """
+    Add the milliseconds spent in the block to `timings[stage]`, if `timings` is
+    given, and to the histogram "query_<stage>" of rag_poc.metrics.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = 1000 * (time.perf_counter() - start)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + ms
+        metrics.observe(f"query_{stage[:-3]}", ms)
+
+def search(
+    query: str,
+    k: int = 3,
+    vector: Optional[Sequence[float]] = None,
+    filters: Optional[EventFilter] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Top-`k` documents of `query` matching `filters`, and their scores: the hybrid
+    (dense + BM25) search and fusion scores with `config.HYBRID_SEARCH`, else the
+    dense search and distances; with a reranker, the reranking scores.
+    `timings` receives the embed_ms, search_ms and rerank_ms of the query.
+    """
+    store = get_vector_store()
+    reranker = get_reranker()
+    n_results = k * config.CHUNK_OVERFETCH if store.chunking else k
+    metrics.count("searched_queries")
+
+    if vector is None:
+        with timed(timings, "embed_ms"):
+            vector = store.embeddings.embed_query(query)
+    while True:
+        n_candidates = max(n_results, config.RERANK_CANDIDATES) if reranker is not None else n_results
+        with timed(timings, "search_ms"):
+            if config.HYBRID_SEARCH:
+                results = store.hybrid_search_with_score(query, n_candidates, vector=vector, filters=filters)
+            else:
+                results = store.similarity_search_with_score_by_vector(vector, n_candidates, filters)
+        if reranker is not None:
+            with timed(timings, "rerank_ms"):
+                results = reranker.rerank(query, np.asarray(vector, dtype=np.float32), results, store, n_results)
+        found = store.parent_documents(results, k)
+        # The chunks of a few long events can fill the results: search deeper until k events are found
+        if len(found) == k or len(results) < n_results or n_results >= len(store):
+            return found
+        n_results *= 2
+
+def retrieve(query: str, k: int = 3, filters: Optional[EventFilter] = None) -> List[Document]:
+    return [doc for doc, _ in search(query, k, filters=filters)]
+
+def search_many(
+    queries: Sequence[str],
+    k: int = 3,
+    timings: Optional[Dict[str, float]] = None
+) -> List[List[Tuple[Document, float]]]:
+    """ `search` of several queries, embedded, searched and reranked as one batch. """
+    store = get_vector_store()
+    reranker = get_reranker()
+    n_results = k * config.CHUNK_OVERFETCH if store.chunking else k
+    metrics.count("searched_queries", len(queries))
+
+    with timed(timings, "embed_ms"):
+        vectors = np.asarray(store.embeddings.embed_documents(list(queries)), dtype=np.float32)
+    while True:
+        n_candidates = max(n_results, config.RERANK_CANDIDATES) if reranker is not None else n_results
+        with timed(timings, "search_ms"):
+            if config.HYBRID_SEARCH:
+                results = store.batch_hybrid_search_with_score(queries, n_candidates, vectors=vectors)
+            else:
+                results = store.batch_similarity_search_with_score(queries, n_candidates, vectors)
+        if reranker is not None:
+            with timed(timings, "rerank_ms"):
+                results = reranker.rerank_many(queries, vectors, results, store, n_results)
+        found = [store.parent_documents(chunks, k) for chunks in results]
+        if all(len(f) == k or len(r) < n_results for f, r in zip(found, results)) or n_results >= len(store):
+            return found
+        n_results *= 2
+
+def build_prompt(input_text: str, docs: List[Document]) -> str:
+    with metrics.span("prompt_build"):
+        return _build_prompt(input_text, docs)
+
+def _build_prompt(input_text: str, docs: List[Document]) -> str:
+    context = "\n\n".join(
+        f"""
+        📌 **{doc.metadata.get('title_fr', 'Titre inconnu')}**\n
+        📅 Date : {doc.metadata.get('daterange_fr', 'Inconnue')}\n
+        🔗 Lien : {doc.metadata.get('canonicalurl', 'Non disponible')}\n\n
+
+        {doc.page_content}
+        """ for doc in docs
+    )
+
+    return f"""
+    Tu es un assistant intelligent qui aide à recommander des événements à partir de leurs descriptions.
+
+    Voici une liste d'événements susceptible d'intéresser l'utilisateur :
+
+    ---------------------
+    {context}
+    ---------------------
+
+    En te basant uniquement sur ces événements, pas tes connaissances antérieures, réponds à la question suivante en français :
+    **{input_text}**
+
+    Ta réponse doit être concise, utile et faire référence aux événements les plus pertinents (pas besoin de recopier les descriptions, elles sont déjà affichées à l'utilisateur).
+
+    Si les événements qui sont dans ta liste ne semblent pas correspondre, ou si la question qui est posé n'est pas pertinente pour un assistant de recommandation d'événements,
+    précise ta mission, et invite les utilisateurs à reposer leur question.
+    """
+
+def generate(prompt: str, temperature: float = 0.7) -> str:
+    return get_chat_model(temperature).invoke(prompt).content
+
+class Recommendation(NamedTuple):
+    answer: str
+    documents: List[Document]
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = None
+
+class StreamingRecommendation:
+    """
+    A recommendation whose events are already retrieved and whose answer is
+    generated while it is iterated, chunk by chunk (see `stream_recommendation`).
+
+    Parameters:
+        documents: The retrieved events, available before the generation starts.
+        chunks: The chunks of the answer.
+        cached: Whether the answer comes from the answer cache.
+        timings: Milliseconds of each stage, completed by the generation.
+    """
+
+    def __init__(self, documents: List[Document], chunks: Iterator[str], cached: bool = False, timings: Optional[Dict[str, float]] = None):
+        self.documents = documents
+        self.cached = cached
+        self.timings = timings
+        self.answer: Optional[str] = None
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[str]:
+        """ The chunks of the answer; `answer` holds the whole text once they are all read. """
+        parts = []
+        for chunk in self._chunks:
+            parts.append(chunk)
+            yield chunk
+        self.answer = "".join(parts)
+
+def _prepare_answer(
+    input_text: str,
+    k: int,
+    temperature: float,
+    cache: Optional[AnswerCache],
+    filters: Optional[EventFilter],
+    timings: Dict[str, float]
+) -> tuple:
+    """ The query vector, the answer cache context, and the cache hit or else the retrieved events of a recommendation. """
+    vector, context, hit = lookup_answer(input_text, k, temperature, cache, filters, timings)
+    if hit is not None:
+        return vector, context, hit, hit.documents
+
+    docs = [doc for doc, _ in search(input_text, k, vector=vector, filters=filters, timings=timings)]
+    return vector, context, None, docs
+
+def lookup_answer(
+    input_text: str,
+    k: int,
+    temperature: float,
+    cache: Optional[AnswerCache],
+    filters: Optional[EventFilter] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> Tuple[List[float], str, Optional[CachedAnswer]]:
+    """
+    The query vector, the answer cache context of a recommendation, and the
+    cached answer of a near-identical question, None on a miss or without `cache`.
+    """
+    store = get_vector_store()
+    with timed(timings, "embed_ms"):
+        vector = store.embeddings.embed_query(input_text)
+    context = answer_context(store.version, temperature, k, filters, config.RERANKER)
+
+    hit = cache.get(vector, context) if cache is not None else None
+    if hit is not None:
+        logger.info("Answer cache hit (similarity %.3f, hit rate %.0f%%).", hit.similarity, 100 * cache.hit_rate)
+    return vector, context, hit
+
+def recommend(
+    input_text: str,
+    k: int = 3,
+    temperature: float = 0.7,
+    cache: Optional[AnswerCache] = None,
+    filters: Optional[EventFilter] = None
+) -> Recommendation:
+    """
+    Retrieve the `k` closest events to `input_text` matching `filters` and generate
+    the answer. With a `cache`, the answer of a near-identical question asked with
+    the same store version, settings and filters is returned instead.
+    The milliseconds of each stage are in the `timings` of the recommendation.
+    """
+    timings: Dict[str, float] = {}
+    vector, context, hit, docs = _prepare_answer(input_text, k, temperature, cache, filters, timings)
+    if hit is not None:
+        return Recommendation(hit.answer, docs, cached=True, timings=timings)
+
+    with timed(timings, "generate_ms"):
+        answer = generate(build_prompt(input_text, docs), temperature)
+
+    if cache is not None:
+        cache.put(input_text, vector, context, answer, docs)
+    logger.info("Recommendation timings: %s", format_timings(timings))
+    return Recommendation(answer, docs, timings=timings)
+
+def stream_recommendation(
+    input_text: str,
+    k: int = 3,
+    temperature: float = 0.7,
+    cache: Optional[AnswerCache] = None,
+    filters: Optional[EventFilter] = None
+) -> StreamingRecommendation:
+    """
+    `recommend`, with the answer streamed: the events are retrieved (or the
+    cached answer found) by this call, and the answer is generated while the
+    returned recommendation is iterated. The generation adds to the timings the
+    time to the first token (ttft_ms) and the whole generation time (generate_ms);
+    the complete answer is cached at the end of the stream.
+    """
+    timings: Dict[str, float] = {}
+    vector, context, hit, docs = _prepare_answer(input_text, k, temperature, cache, filters, timings)
+    if hit is not None:
+        return StreamingRecommendation(docs, iter([hit.answer]), cached=True, timings=timings)
+
+    def generation() -> Iterator[str]:
+        parts = []
+        start = time.perf_counter()
+        for chunk in get_chat_model(temperature).stream(build_prompt(input_text, docs)):
+            if not chunk.content:
+                continue
+            if not parts:
+                timings["ttft_ms"] = 1000 * (time.perf_counter() - start)
+                metrics.observe("query_ttft", timings["ttft_ms"])
+            parts.append(chunk.content)
+            yield chunk.content
+        timings["generate_ms"] = 1000 * (time.perf_counter() - start)
+        metrics.observe("query_generate", timings["generate_ms"])
+        metrics.count("generated_chunks", len(parts))
+
+        if cache is not None:
+            cache.put(input_text, vector, context, "".join(parts), docs)
+        logger.info("Recommendation timings: %s", format_timings(timings))
+
+    return StreamingRecommendation(docs, generation(), timings=timings)
+
+def format_timings(timings: Dict[str, float]) -> str:
+    """ "embed 12 ms · search 3 ms · ..." of the `timings` of a request. """
+    return " · ".join(f"{stage[:-3]} {ms:.0f} ms" for stage, ms in timings.items())
+
+def format_context_markdown(docs: List[Document]) -> str:
+    blocks = []
+    for doc in docs:
+        url = doc.metadata.get("canonicalurl", "")
+        desc = doc.page_content.strip()
+
+        block = f"""
+**Lien**: [{url}]({url})  
+
+{desc}
+"""
+        blocks.append(block)
+    return "\n---\n".join(blocks)
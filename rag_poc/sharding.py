@@ -0,0 +1,277 @@
+"""
+Sharded vector store: one store per region (or per month), searched in parallel.
+
+Layout of a sharded store folder:
+    shards.json     : format, shard key ("region" or "month") and folder of each shard
+    shard-<name>/   : a vector store folder (see rag_poc.vector_store) of the events of the shard
+
+Each shard is a complete store, with its own manifest and versions, so it is
+built, updated or rebuilt on its own (`index --shard-by region --shards Bretagne`).
+
+`ShardedStore` has the search interface of `VectorStore`. A search is routed to
+the shards whose metadata may match its filters (`MetadataIndex.may_match`:
+dates, cities, distance), fanned out to them in a thread pool (FAISS and NumPy
+release the GIL) and the results merged: dense results by distance; hybrid
+results by fusing the merged dense and BM25 rankings of the shards, the BM25
+scores of a shard using the statistics of its own events.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+import json
+import os
+import pathlib
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+import numpy as np
+
+from rag_poc import config
+from rag_poc.filters import EventFilter
+from rag_poc.lexical import fold, reciprocal_rank_fusion
+from rag_poc.vector_store import VectorStore, best_chunks, parent_results
+
+SHARDS_FILE = "shards.json"
+FORMAT_VERSION = 1
+# Rows of the shards are fused under the key shard number << _ROW_BITS | row
+_ROW_BITS = 32
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def shard_folder(name: str) -> str:
+    """ Folder of the shard `name` in the store folder: "Île-de-France" -> "shard-ile-de-france". """
+    slug = re.sub(r"[^a-z0-9]+", "-", fold(name)).strip("-")
+    return f"shard-{slug or blake2b(name.encode('utf-8'), digest_size=4).hexdigest()}"
+
+def read_layout(folder: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """ The shards file of `folder`, None if the store there is not sharded. """
+    path = pathlib.Path(folder) / SHARDS_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_layout(folder: pathlib.Path, shard_by: str, shards: Dict[str, str]) -> Dict[str, Any]:
+    """ Replace atomically the shards file of `folder` by the `shards` (name -> folder) keyed by `shard_by`. """
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    layout = {"format": FORMAT_VERSION, "shard_by": shard_by, "shards": dict(sorted(shards.items()))}
+    tmp_file = folder / f".{SHARDS_FILE}.tmp"
+    tmp_file.write_text(json.dumps(layout, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_file, folder / SHARDS_FILE)
+    return layout
+
+def search_executor() -> ThreadPoolExecutor:
+    """ The thread pool of the fan-out searches, shared by the process. """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.SHARD_SEARCH_THREADS, thread_name_prefix="shard-search")
+        return _executor
+
+class ShardedStore:
+    """
+    The shards of a sharded store folder, searched as one store, see the module docstring.
+
+    Parameters:
+        layout: The shards file of the store.
+        shards: The opened store of each shard, by name.
+        embeddings: LangChain embeddings used to embed the text queries.
+    """
+
+    def __init__(self, layout: Dict[str, Any], shards: Dict[str, VectorStore], embeddings=None):
+        self.layout = layout
+        self.shards = shards
+        self.embeddings = embeddings
+        self._stores = list(shards.values())
+        digest = blake2b(digest_size=16)
+        for name, store in sorted(shards.items()):
+            digest.update(f"{name}\0{store.version}\n".encode("utf-8"))
+        self._version = digest.hexdigest()
+
+    @classmethod
+    def load(cls, folder: pathlib.Path, embeddings=None, mmap: bool = True) -> "ShardedStore":
+        """
+        Open every shard of the sharded store in `folder`.
+
+        Raises:
+            FileNotFoundError if there is no sharded store in `folder`.
+        """
+        layout = read_layout(folder)
+        if layout is None:
+            raise FileNotFoundError(f"No shards file in '{folder}', run the `index` command with `--shard-by`.")
+        shards = {
+            name: VectorStore.load(pathlib.Path(folder) / path, embeddings, mmap)
+            for name, path in layout["shards"].items()
+        }
+        return cls(layout, shards, embeddings)
+
+    @property
+    def version(self) -> str:
+        """ Hash of the versions of the shards, changed by the rebuild of any of them. """
+        return self._version
+
+    @property
+    def shard_by(self) -> str:
+        return self.layout["shard_by"]
+
+    @property
+    def chunking(self) -> Optional[Dict[str, int]]:
+        return next((store.chunking for store in self._stores if store.chunking), None)
+
+    def __len__(self) -> int:
+        return sum(len(store) for store in self._stores)
+
+    @property
+    def cities(self) -> List[str]:
+        return sorted({city for store in self._stores for city in store.cities})
+
+    # ------ routing ------
+
+    def route(self, filters: Optional[EventFilter] = None) -> List[VectorStore]:
+        """ The shards where some events may match `filters`, all of them without filters. """
+        if not filters:
+            return self._stores
+        return [
+            store for store in self._stores
+            if store.metadata_index is None or store.metadata_index.may_match(filters)
+        ]
+
+    def _map(self, fn: Callable[[VectorStore], Any], stores: Sequence[VectorStore]) -> List[Any]:
+        """ `fn` of each store, in the search thread pool when there are several. """
+        if len(stores) <= 1:
+            return [fn(store) for store in stores]
+        return list(search_executor().map(fn, stores))
+
+    # ------ search ------
+
+    def similarity_search_with_score_by_vector(
+        self,
+        vector,
+        k: int = 4,
+        filters: Optional[EventFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """ The `k` closest documents to `vector` of the shards and their distances, among those matching `filters`. """
+        results = self._map(lambda store: store.similarity_search_with_score_by_vector(vector, k, filters), self.route(filters))
+        return sorted((pair for shard in results for pair in shard), key=lambda pair: pair[1])[:k]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filters: Optional[EventFilter] = None) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k, filters)
+
+    def similarity_search(self, query: str, k: int = 4, filters: Optional[EventFilter] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filters)]
+
+    def batch_similarity_search_with_score(
+        self,
+        queries: Sequence[str],
+        k: int = 4,
+        vectors: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """ `VectorStore.batch_similarity_search_with_score` over every shard. """
+        if vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+        results = self._map(lambda store: store.batch_similarity_search_with_score(queries, k, vectors), self._stores)
+        return [
+            sorted((pair for shard in results for pair in shard[i]), key=lambda pair: pair[1])[:k]
+            for i in range(len(queries))
+        ]
+
+    def hybrid_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        vector: Optional[Sequence[float]] = None,
+        candidates: int = config.HYBRID_CANDIDATES,
+        filters: Optional[EventFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """ `VectorStore.hybrid_search_with_score` over the shards routed by `filters`. """
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+        vectors = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        return self._fuse([query], vectors, k, max(k, candidates), filters)[0]
+
+    def batch_hybrid_search_with_score(
+        self,
+        queries: Sequence[str],
+        k: int = 4,
+        candidates: int = config.HYBRID_CANDIDATES,
+        vectors: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """ `VectorStore.batch_hybrid_search_with_score` over every shard. """
+        if vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+        return self._fuse(queries, vectors, k, max(k, candidates))
+
+    def _fuse(
+        self,
+        queries: Sequence[str],
+        vectors: np.ndarray,
+        k: int,
+        n: int,
+        filters: Optional[EventFilter] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """ Fuse the `n` best dense and lexical matches of the routed shards into the `k` best of each query. """
+        stores = self.route(filters)
+        if not any(store.lexical is not None for store in stores):
+            return [self.similarity_search_with_score_by_vector(vector, k, filters) for vector in vectors]
+        shard_candidates = self._map(lambda store: store.candidates(queries, vectors, n, filters), stores)
+
+        fused = []
+        for i in range(len(queries)):
+            dense_keys, distances, lexical_keys, scores = [], [], [], []
+            for shard, per_query in enumerate(shard_candidates):
+                dense_rows, dense_distances, lexical_rows, lexical_scores = per_query[i]
+                dense_keys.append((shard << _ROW_BITS) | dense_rows.astype(np.int64))
+                distances.append(dense_distances)
+                lexical_keys.append((shard << _ROW_BITS) | lexical_rows.astype(np.int64))
+                scores.append(lexical_scores)
+            dense_keys, distances = np.concatenate(dense_keys), np.concatenate(distances)
+            lexical_keys, scores = np.concatenate(lexical_keys), np.concatenate(scores)
+            dense = dense_keys[np.argsort(distances, kind="stable")[:n]]
+            lexical = lexical_keys[np.argsort(-scores, kind="stable")[:n]]
+            fused.append(reciprocal_rank_fusion([dense, lexical], config.RRF_K)[:k])
+
+        rows_by_shard: Dict[int, List[int]] = {}
+        for results in fused:
+            for key, _ in results:
+                rows_by_shard.setdefault(key >> _ROW_BITS, []).append(key & ((1 << _ROW_BITS) - 1))
+        documents = {
+            shard: iter(stores[shard].documents_at(rows)) for shard, rows in rows_by_shard.items()
+        }
+        return [[(next(documents[key >> _ROW_BITS]), score) for key, score in results] for results in fused]
+
+    # ------ documents ------
+
+    def get_vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """ The (n, dim) stored vectors of `ids` (faiss ids), each read from its shard. """
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.zeros((len(ids), self._stores[0].index.d if self._stores else 0), dtype=np.float32)
+        missing = np.ones(len(ids), dtype=bool)
+        for store in self._stores:
+            found = missing & (store.positions(ids) >= 0)
+            if found.any():
+                vectors[found] = store.get_vectors(ids[found])
+                missing &= ~found
+        if missing.any():
+            raise KeyError("Some ids are not in the index.")
+        return vectors
+
+    def get_documents(self, ids: Sequence[int]) -> List[Optional[Document]]:
+        """ The documents of `ids` (faiss ids), each read from its shard; None for unknown ids. """
+        documents: List[Optional[Document]] = [None] * len(ids)
+        for store in self._stores:
+            for i, doc in enumerate(store.get_documents(ids)):
+                if doc is not None:
+                    documents[i] = doc
+        return documents
+
+    def parent_documents(self, results: Sequence[Tuple[Document, float]], k: int) -> List[Tuple[Document, float]]:
+        """ `VectorStore.parent_documents`, the chunks of an event being all in its shard. """
+        if not self.chunking:
+            return list(results[:k])
+        best = best_chunks(results, k)
+        texts: Dict[str, str] = {}
+        for store in self._stores:
+            texts.update(store.parent_texts(best))
+        return parent_results(best, texts)
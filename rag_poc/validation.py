@@ -1,9 +1,25 @@
-from pydantic import BaseModel, ConfigDict, field_validator, model_validator
-from typing import List, Optional
-from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
+"""
+Validation of the raw events of the API.
 
-from rag_poc import config
+`Event` validates one record. `validate_batch` validates a page of records
+together: field types, region and date windows are checked by column (dates
+parsed by Polars, cutoffs computed once per batch; field types on the Python
+values, that Polars would coerce), and only the records the fast checks cannot
+accept go through `Event`, for its lax parsing and its error report. Both
+accept and reject the same records, with the same values.
+
+The accepted region is `config.REGION`, or the region of the validation context
+(`Event.model_validate(record, context={"region": ...})`, `validate_batch(region=...)`),
+so that every region can be fetched. The events keep their `location_region`.
+"""
+from pydantic import BaseModel, ConfigDict, ValidationError, ValidationInfo, field_validator, model_validator
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import Executor
+from datetime import datetime, timedelta, timezone
+import polars as pl
+
+from rag_poc import config, metrics
+from rag_poc.html_text import clean_html, clean_texts
 
 class Coordinates(BaseModel):
     lon: float
@@ -26,15 +42,19 @@ class Event(BaseModel):
     lastdate_end: datetime
     accessibility_label_fr: Optional[List[str]]
     location_coordinates: Optional[Coordinates]
+    location_region: str
 
     @field_validator('longdescription_fr')
     @classmethod
     def strip_html(cls, v: str) -> str:
-        return BeautifulSoup(v, "html.parser").get_text(separator=" ").strip() if v else None
+        return clean_html(v)
 
     @field_validator('firstdate_begin', 'firstdate_end', 'lastdate_begin', 'lastdate_end', mode='before')
     @classmethod
     def parse_datetime(cls, v: str) -> datetime:
+        # A TypeError would escape pydantic: a null or numeric date must fail as a ValueError
+        if not isinstance(v, str):
+            raise ValueError("Dates must be ISO 8601 strings.")
         return datetime.fromisoformat(v)
 
     @field_validator('firstdate_begin', mode='after')
@@ -57,8 +77,132 @@ class Event(BaseModel):
     
     @model_validator(mode='before')
     @classmethod
-    def check_region(cls, values):
+    def check_region(cls, values, info: ValidationInfo):
         region = values.get("location_region")
-        if region != config.REGION:
-            raise ValueError(f"Invalid region: {region}. Only '{config.REGION}' is accepted.")
+        expected = (info.context or {}).get("region", config.REGION)
+        if region != expected:
+            raise ValueError(f"Invalid region: {region}. Only '{expected}' is accepted.")
         return values
+
+# Polars schema of a validated `Event`, used to write pages with a stable schema
+EVENT_SCHEMA = pl.Schema({
+    "uid": pl.String,
+    "canonicalurl": pl.String,
+    "title_fr": pl.String,
+    "description_fr": pl.String,
+    "longdescription_fr": pl.String,
+    "location_city": pl.String,
+    "conditions_fr": pl.String,
+    "keywords_fr": pl.List(pl.String),
+    "firstdate_begin": pl.Datetime("us", "UTC"),
+    "firstdate_end": pl.Datetime("us", "UTC"),
+    "lastdate_begin": pl.Datetime("us", "UTC"),
+    "lastdate_end": pl.Datetime("us", "UTC"),
+    "accessibility_label_fr": pl.List(pl.String),
+    "location_coordinates": pl.Struct({"lon": pl.Float64, "lat": pl.Float64}),
+    "location_region": pl.String,
+})
+
+TEXT_FIELDS = ("uid", "canonicalurl", "title_fr", "location_region")
+OPTIONAL_TEXT_FIELDS = ("description_fr", "longdescription_fr", "location_city", "conditions_fr")
+LIST_FIELDS = ("keywords_fr", "accessibility_label_fr")
+DATE_FIELDS = ("firstdate_begin", "firstdate_end", "lastdate_begin", "lastdate_end")
+
+# The offset-aware ISO datetimes that `datetime.fromisoformat` reads (3 or 6 fraction digits),
+# and the same format for Polars
+ISO_DATETIME_PATTERN = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{3}|\.\d{6})?[+-]\d{2}:\d{2}$"
+ISO_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%.f%:z"
+
+_MISSING = object()
+
+def _is_text(v: Any) -> bool:
+    return type(v) is str
+
+def _is_optional_text(v: Any) -> bool:
+    return v is None or type(v) is str
+
+def _is_optional_text_list(v: Any) -> bool:
+    return v is None or (type(v) is list and all(type(x) is str for x in v))
+
+def _is_optional_coordinates(v: Any) -> bool:
+    return v is None or (
+        type(v) is dict and type(v.get("lon")) in (float, int) and type(v.get("lat")) in (float, int)
+    )
+
+# The field types are checked per record, on the Python values: the Polars constructors
+# coerce them ("ab" -> ["a", "b"], "1" -> 1.0, 2025 -> "2025"), and a strict String
+# column of each text field costs more than these checks (and the accepted rows are
+# copied once either way)
+_CHECKS = {
+    **{name: _is_text for name in TEXT_FIELDS},
+    **{name: _is_optional_text for name in OPTIONAL_TEXT_FIELDS},
+    **{name: _is_optional_text_list for name in LIST_FIELDS},
+    "location_coordinates": _is_optional_coordinates,
+}
+
+def validate_batch(
+    records: Sequence[Dict[str, Any]],
+    now: Optional[datetime] = None,
+    executor: Optional[Executor] = None,
+    region: str = config.REGION
+) -> Tuple[pl.DataFrame, List[Dict[str, Any]]]:
+    """
+    Validate a batch of raw records like `Event.model_validate`, column by column.
+
+    A record passes the fast path when it has the region `region`, every
+    field with its plain JSON type and offset-aware ISO dates within the
+    `config.SINCE` / `config.UNTIL` window of `now` (default: the current time).
+    The other records are validated by `Event`, which accepts the ones its lax
+    parsing can convert and explains the rejection of the others.
+    The long descriptions of the fast path are cleaned by `clean_texts` in
+    `executor` (a `html_text.cleaning_pool`), or here without one.
+
+    Returns:
+        The valid events (`EVENT_SCHEMA`, in the order of `records`) and the
+        list of {'doc', 'error'} of the rejected records.
+    """
+    now = now or datetime.now(timezone.utc)
+    since, until = now - timedelta(config.SINCE), now + timedelta(config.UNTIL)
+
+    fast = [record.get("location_region") == region for record in records]
+    for name, check in _CHECKS.items():
+        fast = [ok and check(record.get(name, _MISSING)) for ok, record in zip(fast, records)]
+
+    dates = {}
+    for name in DATE_FIELDS:
+        values = pl.Series(name, [v if type(v) is str else None for v in (r.get(name) for r in records)], dtype=pl.String)
+        parsed = values.str.to_datetime(ISO_DATETIME_FORMAT, time_unit="us", time_zone="UTC", strict=False)
+        ok = values.str.contains(ISO_DATETIME_PATTERN).fill_null(False) & parsed.is_not_null()
+        if name == "firstdate_begin":
+            ok &= (parsed >= since).fill_null(False)
+        if name == "lastdate_begin":
+            ok &= (parsed <= until).fill_null(False)
+        fast = [a and b for a, b in zip(fast, ok.to_list())]
+        dates[name] = parsed
+
+    rows = [i for i, ok in enumerate(fast) if ok]
+    with metrics.span("html_clean"):
+        descriptions = clean_texts([records[i]["longdescription_fr"] for i in rows], executor)
+    accepted = pl.DataFrame({
+        **{name: [records[i][name] for i in rows] for name in (*TEXT_FIELDS, *OPTIONAL_TEXT_FIELDS, *LIST_FIELDS)},
+        "longdescription_fr": descriptions,
+        **{name: dates[name].gather(rows) for name in DATE_FIELDS},
+        "location_coordinates": [
+            {"lon": float(c["lon"]), "lat": float(c["lat"])} if c is not None else None
+            for c in (records[i]["location_coordinates"] for i in rows)
+        ],
+    }, schema=EVENT_SCHEMA).with_columns(pl.Series("_row", rows, dtype=pl.Int64))
+
+    detailed, rejected = [], []
+    for i, ok in enumerate(fast):
+        if ok:
+            continue
+        try:
+            detailed.append({**Event.model_validate(records[i], context={"region": region}).model_dump(), "_row": i})
+        except ValidationError as e:
+            rejected.append({"doc": records[i], "error": e})
+
+    if detailed:
+        detailed_frame = pl.DataFrame(detailed, schema={**EVENT_SCHEMA, "_row": pl.Int64})
+        accepted = pl.concat([accepted, detailed_frame]).sort("_row")
+    return accepted.drop("_row"), rejected
@@ -0,0 +1,529 @@
+"""
+On-disk vector store: a FAISS index and an Arrow sidecar of documents, without pickle.
+
+Layout of the store folder:
+    manifest.json          : format, version, current version folder, index parameters
+    v-<version>/index.faiss      : FAISS index, opened with mmap
+    v-<version>/documents.arrow  : Arrow IPC file, one row per vector sorted by `faiss_id`
+                                   (faiss_id, doc_id, page_content, metadata columns...)
+    v-<version>/lexical/         : optional BM25 index of the rows, see rag_poc.lexical
+    v-<version>/filters/         : date, city and geo indexes of the rows, see rag_poc.filters
+
+A chunked store (manifest "chunking") has one row per chunk of the long documents,
+under the id `chunk_id(doc_id, n)`: each chunk keeps the metadata of its document,
+and the `CHUNK_COLUMNS` map it back to it (`parent_documents`).
+
+The manifest is replaced atomically once a new version folder is complete, so
+readers always open a consistent index and sidecar. All files are memory-mapped:
+opening a store costs the same whatever the corpus size, only the rows of the
+search results are read, and several processes share the pages through the OS cache.
+"""
+from datetime import datetime
+from functools import lru_cache
+from hashlib import blake2b
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+from langchain.schema import Document
+import numpy as np
+import pyarrow as pa
+
+from rag_poc import config, faiss_index
+from rag_poc.filters import EventFilter, MetadataIndex
+from rag_poc.lexical import LexicalIndex, document_texts, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+DOCUMENTS_FILE = "documents.arrow"
+RESERVED_COLUMNS = ("faiss_id", "doc_id", "page_content")
+# Parent document id, offset in the parent page_content, number of chunks of the parent
+CHUNK_COLUMNS = ("parent_id", "chunk_start", "chunk_count")
+# Files of the LangChain FAISS.save_local layout used before this format
+LEGACY_FILES = ("index.faiss", "index.pkl", "index_params.json")
+
+def faiss_id(doc_id: str) -> int:
+    """ Stable, positive 63-bit integer id of a document id, used as the FAISS id. """
+    return int.from_bytes(blake2b(str(doc_id).encode("utf-8"), digest_size=8).digest(), "little") >> 1
+
+def content_hash(text: str) -> str:
+    return blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def chunk_id(doc_id: str, n: int) -> str:
+    """ Document id of the `n`-th chunk of the document `doc_id`. """
+    return f"{doc_id}#{n}"
+
+class VectorStore:
+    """
+    A FAISS index with its documents, opened from a store folder with `load`.
+
+    Parameters:
+        manifest: The manifest of the opened version.
+        index: The FAISS index, whose ids are the `faiss_id` of the documents.
+        documents: The Arrow table of documents, sorted by `faiss_id`.
+        embeddings: LangChain embeddings used to embed the text queries.
+        lexical: The BM25 index of the documents, for the hybrid search.
+        metadata_index: The date, city and geo indexes of the documents, for the filters.
+    """
+
+    def __init__(
+        self,
+        manifest: Dict[str, Any],
+        index: faiss.Index,
+        documents: pa.Table,
+        embeddings=None,
+        lexical: Optional[LexicalIndex] = None,
+        metadata_index: Optional[MetadataIndex] = None
+    ):
+        self.manifest = manifest
+        self.index = index
+        self.documents = documents
+        self.embeddings = embeddings
+        self.lexical = lexical
+        self.metadata_index = metadata_index
+        self._ids = documents.column("faiss_id").to_numpy()
+        # Rows and ID selector of the recent filters, a selector costs ~0.2 µs per id to build
+        self._selections = lru_cache(maxsize=32)(self._selection)
+        self._reconstruct_lock = threading.Lock()
+        self._id_map_order: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+        faiss_index.apply_search_params(index, manifest["index"])
+
+    @classmethod
+    def load(cls, folder: pathlib.Path, embeddings=None, mmap: bool = True) -> "VectorStore":
+        """
+        Open the current version of the store in `folder`.
+        With `mmap`, the index and the documents are memory-mapped read-only;
+        without, the index is read in memory so it can be updated.
+
+        Raises:
+            FileNotFoundError if there is no store in `folder`.
+        """
+        manifest = read_manifest(folder)
+        if manifest is None:
+            raise FileNotFoundError(f"No vector store manifest in '{folder}', run the `index` command.")
+
+        version_folder = pathlib.Path(folder) / manifest["path"]
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(str(version_folder / INDEX_FILE), flags)
+
+        with pa.memory_map(str(version_folder / DOCUMENTS_FILE), "r") as source:
+            documents = pa.ipc.open_file(source).read_all()
+        lexical = LexicalIndex.load(version_folder, mmap) if manifest.get("lexical") else None
+        metadata_index = MetadataIndex.load(version_folder, mmap) if manifest.get("filters") else None
+
+        logger.debug("Vector store '%s' opened: version %s, %i documents.", folder, manifest["version"], len(documents))
+        return cls(manifest, index, documents, embeddings, lexical, metadata_index)
+
+    def reset_caches(self) -> None:
+        """ Drop what is derived from the index and the documents, after they were updated in place. """
+        self._ids = self.documents.column("faiss_id").to_numpy()
+        self._selections.cache_clear()
+        with self._reconstruct_lock:
+            self._id_map_order = None
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def chunking(self) -> Optional[Dict[str, int]]:
+        """ The "size" and "overlap" of the chunks, None when each document is a single vector. """
+        return self.manifest.get("chunking")
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def cities(self) -> List[str]:
+        """ The towns of the events, for the city filter. """
+        return list(self.metadata_index.cities) if self.metadata_index is not None else []
+
+    # ------ search ------
+
+    def search_vectors(self, vectors: np.ndarray, k: int, params: Optional[faiss.SearchParameters] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ Batched search of a (n, dim) matrix: distances and faiss ids, -1 for missing results. """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.index.d)
+        if params is not None:
+            return self.index.search(vectors, k, params=params)
+
+        flat = self._flat_list()
+        if flat is None:
+            return self.index.search(vectors, k)
+        # Same results as the IVF scan, but batches of queries go through BLAS
+        stored_vectors, stored_ids = flat
+        distances, rows = faiss.knn(faiss_index.transform(self.index, vectors), stored_vectors, k)
+        return distances, np.where(rows >= 0, stored_ids[rows], -1)
+
+    def _flat_list(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """ Zero-copy views of the vectors and ids of a flat (single-cell IVF, float32) index, else None. """
+        index = self.index
+        if isinstance(index, faiss.IndexPreTransform):
+            index = faiss.downcast_index(index.index)
+        if not isinstance(index, faiss.IndexIVFFlat) or index.nlist != 1 or index.metric_type != faiss.METRIC_L2:
+            return None
+        n = index.invlists.list_size(0)
+        if n == 0:
+            return None
+        vectors = faiss.rev_swig_ptr(index.invlists.get_codes(0), n * index.code_size).view(np.float32)
+        return vectors.reshape(n, index.d), faiss.rev_swig_ptr(index.invlists.get_ids(0), n)
+
+    def get_vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """
+        The (n, dim) stored vectors of `ids` (faiss ids of the store), for the rerankers;
+        quantized indexes (PQ, SQ8, fp16) and a PCA give their approximation of the vectors.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return np.empty((0, self.index.d), dtype=np.float32)
+        index = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexPreTransform) else self.index
+        if isinstance(index, faiss.IndexIDMap):
+            with self._reconstruct_lock:
+                positions = self._id_map_positions(index, ids)
+            vectors = faiss.downcast_index(index.index).reconstruct_batch(positions)
+        else:
+            ivf = faiss.extract_index_ivf(index)
+            with self._reconstruct_lock:
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    # id -> (list, offset) table, ~10 ms at 100k vectors; the ids are not sequential
+                    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            vectors = index.reconstruct_batch(ids)
+        return faiss_index.reverse_transform(self.index, vectors)
+
+    def _id_map_positions(self, index: faiss.IndexIDMap, ids: np.ndarray) -> np.ndarray:
+        """ Position of `ids` in the IndexIDMap `index`, the argsort of the id map is kept until the index changes. """
+        ntotal = index.ntotal
+        if self._id_map_order is None or self._id_map_order[0] != ntotal:
+            id_map = faiss.vector_to_array(index.id_map)
+            order = np.argsort(id_map, kind="stable")
+            self._id_map_order = (ntotal, id_map[order], order)
+        _, sorted_ids, order = self._id_map_order
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        if not np.array_equal(sorted_ids[positions], ids):
+            raise KeyError("Some ids are not in the index.")
+        return order[positions]
+
+    def select(self, filters: EventFilter) -> np.ndarray:
+        """
+        Sorted rows of the documents matching `filters`.
+
+        Raises:
+            ValueError if the store has no metadata index (built before the filters).
+        """
+        if self.metadata_index is None:
+            raise ValueError("This vector store has no metadata index, run the `index` command to filter it.")
+        return self.metadata_index.select(filters)
+
+    def _selection(self, filters: EventFilter) -> Tuple[np.ndarray, faiss.IDSelector]:
+        rows = self.select(filters)
+        return rows, faiss_index.id_selector(self._ids[rows])
+
+    def _filter_params(self, filters: Optional[EventFilter]) -> Tuple[Optional[np.ndarray], Optional[faiss.SearchParameters]]:
+        """ Rows matching `filters` and the FAISS parameters searching only them; (None, None) without filters. """
+        if not filters:
+            return None, None
+        rows, selector = self._selections(filters)
+        return rows, faiss_index.selector_params(self.index, selector)
+
+    def similarity_search_with_score_by_vector(
+        self,
+        vector,
+        k: int = 4,
+        filters: Optional[EventFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """ The `k` closest documents to `vector` and their distances, among those matching `filters`. """
+        rows, params = self._filter_params(filters)
+        if rows is not None and not len(rows):
+            return []
+        distances, ids = self.search_vectors(np.asarray(vector), k, params)
+        documents = self.get_documents(ids[0])
+        return [(doc, float(d)) for doc, d in zip(documents, distances[0]) if doc is not None]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filters: Optional[EventFilter] = None) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k, filters)
+
+    def similarity_search(self, query: str, k: int = 4, filters: Optional[EventFilter] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filters)]
+
+    def batch_similarity_search_with_score(
+        self,
+        queries: Sequence[str],
+        k: int = 4,
+        vectors: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search several queries with one embedding call and one (n, dim) FAISS search.
+        `vectors` are the embeddings of `queries`, if already computed.
+        """
+        if vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+        distances, ids = self.search_vectors(vectors, k)
+        documents = self.get_documents(ids.ravel())
+        return [
+            [(doc, float(d)) for doc, d in zip(documents[i * k:(i + 1) * k], row) if doc is not None]
+            for i, row in enumerate(distances)
+        ]
+
+    def hybrid_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        vector: Optional[Sequence[float]] = None,
+        candidates: int = config.HYBRID_CANDIDATES,
+        filters: Optional[EventFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        The `k` best documents of the fusion of the `candidates` best dense and
+        lexical (BM25) matches of `query`, with their reciprocal-rank fusion score
+        (higher is better). `vector` is the embedding of `query`, if already computed.
+        With `filters`, both searches only consider the matching documents.
+        Without a lexical index, this is the dense search.
+        """
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+        if self.lexical is None:
+            return self.similarity_search_with_score_by_vector(vector, k, filters)
+        rows, params = self._filter_params(filters)
+        if rows is not None and not len(rows):
+            return []
+        _, ids = self.search_vectors(np.asarray(vector), max(k, candidates), params)
+        return self._fuse([query], ids, k, rows)[0]
+
+    def batch_hybrid_search_with_score(
+        self,
+        queries: Sequence[str],
+        k: int = 4,
+        candidates: int = config.HYBRID_CANDIDATES,
+        vectors: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """ `hybrid_search_with_score` of several queries, with one embedding call and one FAISS search. """
+        if vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+        if self.lexical is None:
+            return self.batch_similarity_search_with_score(queries, k, vectors)
+        _, ids = self.search_vectors(vectors, max(k, candidates))
+        return self._fuse(queries, ids, k)
+
+    def _fuse(
+        self,
+        queries: Sequence[str],
+        ids: np.ndarray,
+        k: int,
+        rows: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """ Fuse the dense results `ids` (one row per query) with the lexical results of `queries`, among `rows`. """
+        fused = []
+        for query, row_ids in zip(queries, ids):
+            dense = self.positions(row_ids[row_ids >= 0])
+            lexical, _ = self.lexical.search(query, len(row_ids), rows)
+            fused.append(reciprocal_rank_fusion([dense[dense >= 0], lexical], config.RRF_K)[:k])
+
+        rows = self.documents.take([row for results in fused for row, _ in results]).to_pylist()
+        rows_iter = iter(rows)
+        return [[(row_to_document(next(rows_iter)), score) for _, score in results] for results in fused]
+
+    # ------ documents ------
+
+    def positions(self, ids: Sequence[int]) -> np.ndarray:
+        """ Row of each faiss id in the documents table, -1 if it is not there. """
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self._ids, ids)
+        positions = np.minimum(positions, len(self._ids) - 1)
+        found = (len(self._ids) > 0) & (self._ids[positions] == ids) if len(self._ids) else np.zeros(len(ids), bool)
+        return np.where(found, positions, -1)
+
+    def get_documents(self, ids: Sequence[int]) -> List[Optional[Document]]:
+        """ The documents of `ids` (faiss ids), read from the sidecar; None for unknown ids. """
+        positions = self.positions(ids)
+        rows = self.documents.take(positions[positions >= 0]).to_pylist()
+        rows_iter = iter(rows)
+        return [row_to_document(next(rows_iter)) if pos >= 0 else None for pos in positions]
+
+    def parent_documents(self, results: Sequence[Tuple[Document, float]], k: int) -> List[Tuple[Document, float]]:
+        """
+        Collapse the chunk `results` (best first) to their `k` first distinct parent
+        documents, with the score of their best chunk and their page_content rebuilt
+        from all their chunks. The results of a store without chunks are only cut to `k`.
+        """
+        if not self.chunking:
+            return list(results[:k])
+        best = best_chunks(results, k)
+        return parent_results(best, self.parent_texts(best))
+
+    def parent_texts(self, best: Dict[str, Tuple[Document, float]]) -> Dict[str, str]:
+        """ page_content of the parents of `best` (see `best_chunks`), rebuilt from their chunks in this store. """
+        positions = self.positions([
+            faiss_id(chunk_id(parent, n)) for parent, (doc, _) in best.items() for n in range(doc.metadata.get("chunk_count", 0))
+        ])
+        chunks = self.documents.select(["parent_id", "chunk_start", "page_content"]).take(positions[positions >= 0])
+        texts: Dict[str, str] = {}
+        for chunk in chunks.to_pylist():
+            # The chunks overlap: each one replaces the end of the text from its offset
+            texts[chunk["parent_id"]] = texts.get(chunk["parent_id"], "")[:chunk["chunk_start"]] + chunk["page_content"]
+        return texts
+
+    def candidates(
+        self,
+        queries: Sequence[str],
+        vectors: np.ndarray,
+        n: int,
+        filters: Optional[EventFilter] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        For each query, its `n` best dense matches (rows, distances) and lexical
+        matches (rows, BM25 scores) among the documents matching `filters`, best
+        first, to be fused with those of other stores. No lexical matches without a lexical index.
+        """
+        empty = (np.empty(0, np.int64), np.empty(0, np.float32))
+        rows, params = self._filter_params(filters)
+        if rows is not None and not len(rows):
+            return [(*empty, *empty) for _ in queries]
+        distances, ids = self.search_vectors(vectors, n, params)
+        results = []
+        for query, row_distances, row_ids in zip(queries, distances, ids):
+            positions = self.positions(row_ids)
+            found = (row_ids >= 0) & (positions >= 0)
+            lexical = self.lexical.search(query, n, rows) if self.lexical is not None else empty
+            results.append((positions[found], row_distances[found], *lexical))
+        return results
+
+    def documents_at(self, rows: Sequence[int]) -> List[Document]:
+        """ The documents of `rows` of the documents table. """
+        return [row_to_document(row) for row in self.documents.take(np.asarray(rows, dtype=np.int64)).to_pylist()]
+
+    def content_hashes(self) -> Dict[str, str]:
+        """ doc_id -> content_hash of every stored document. """
+        return dict(zip(
+            self.documents.column("doc_id").to_pylist(),
+            self.documents.column("content_hash").to_pylist(),
+        ))
+
+def best_chunks(results: Sequence[Tuple[Document, float]], k: int) -> Dict[str, Tuple[Document, float]]:
+    """ parent_id -> (best chunk, score) of the `k` first distinct parents of the chunk `results` (best first). """
+    best: Dict[str, Tuple[Document, float]] = {}
+    for doc, score in results:
+        best.setdefault(doc.metadata.get("parent_id", doc.id), (doc, score))
+        if len(best) == k:
+            break
+    return best
+
+def parent_results(best: Dict[str, Tuple[Document, float]], texts: Dict[str, str]) -> List[Tuple[Document, float]]:
+    """ The parent documents of `best` (see `best_chunks`) with their `texts`, and the score of their best chunk. """
+    return [
+        (Document(
+            id=parent,
+            page_content=texts.get(parent, doc.page_content),
+            metadata={key: value for key, value in doc.metadata.items() if key not in CHUNK_COLUMNS},
+        ), score)
+        for parent, (doc, score) in best.items()
+    ]
+
+def row_to_document(row: Dict[str, Any]) -> Document:
+    metadata = {k: v for k, v in row.items() if k not in RESERVED_COLUMNS}
+    return Document(id=row["doc_id"], page_content=row["page_content"], metadata=metadata)
+
+def documents_table(documents: Dict[str, Document]) -> pa.Table:
+    """ Arrow table of `documents` (doc_id -> Document), sorted by faiss id. """
+    rows = [
+        {"faiss_id": faiss_id(doc_id), "doc_id": str(doc_id), "page_content": doc.page_content, **doc.metadata}
+        for doc_id, doc in documents.items()
+    ]
+    if not rows:
+        return pa.table({"faiss_id": pa.array([], pa.int64()), "doc_id": pa.array([], pa.string()),
+                         "page_content": pa.array([], pa.string()), "content_hash": pa.array([], pa.string())})
+    return pa.Table.from_pylist(rows).sort_by("faiss_id")
+
+def read_manifest(folder: pathlib.Path) -> Optional[Dict[str, Any]]:
+    path = pathlib.Path(folder) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_store(
+    folder: pathlib.Path,
+    index: faiss.Index,
+    documents: pa.Table,
+    params: Dict[str, Any],
+    embedding_model: str,
+    lexical_fields: Optional[Sequence[str]] = None,
+    chunking: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Write `index` and `documents` in a new version folder of the store, then
+    switch the manifest to it. Older versions, except the previous one still
+    possibly open by readers, are deleted.
+
+    The date, city and geo indexes of the filters are built from the documents.
+    With `lexical_fields`, a BM25 index of the page_content and of these
+    metadata fields is built and saved with the version, for the hybrid search.
+    `chunking` records the "size" and "overlap" of the chunks of a chunked store.
+
+    Returns:
+        The new manifest.
+    """
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    previous = read_manifest(folder)
+
+    digest = blake2b(digest_size=16)
+    settings = [params, lexical_fields, chunking] if chunking else [params, lexical_fields]
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for doc_id, hash_ in sorted(zip(documents.column("doc_id").to_pylist(), documents.column("content_hash").to_pylist())):
+        digest.update(f"{doc_id}\0{hash_}\n".encode("utf-8"))
+    version = digest.hexdigest()
+
+    version_path = f"v-{time.time_ns()}-{version[:8]}"
+    tmp_folder = folder / f".{version_path}.tmp"
+    tmp_folder.mkdir()
+
+    faiss.write_index(index, str(tmp_folder / INDEX_FILE))
+    with pa.OSFile(str(tmp_folder / DOCUMENTS_FILE), "wb") as sink:
+        with pa.ipc.new_file(sink, documents.schema) as writer:
+            writer.write_table(documents)
+
+    metadata_index = MetadataIndex.build(documents)
+    filters_meta = {"cities": len(metadata_index.cities), "cell_deg": metadata_index.cell_deg}
+    metadata_index.save(tmp_folder)
+
+    lexical_meta = None
+    if lexical_fields is not None:
+        lexical_meta = {"fields": list(lexical_fields)}
+        lexical = LexicalIndex.build(document_texts(documents, lexical_fields))
+        lexical.save(tmp_folder, lexical_meta)
+        lexical_meta["terms"] = len(lexical)
+    os.replace(tmp_folder, folder / version_path)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "path": version_path,
+        "count": len(documents),
+        "dim": index.d,
+        "index": params,
+        "lexical": lexical_meta,
+        "filters": filters_meta,
+        "chunking": chunking,
+        "embedding_model": embedding_model,
+        "created_at": datetime.now().isoformat(),
+    }
+    tmp_manifest = folder / f".{MANIFEST_FILE}.tmp"
+    tmp_manifest.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_manifest, folder / MANIFEST_FILE)
+
+    keep = {version_path, previous["path"] if previous else None}
+    for old in [*folder.glob("v-*"), *folder.glob(".v-*.tmp")]:
+        if old.name not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+    for name in LEGACY_FILES:
+        (folder / name).unlink(missing_ok=True)
+
+    logger.info("Vector store version %s saved to '%s'.", version, folder)
+    return manifest
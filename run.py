@@ -1,11 +1,20 @@
+"""
+Command line entry point: `python -m run [-v] [--metrics FILE] [--profile [FILE]] <command> [options]`.
+
+Only the parser and the configuration are imported at startup: the module of a
+command, and its dependencies (polars and pydantic for `fetch`, FAISS and
+LangChain for `index`, aiohttp for `serve`), are imported when the command runs,
+so `--help` or a `fetch` does not pay for the others (see tests/test_startup.py).
+"""
 import argparse
+import contextlib
+from datetime import datetime
 import logging
-import logging.config
 import os
+import pathlib
 import sys
 
-from rag_poc import config, argument_parsing
-from scripts import fetching, indexing
+from rag_poc import config, argument_parsing, metrics
 
 def run(argv: list[str] | None = None) -> None:
     parser = argument_parsing.build_parser()
@@ -22,13 +31,63 @@ def run(argv: list[str] | None = None) -> None:
         parser.print_help()
         sys.exit(1)
 
+    if args.metrics:
+        metrics.enable()
+    profile = contextlib.nullcontext()
+    if args.profile is not None:
+        profile = metrics.profiling(args.profile or profile_path(args.command))
+    try:
+        with profile:
+            run_command(args)
+    finally:
+        if args.metrics:
+            metrics.save(args.metrics)
+            logger.info("Metrics written to '%s'.", args.metrics)
+
+def profile_path(command: str) -> pathlib.Path:
+    """ Default profile file of `command`: <PROFILE_FOLDER>/<command>-<time>.prof """
+    return config.PROFILE_FOLDER / f"{command}-{datetime.now().strftime('%Y%m%dT%H%M%S')}.prof"
+
+def run_command(args: argparse.Namespace) -> None:
     if args.command == 'fetch':
+        from scripts import fetching
+    elif args.command == 'index':
+        from scripts import indexing
+
+    if args.command == 'fetch' and args.incremental:
+        fetching.fetch_data_incremental(
+            region=args.region,
+            limit=args.limit,
+            since=args.since,
+            until=args.until,
+            destination=args.destination,
+            workers=args.workers,
+            page_days=args.page_days,
+            page_size=args.page_size,
+            clean_workers=args.clean_workers
+        )
+
+    elif args.command == 'fetch' and args.paginated:
+        fetching.fetch_data_paginated(
+            region=args.region,
+            limit=args.limit,
+            since=args.since,
+            until=args.until,
+            destination=args.destination,
+            workers=args.workers,
+            page_days=args.page_days,
+            page_size=args.page_size,
+            clean_workers=args.clean_workers
+        )
+
+    elif args.command == 'fetch':
         fetching.fetch_data(
             region=args.region,
             limit=args.limit,
             since=args.since,
             until=args.until,
-            destination=args.destination
+            destination=args.destination,
+            clean_workers=args.clean_workers
         )
     
     elif args.command == 'index':
@@ -37,6 +96,22 @@ def run(argv: list[str] | None = None) -> None:
             destination=args.destination,
             columns=args.columns,
             id_column=args.id,
+            incremental=args.incremental,
+            batch_tokens=args.batch_tokens,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            index_type=args.index_type,
+            nprobe=args.nprobe,
+            ef_search=args.ef_search,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            pca_dim=args.pca_dim,
+            quantize=args.quantize,
+            shard_by=args.shard_by,
+            shards=args.shards,
+            shard_workers=args.shard_workers,
+            start=args.start,
+            end=args.end,
         )
 
     elif args.command == 'app':
@@ -44,5 +119,16 @@ def run(argv: list[str] | None = None) -> None:
         app_path = os.path.join(os.path.dirname(__file__), "scripts/chat.py")
         subprocess.run(["streamlit", "run", app_path, "--server.port", str(args.port)])
 
+    elif args.command == 'serve':
+        from scripts import serve
+        serve.run_server(
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            max_pending=args.max_pending,
+            batch_wait_ms=args.batch_wait_ms,
+            batch_max=args.batch_max,
+        )
+
 if __name__ == "__main__":
     run(sys.argv[1:])
\ No newline at end of file
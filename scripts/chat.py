@@ -1,93 +1,46 @@
-from langchain_community.vectorstores import FAISS
-from langchain_mistralai import MistralAIEmbeddings
-from langchain_mistralai.chat_models import ChatMistralAI
+from datetime import datetime, time, timedelta
+
 import streamlit as st
-import time
 
-from rag_poc import config
+from rag_poc import config, retrieval
+from rag_poc.filters import EventFilter
 
-api_key = config.load_api_key()
+# Streamlit re-executes this script on every interaction: the clients and the
+# vector store come from the process-wide caches of rag_poc.retrieval.
 
 temperature = st.sidebar.slider("Température de génération", 0.0, 1.0, 0.7)
 
-model = ChatMistralAI(
-    temperature=temperature, 
-    api_key=api_key
-    )
-
-# Remove obselete attribute 'language' from the model
-if hasattr(model, "language"):
-    model.language = None  
-
-embeddings = MistralAIEmbeddings(
-        api_key=config.load_api_key(),
-        model="mistral-embed"     
-    )
-
-vector_store = FAISS.load_local(
-    folder_path = config.VECTORS_FOLDER,
-    embeddings=embeddings,
-    allow_dangerous_deserialization=True
-)
-
-def format_context_markdown(docs):
-    blocks = []
-    for doc in docs:
-        title = doc.metadata.get("title_fr", "Sans titre")
-        date = doc.metadata.get("daterange_fr", "Date inconnue")
-        url = doc.metadata.get("canonicalurl", "")
-        desc = doc.page_content.strip()
-
-        block = f"""
-**Lien**: [{url}]({url})  
-
-{desc}
-"""
-        blocks.append(block)
-    return "\n---\n".join(blocks)
+st.sidebar.subheader("Filtres")
+dates = st.sidebar.date_input("Période", value=(), format="DD/MM/YYYY")
+cities = st.sidebar.multiselect("Villes", retrieval.get_vector_store().cities)
 
+def selected_filters() -> EventFilter:
+    """ Events running during the selected days, in the selected towns. """
+    start = end = None
+    if dates:
+        start = datetime.combine(dates[0], time.min)
+        end = datetime.combine(dates[-1] + timedelta(days=1), time.min)
+    return EventFilter(start=start, end=end, cities=tuple(cities))
 
 def generate_recommendation(input_text: str):
-    docs = vector_store.similarity_search(
-        query=input_text,
-        k=3
+    with st.spinner("Recherche des événements..."):
+        recommendation = retrieval.stream_recommendation(
+            input_text, k=3, temperature=temperature, cache=retrieval.get_answer_cache(),
+            filters=selected_filters() or None
         )
 
-    context = "\n\n".join(
-        f"""
-        📌 **{doc.metadata.get('title_fr', 'Titre inconnu')}**\n
-        📅 Date : {doc.metadata.get('daterange_fr', 'Inconnue')}\n
-        🔗 Lien : {doc.metadata.get('canonicalurl', 'Non disponible')}\n\n
-
-        {doc.page_content}
-        """ for doc in docs
-    )
-
-    prompt = f"""
-    Tu es un assistant intelligent qui aide à recommander des événements à partir de leurs descriptions.
-
-    Voici une liste d'événements susceptible d'intéresser l'utilisateur :
-
-    ---------------------
-    {context}
-    ---------------------
-
-    En te basant uniquement sur ces événements, pas tes connaissances antérieures, réponds à la question suivante en français :
-    **{input_text}**
-
-    Ta réponse doit être concise, utile et faire référence aux événements les plus pertinents (pas besoin de recopier les descriptions, elles sont déjà affichées à l'utilisateur).
-    
-    Si les événements qui sont dans ta liste ne semblent pas correspondre, ou si la question qui est posé n'est pas pertinente pour un assistant de recommandation d'événements,
-    précise ta mission, et invite les utilisateurs à reposer leur question.
-    """
+    # The events are shown while the answer, above them, is being generated
+    answer = st.container()
+    st.subheader("📄 Événements correspondants")
+    st.markdown(retrieval.format_context_markdown(recommendation.documents), unsafe_allow_html=True)
 
-    with st.spinner("Génération de la réponse..."):
-        response = model.invoke(prompt)
+    with answer:
         st.subheader("🧠 Réponse de l'assistant")
-        st.markdown(response.content)
-
-    st.subheader("📄 Événements correspondants")
-    st.markdown(format_context_markdown(docs), unsafe_allow_html=True)
+        st.write_stream(recommendation)
+        if recommendation.cached:
+            st.caption("Réponse issue du cache (question similaire déjà posée).")
+        if recommendation.timings:
+            st.caption(retrieval.format_timings(recommendation.timings))
 
 
 st.title("🦜🔗 Mistral RAG bot for events")
@@ -99,8 +52,6 @@ with st.form("my_form"):
     )
     submitted = st.form_submit_button("Submit")
     if submitted:
-        with st.spinner("Recherche en cours..."):
-            generate_recommendation(
-                input_text=text
-            ) 
-
+        generate_recommendation(
+            input_text=text
+        )
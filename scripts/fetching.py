@@ -1,11 +1,19 @@
 """
-Fetch data from the OpenData API, validate it, and save to a Parquet file.
+Fetch data from the OpenData API, validate it, and save to a Parquet dataset.
 
 Steps:
     1. Send a GET request to the API endpoint.
     2. Validate the response using a Pydantic model.
     3. Clean the HTML content (if applicable).
-    4. Save valid data to a Parquet file.
+    4. Save valid data to the partitions of the region in the dataset (see rag_poc.dataset),
+       or to a single Parquet file when the destination ends with ".parquet".
+
+The paginated mode (`fetch_data_paginated`) splits the date window in pages,
+fetches them concurrently over a pooled session and streams each page through
+validation into the Parquet file, so memory does not grow with the region size.
+
+The incremental mode (`fetch_data_incremental`) only asks for the events updated
+since the watermark saved by the previous fetch, and upserts them by uid.
 
 Configuration:
     Constants are defined in `rag_poc/config.py`, including:
@@ -14,16 +22,22 @@ Configuration:
         - WRITE_ERRORS: If True, write validation errors to a file.
 """
 
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
 import json
 import logging
+import os
 import pathlib
 import polars as pl
-from pydantic import ValidationError
 import requests
-from typing import Optional, List, Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Sequence
+from urllib3.util.retry import Retry
 
-from rag_poc import config, validation
+from rag_poc import config, dataset, metrics, validation
+from rag_poc.html_text import cleaning_pool
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +46,8 @@ def fetch_data(
     limit: int, 
     since: int, 
     until: int,
-    destination: pathlib.Path
+    destination: pathlib.Path,
+    clean_workers: int = config.CLEAN_WORKERS
 ) -> None:
     """
     
@@ -69,42 +84,424 @@ def fetch_data(
 
     # ------ 2. Validating documents ------ #
 
-    data = []
-    wrong_data_list = []
-
-    for doc in data_raw:
-        try:
-            data.append(validation.Event.model_validate(doc))
-        except ValidationError as e:
-            wrong_data_list.append({'doc': doc, 'error': e})
+    with cleaning_pool(clean_workers) as cleaner, metrics.span("validate"):
+        df, wrong_data_list = validation.validate_batch(data_raw, executor=cleaner, region=region)
+    metrics.count("rejected_records", len(wrong_data_list))
     
     if wrong_data_list:
         logger.warning("Documents received from API did not pass validation: %i", len(wrong_data_list))
         
         if config.WRITE_ERRORS:
             logger.warning(f"Writing errors to '{config.ERROR_FILE}'")
-
-            error_file = config.ERROR_FILE.with_suffix(".jsonl")
-
-            if not error_file.exists():
-                logger.info("Error file does not exist, creating error file: `%s`.", error_file)
-                error_file.touch()
-
-            with error_file.open("w", encoding="utf-8") as file:
-                for item in wrong_data_list:
-                    json.dump(item, file, ensure_ascii=False, default=str)
-                    file.write("\n")
-
-    df = pl.DataFrame(data, infer_schema_length=1000)
+            write_errors(wrong_data_list)
 
     logger.info(f"Final data shape: {df.shape}")
 
     # ------ 3. Writing data to parquet ------
     output_file = destination
 
-    df.write_parquet(output_file)
+    with metrics.span("parquet_write"):
+        if dataset.is_partitioned(output_file):
+            dataset.write_region(df, output_file, region)
+        else:
+            df.write_parquet(output_file)
     logger.info("Data saved to '%s'", output_file)
 
+@dataclass(frozen=True)
+class Page:
+    """
+    One page of the paginated query: a `firstdate_begin` window and an offset in it,
+    optionally restricted to the events updated after `updated_since`.
+    """
+    start: datetime
+    end: datetime
+    offset: int = 0
+    updated_since: Optional[str] = None
+
+    def where(self, region: str, date_until: str) -> str:
+        where = (
+            f'location_region="{region}"'
+            f' AND firstdate_begin >= "{self.start.strftime("%Y-%m-%dT%H:%M:%S")}"'
+            f' AND firstdate_begin < "{self.end.strftime("%Y-%m-%dT%H:%M:%S")}"'
+            f' AND lastdate_begin <= "{date_until}"'
+        )
+        if self.updated_since:
+            where += f' AND updatedat > "{self.updated_since}"'
+        return where
+
+@dataclass
+class FetchResult:
+    """ Outcome of a paginated fetch. """
+    written: int = 0
+    rejected: int = 0
+    rejected_ids: List[str] = field(default_factory=list)  # ids of the rejected documents, out-of-region ones included
+    updated_max: Optional[str] = None  # latest `updatedat` seen in the raw documents
+
+def fetch_data_paginated(
+    region: str,
+    limit: int,
+    since: int,
+    until: int,
+    destination: pathlib.Path,
+    workers: int = config.FETCH_WORKERS,
+    page_days: int = config.FETCH_PAGE_DAYS,
+    page_size: int = config.FETCH_PAGE_SIZE,
+    url: Optional[str] = None,
+    clean_workers: int = config.CLEAN_WORKERS,
+) -> int:
+    """
+    Fetch the events page by page and stream them to a Parquet file.
+
+    The `since`/`until` window is split in `page_days` windows on `firstdate_begin`,
+    fetched by at most `workers` concurrent requests. A page returning `page_size`
+    events is followed by the next offset page of the same window.
+    Each page is validated (its HTML cleaned by `clean_workers` processes)
+    and appended to the Parquet file as soon as it arrives,
+    and the file is moved to `destination` (or to the partitions of the region
+    in the dataset `destination`) once every page succeeded.
+    A watermark is saved with `destination` for later incremental fetches.
+
+    Returns:
+        The number of events written.
+
+    Raises:
+        ValueError if the API did not return any data.
+    """
+    today = datetime.today()
+    pages = split_date_range(today - timedelta(days=since), today + timedelta(days=until), page_days)
+
+    result = _fetch_pages(pages, region, until, limit, destination, workers, page_size, url, clean_workers=clean_workers)
+
+    if result.written < limit:
+        save_watermark(destination, region, result.updated_max or today.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    return result.written
+
+def fetch_data_incremental(
+    region: str,
+    limit: int,
+    since: int,
+    until: int,
+    destination: pathlib.Path,
+    workers: int = config.FETCH_WORKERS,
+    page_days: int = config.FETCH_PAGE_DAYS,
+    page_size: int = config.FETCH_PAGE_SIZE,
+    url: Optional[str] = None,
+    clean_workers: int = config.CLEAN_WORKERS,
+) -> int:
+    """
+    Fetch only the events updated since the last fetch and upsert them into `destination`.
+
+    The watermark (latest `updatedat` seen) is read from the file saved with
+    `destination`. Without a watermark, or when it was saved for another region
+    or `destination` has no `location_region` column, a full paginated fetch is run instead.
+    In a dataset, each region has its watermark and only its partitions are rewritten.
+    The delta replaces the rows with the same `config.ID_COLUMN`; events updated
+    into invalid ones or moved to another region, and events that left the `since`
+    window are dropped from the store.
+
+    Returns:
+        The number of events fetched (the size of the delta).
+    """
+    destination = pathlib.Path(destination)
+    watermark = load_watermark(destination, region)
+
+    if dataset.is_partitioned(destination):
+        usable = watermark is not None and any(dataset.region_folder(destination, region).glob("*/*.parquet"))
+    else:
+        usable = watermark is not None and watermark.get("region") == region and destination.exists() \
+            and "location_region" in pl.read_parquet_schema(destination)
+    if not usable:
+        # Files fetched before the events kept their region are fetched again
+        logger.info("No usable watermark for '%s', running a full fetch.", destination)
+        return fetch_data_paginated(region, limit, since, until, destination, workers, page_days, page_size, url, clean_workers)
+
+    logger.info("Fetching events updated since %s", watermark["updatedat"])
+    today = datetime.today()
+    page = Page(
+        start=today - timedelta(days=since),
+        end=today + timedelta(days=until, seconds=1),
+        updated_since=watermark["updatedat"],
+    )
+    delta_file = destination.with_name(f".{destination.stem}.delta.parquet")
+
+    result = _fetch_pages(
+        [page], region, until, limit, delta_file, workers, page_size, url, allow_empty=True, clean_workers=clean_workers
+    )
+    try:
+        upsert_parquet(
+            destination, delta_file, id_column=config.ID_COLUMN, since=since, region=region,
+            removed_ids=result.rejected_ids
+        )
+    finally:
+        delta_file.unlink(missing_ok=True)
+
+    if result.updated_max and result.written < limit:
+        save_watermark(destination, region, max(result.updated_max, watermark["updatedat"]))
+
+    logger.info("Incremental fetch: %i events updated, %i rejected", result.written, result.rejected)
+    return result.written
+
+def upsert_parquet(
+    destination: pathlib.Path,
+    delta_file: pathlib.Path,
+    id_column: str,
+    since: int,
+    region: Optional[str] = None,
+    removed_ids: Sequence[str] = ()
+) -> None:
+    """
+    Merge `delta_file` into `destination` by `id_column`: delta rows replace the
+    existing rows with the same id, the rows of `removed_ids` (updated events the
+    delta rejected) and events starting before the `since` window are dropped.
+    The merge is streamed into a temporary file which then replaces `destination`,
+    or into the partitions of `region` when `destination` is a dataset.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=since)
+    delta = pl.scan_parquet(delta_file)
+    partitioned = dataset.is_partitioned(destination)
+    existing = dataset.scan_events(destination, regions=[region]) if partitioned else pl.scan_parquet(destination)
+
+    merged = (
+        pl.concat([
+            existing.join(delta.select(id_column), on=id_column, how="anti")
+            .filter(~pl.col(id_column).is_in(list(removed_ids))),
+            delta,
+        ], how="diagonal_relaxed")
+        .filter(pl.col("firstdate_begin") >= cutoff)
+    )
+
+    if partitioned:
+        dataset.write_region(merged, destination, region)
+    else:
+        tmp_file = destination.with_name(f".{destination.name}.tmp")
+        merged.sink_parquet(tmp_file)
+        os.replace(tmp_file, destination)
+    logger.info("Data upserted into '%s'", destination)
+
+def watermark_path(destination: pathlib.Path, region: Optional[str] = None) -> pathlib.Path:
+    """ The watermark of a Parquet file is saved next to it, the one of each region of a dataset in the dataset folder. """
+    destination = pathlib.Path(destination)
+    if dataset.is_partitioned(destination):
+        return destination / f"_{dataset.region_folder(destination, region).name}.watermark.json"
+    return destination.with_name(f"{destination.stem}.watermark.json")
+
+def load_watermark(destination: pathlib.Path, region: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """ Return the saved watermark of `destination` (of `region` in a dataset), or None if there is none. """
+    path = watermark_path(destination, region)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_watermark(destination: pathlib.Path, region: str, updatedat: str) -> None:
+    """ Atomically save the watermark of `destination`. """
+    path = watermark_path(destination, region)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.tmp")
+    tmp_file.write_text(
+        json.dumps({"region": region, "updatedat": updatedat, "fetched_at": datetime.now().isoformat()}),
+        encoding="utf-8",
+    )
+    os.replace(tmp_file, path)
+    logger.debug("Watermark saved to '%s': %s", path, updatedat)
+
+def _fetch_pages(
+    pages: Iterable[Page],
+    region: str,
+    until: int,
+    limit: int,
+    destination: pathlib.Path,
+    workers: int,
+    page_size: int,
+    url: Optional[str],
+    allow_empty: bool = False,
+    clean_workers: int = config.CLEAN_WORKERS,
+) -> FetchResult:
+    """
+    Stream `pages` into a temporary Parquet file, moved to `destination` (or written
+    to the partitions of `region` in the dataset `destination`) once every page succeeded.
+
+    Raises:
+        ValueError if the API did not return any data, unless `allow_empty`.
+    """
+    date_until: str = (datetime.today() + timedelta(days=until)).strftime("%Y-%m-%dT%H:%M:%S")
+    url = url or f'{config.BASE_URL}{config.ENDPOINT}'
+
+    pending = deque(pages)
+    logger.debug("url=%s", url)
+    logger.debug("pages=%i, workers=%i, page_size=%i", len(pending), workers, page_size)
+
+    setup_folders()
+    destination = pathlib.Path(destination)
+    # One file per region can be fetched in a folder of its own, the source of a sharded index
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = destination.with_name(f".{destination.name}.tmp")
+
+    session = create_session(workers)
+
+    try:
+        result = _stream_pages(
+            pending, url, region, date_until, limit, page_size, session, tmp_file, workers, clean_workers
+        )
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    finally:
+        session.close()
+
+    if not result.written and not result.rejected and not allow_empty:
+        tmp_file.unlink()
+        raise ValueError("The API call did not return any data.")
+
+    if result.rejected:
+        logger.warning("Documents received from API did not pass validation: %i", result.rejected)
+
+    if dataset.is_partitioned(destination):
+        try:
+            with metrics.span("parquet_write"):
+                dataset.write_region(pl.scan_parquet(tmp_file), destination, region)
+        finally:
+            tmp_file.unlink()
+    else:
+        os.replace(tmp_file, destination)
+    logger.info("Final data rows: %i", result.written)
+    logger.info("Data saved to '%s'", destination)
+    return result
+
+def _stream_pages(
+    pending: deque,
+    url: str,
+    region: str,
+    date_until: str,
+    limit: int,
+    page_size: int,
+    session: requests.Session,
+    output_file: pathlib.Path,
+    workers: int,
+    clean_workers: int,
+) -> FetchResult:
+    """
+    Fetch the `pending` pages with `workers` threads and append each validated page
+    to `output_file`, the HTML being cleaned by `clean_workers` processes.
+    """
+    # Imported here: pyarrow.parquet is slow to import, and only the paginated fetch writes with it
+    import pyarrow.parquet as pq
+
+    result = FetchResult()
+    arrow_schema = pl.DataFrame(schema=validation.EVENT_SCHEMA).to_arrow().schema
+
+    with cleaning_pool(clean_workers) as cleaner, \
+            ThreadPoolExecutor(max_workers=workers) as executor, \
+            pq.ParquetWriter(output_file, arrow_schema) as writer, \
+            ErrorWriter() as error_writer:
+        in_flight = {}
+
+        while (pending or in_flight) and result.written < limit:
+            # Only `workers` pages are held at once, whatever the size of the region
+            while pending and len(in_flight) < workers:
+                page = pending.popleft()
+                params = {
+                    'where': page.where(region, date_until),
+                    'order_by': config.ID_COLUMN,
+                    'limit': page_size,
+                    'offset': page.offset,
+                }
+                in_flight[executor.submit(get_json_from_api, url, params, session=session)] = page
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                page = in_flight.pop(future)
+                data_raw = future.result()
+                logger.debug("Page %s: %i documents", page, len(data_raw))
+
+                if len(data_raw) >= page_size:
+                    pending.append(replace(page, offset=page.offset + page_size))
+
+                updated = [doc["updatedat"] for doc in data_raw if doc.get("updatedat")]
+                if updated:
+                    result.updated_max = max(updated + [result.updated_max or ""])
+
+                with metrics.span("validate"):
+                    df, wrong_data_list = validation.validate_batch(data_raw, executor=cleaner, region=region)
+                result.rejected += len(wrong_data_list)
+                result.rejected_ids.extend(
+                    item["doc"][config.ID_COLUMN] for item in wrong_data_list
+                    if isinstance(item["doc"], dict) and isinstance(item["doc"].get(config.ID_COLUMN), str)
+                )
+                metrics.count("rejected_records", len(wrong_data_list))
+                error_writer.write(wrong_data_list)
+
+                df = df.head(limit - result.written)
+                if len(df):
+                    with metrics.span("parquet_write"):
+                        writer.write_table(df.to_arrow().cast(arrow_schema))
+                    result.written += len(df)
+
+        for future in in_flight:
+            future.cancel()
+
+    return result
+
+def split_date_range(start: datetime, end: datetime, page_days: int) -> Iterator[Page]:
+    """ Split [start, end] in consecutive windows of `page_days` days. """
+    step = timedelta(days=max(page_days, 1))
+    end = end + timedelta(seconds=1)  # the last window must include `end`
+    while start < end:
+        yield Page(start=start, end=min(start + step, end))
+        start += step
+
+def create_session(workers: int) -> requests.Session:
+    """
+    Return a `requests.Session` with a connection pool sized for `workers`
+    threads, retrying on connection errors, 429 and 5xx with exponential backoff.
+    """
+    retry = Retry(
+        total=config.FETCH_RETRIES,
+        backoff_factor=config.FETCH_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def write_errors(wrong_data_list: List[Dict[str, Any]]) -> None:
+    """ Write the validation errors to the error file, one JSON object per line. """
+    with ErrorWriter() as error_writer:
+        error_writer.write(wrong_data_list)
+
+class ErrorWriter:
+    """
+    Context manager appending validation errors to `config.ERROR_FILE` (.jsonl).
+    The file is truncated on the first error of the run, so a run without errors
+    keeps those of the previous one; nothing is written if `config.WRITE_ERRORS` is False.
+    """
+    def __enter__(self) -> "ErrorWriter":
+        self.file = None
+        return self
+
+    def write(self, wrong_data_list: List[Dict[str, Any]]) -> None:
+        if not config.WRITE_ERRORS or not wrong_data_list:
+            return
+        if self.file is None:
+            error_file = config.ERROR_FILE.with_suffix(".jsonl")
+
+            if not error_file.exists():
+                logger.info("Error file does not exist, creating error file: `%s`.", error_file)
+
+            self.file = error_file.open("w", encoding="utf-8")
+        for item in wrong_data_list:
+            json.dump(item, self.file, ensure_ascii=False, default=str)
+            self.file.write("\n")
+
+    def __exit__(self, *exc) -> None:
+        if self.file is not None:
+            self.file.close()
+
 def setup_folders() -> None:
     """" Make sure the various data folders exist. Create them if missing. """
     if not config.DATA.exists():
@@ -125,20 +522,25 @@ def setup_folders() -> None:
 def get_json_from_api(
         url: str, 
         params: Dict[str, str] = None,
-        timeout: Optional[int] = 10
+        timeout: Optional[int] = 10,
+        session: Optional[requests.Session] = None
 ) -> List[Dict[str, Any]]:
     """
     Fetch JSON from an API and return it as a list of dictionaries.
     Wraps single-dict responses in a list for consistency.
+    Uses `session` (connection pool, retries) when given.
     """
     if params is None:
         params = {}
 
     try:
-        response = requests.get(url=url, params=params, timeout=timeout)
-        response.raise_for_status()
-        data = response.json()
-        return data if isinstance(data, list) else [data]
+        with metrics.span("fetch_http"):
+            response = (session or requests).get(url=url, params=params, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        data = data if isinstance(data, list) else [data]
+        metrics.count("fetched_records", len(data))
+        return data
     
     except requests.exceptions.RequestException as e:
         raise ValueError(f"Request failed: {e}")
@@ -149,5 +551,5 @@ if __name__== "__main__":
        limit=10,
        since=config.SINCE,
        until=config.UNTIL,
-       destination=config.DATA_FILE
+       destination=config.EVENTS_DATASET
    ) 
\ No newline at end of file
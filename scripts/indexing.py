@@ -2,26 +2,50 @@
 Script for creating a Faiss vector database from the api data retrieved.
 
 Steps:
-    - Loading parquet file from source
-    - Creating Document(text+meta) for training
+    - Loading the events from the source dataset (see rag_poc.dataset): only the partitions
+      of the date window asked for, and only the embedded, id and `config.METADATA_COLUMNS` columns
+    - Creating the documents table (page_content + metadata columns), by Polars / Arrow column operations
+    - Optionally splitting the long page_content in overlapping chunks, one vector each
     - Create embedding with mistral
     - Create Faiss Index
-    - Save vector store (index, meta, text) in destination
+    - Save vector store (index, meta, text, BM25 lexical index) in destination, see rag_poc.vector_store
+
+Each vector is stored under a 63-bit id derived from the document id, and each
+document keeps the hash of its content. An incremental build diffs the source
+against the saved store, embeds only the new or changed documents and removes
+the deleted ones.
+
+With a `chunk_size`, the documents longer than `chunk_size` characters are split
+in overlapping chunks (see `chunk_documents`); the searches collapse the chunks
+found back to their events, see `VectorStore.parent_documents`.
 """
-import faiss
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from hashlib import blake2b
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS 
 from langchain_mistralai import MistralAIEmbeddings
 import logging
+import multiprocessing
+import numpy as np
 import os
 import pathlib
 import polars as pl
-from typing import List, Dict, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import shutil
+import threading
+import time
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Sequence
 from uuid import uuid4
 
-from rag_poc import config 
+from rag_poc import config, dataset, faiss_index, metrics
+from rag_poc.embedding_cache import CachedEmbeddings, EmbeddingCache
+from rag_poc.sharding import SHARDS_FILE, read_layout, save_layout, shard_folder
+from rag_poc.vector_store import (
+    CHUNK_COLUMNS, RESERVED_COLUMNS, VectorStore, chunk_id, content_hash, documents_table, faiss_id,
+    row_to_document, save_store
+)
 
 logger = logging.getLogger(__name__)
 
@@ -29,53 +53,589 @@ def build_index(
     source: pathlib.Path,
     destination: pathlib.Path,
     columns: List[str],
-    id_column: Optional[str] = None
+    id_column: Optional[str] = None,
+    incremental: bool = False,
+    batch_tokens: int = config.EMBED_BATCH_TOKENS,
+    concurrency: int = config.EMBED_CONCURRENCY,
+    rate: float = config.EMBED_REQUESTS_PER_SECOND,
+    index_type: str = config.INDEX_TYPE,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    chunk_size: Optional[int] = config.CHUNK_SIZE,
+    chunk_overlap: int = config.CHUNK_OVERLAP,
+    pca_dim: Optional[int] = config.VECTOR_PCA_DIM,
+    quantize: Optional[str] = config.VECTOR_QUANTIZE,
+    shard_by: Optional[str] = config.SHARD_BY,
+    shards: Optional[Sequence[str]] = None,
+    shard_workers: int = config.SHARD_WORKERS,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
 ) -> None:
     """
     Building a FAISS for similarity search.
+
+    `source` is an events dataset (see rag_poc.dataset), a Parquet file, or a folder
+    of Parquet files (one per fetched region for instance). Only the events beginning
+    in [`start`, `end`) are read, and of them the `columns`, the `id_column` and the
+    `config.METADATA_COLUMNS`: the store (or the shards built) then holds the events
+    of this window, an incremental build removing the others.
+
+    `index_type` is one of `faiss_index.INDEX_TYPES`; approximate indexes are
+    trained on a sample of the vectors, and `nprobe` / `ef_search` override their
+    default search parameters. Both are saved with the store, along with a
+    BM25 index of the texts and of the `config.LEXICAL_FIELDS` for the hybrid search.
+    With `pca_dim` and / or `quantize` ("fp16" or "int8"), the index stores the vectors
+    reduced by a PCA and / or scalar-quantized (see rag_poc.faiss_index); the PCA
+    is saved in the index and applied to the queries.
+
+    With a `chunk_size`, each document longer than `chunk_size` characters is
+    indexed as chunks overlapping by `chunk_overlap` characters (`chunk_documents`).
+
+    With `incremental`, the store saved in `destination` is updated instead:
+    only the documents that are new or whose content changed are embedded,
+    and the documents missing from `source` are removed.
+
+    With a `shard_by` key ("region" or "month"), `destination` is a sharded
+    store (see rag_poc.sharding), built by `build_shards` with `shard_workers`
+    processes; only the `shards` named are built when given.
+
+    The embedding requests are batches of at most `batch_tokens` (estimated) tokens,
+    sent by `concurrency` threads at no more than `rate` requests per second.
+    Finished batches are checkpointed, so an interrupted build resumes where it stopped.
     """
     if not os.path.exists(source):
         raise FileNotFoundError(f"Path {source} does not exist.")
 
-    df: pl.DataFrame = pl.read_parquet(source)
+    df: pl.DataFrame = read_source(
+        source, start=start, end=end,
+        regions=shards if shard_by == "region" and shards else None,
+        columns=[*columns, *([id_column] if id_column else []), *config.METADATA_COLUMNS]
+    )
     logger.debug("Dataframe shape: rows=%i, col=%i", df.shape[0], df.shape[1])
 
     if df.is_empty():
         raise ValueError("The Dataframe is empty")
 
-    embeddings = MistralAIEmbeddings(
-        api_key=config.load_api_key(),
-        model="mistral-embed"     
+    options = dict(
+        columns=columns, id_column=id_column, incremental=incremental,
+        batch_tokens=batch_tokens, concurrency=concurrency, rate=rate,
+        index_type=index_type, nprobe=nprobe, ef_search=ef_search,
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, pca_dim=pca_dim, quantize=quantize,
     )
+    if shard_by:
+        build_shards(df, destination, shard_by, shards, shard_workers, **options)
+        return
 
-    index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
+    build_store(df, destination, **options)
+    if read_layout(destination) is not None:
+        # The sharded store previously in `destination` would still be opened first
+        drop_shards(destination)
 
-    vector_store = FAISS(
-        embedding_function=embeddings,
-        index=index,
-        docstore=InMemoryDocstore(),
-        index_to_docstore_id={},
+def build_store(
+    df: pl.DataFrame,
+    destination: pathlib.Path,
+    columns: List[str],
+    id_column: Optional[str] = None,
+    incremental: bool = False,
+    batch_tokens: int = config.EMBED_BATCH_TOKENS,
+    concurrency: int = config.EMBED_CONCURRENCY,
+    rate: float = config.EMBED_REQUESTS_PER_SECOND,
+    index_type: str = config.INDEX_TYPE,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    chunk_size: Optional[int] = config.CHUNK_SIZE,
+    chunk_overlap: int = config.CHUNK_OVERLAP,
+    pca_dim: Optional[int] = config.VECTOR_PCA_DIM,
+    quantize: Optional[str] = config.VECTOR_QUANTIZE,
+    cache_folder: Optional[pathlib.Path] = None
+) -> None:
+    """
+    Build, or update with `incremental`, the vector store of the events of `df`
+    in `destination`: see `build_index` for the parameters. The embeddings are
+    cached in `cache_folder` (default `config.EMBEDDING_CACHE_FOLDER`).
+    """
+    embeddings = CachedEmbeddings(
+        get_embeddings(),
+        EmbeddingCache(cache_folder or config.EMBEDDING_CACHE_FOLDER, config.EMBEDDING_MODEL)
     )
 
     if id_column:
         ids: list = retrieve_id_column_from_df(df, id_column)
         if not len(ids) == len(set(ids)):
-            logger.warning("The id_column from the dataframe contains duplicate ids.")
+            logger.warning("The id_column from the dataframe contains duplicate ids, the last row of each is kept.")
             logger.warning("number of ids: %i, number of unique ids: %i", len(ids), len(set(ids)))
 
         df: pl.DataFrame = df.drop(pl.col(id_column))
     else:
         ids: list = create_uuids(df.shape[0])
 
-    documents: List[Document] = df_to_documents(df, columns) 
+    documents: pa.Table = documents_frame(df, columns, ids)
+    del df
     logging.debug("len(documents)=%i", len(documents))
 
-    vector_store.add_documents(documents=documents, ids=ids)
-    logging.info("%i documents added to the vector store.", len(documents))
+    chunking = {"size": chunk_size, "overlap": chunk_overlap} if chunk_size else None
+    if chunking:
+        n_documents = len(documents)
+        documents = chunk_documents(documents, chunk_size, chunk_overlap)
+        logger.info("%i documents split in %i chunks.", n_documents, len(documents))
+
+    vector_store = load_vector_store(destination) if incremental else None
+    params = vector_store.manifest["index"] if vector_store is not None else None
+
+    if vector_store is not None and params.get("requested_type", params["index_type"]) != index_type:
+        logger.warning("The store index is '%s', not '%s': building a new one.", params["index_type"], index_type)
+        vector_store = None
+
+    if vector_store is not None and (params.get("requested_pca_dim"), params.get("quantize")) != (pca_dim, quantize):
+        logger.warning(
+            "The store vectors are stored with pca_dim=%s, quantize=%s, not %s, %s: building a new one.",
+            params.get("requested_pca_dim"), params.get("quantize"), pca_dim, quantize
+        )
+        vector_store = None
 
-    vector_store.save_local(destination)
+    if vector_store is not None and vector_store.chunking != chunking:
+        logger.warning("The store chunking is %s, not %s: building a new one.", vector_store.chunking, chunking)
+        vector_store = None
+
+    if vector_store is None:
+        to_add = documents
+    else:
+        to_add, to_remove = diff_vector_store(vector_store, documents)
+        if to_remove and not faiss_index.supports_removal(params):
+            logger.warning("The '%s' index does not support removal: building a new one.", index_type)
+            vector_store, to_add = None, documents
+        else:
+            remove_documents(vector_store, to_remove)
+
+    checkpoint_folder = checkpoint_path(destination)
+    vectors = embed_documents(
+        embeddings, iter_texts(to_add),
+        batch_tokens=batch_tokens, concurrency=concurrency, rate=rate,
+        checkpoint_folder=checkpoint_folder
+    )
+    logger.info(
+        "Embedding cache: %i hits, %i misses (hit rate %.0f%%).",
+        embeddings.cache.hits, embeddings.cache.misses, 100 * embeddings.cache.hit_rate
+    )
+
+    if vector_store is None:
+        # The dimension is read from the vectors, no call is spent on a probe query
+        index, params = faiss_index.create_index(
+            index_type, vectors, nprobe=nprobe, ef_search=ef_search, pca_dim=pca_dim, quantize=quantize
+        )
+        vector_store = VectorStore({"version": None, "index": params}, index, documents_table({}))
+    else:
+        params.update({k: v for k, v in (("nprobe", nprobe), ("efSearch", ef_search)) if v and k in params})
+        faiss_index.apply_search_params(vector_store.index, params)
+
+    add_documents_with_ids(vector_store, to_add, vectors)
+    logging.info("%i documents added to the vector store.", len(to_add))
+
+    save_store(
+        destination, vector_store.index, vector_store.documents, params, config.EMBEDDING_MODEL,
+        lexical_fields=config.LEXICAL_FIELDS, chunking=chunking
+    )
+    shutil.rmtree(checkpoint_folder, ignore_errors=True)
     logging.info("Vector store saved to '%s'.", destination)
 
+def build_shards(
+    df: pl.DataFrame,
+    destination: pathlib.Path,
+    shard_by: str,
+    shards: Optional[Sequence[str]] = None,
+    workers: int = config.SHARD_WORKERS,
+    **options
+) -> None:
+    """
+    Build the sharded store of `df` in `destination`: one store (`build_store`,
+    with `options`) per value of the `shard_by` key of the events, see `shard_keys`.
+
+    With `shards`, only these shards are built and the others of the store kept;
+    without, every shard is built and the shards without events any more are removed.
+    A store sharded by another key is rebuilt entirely.
+
+    With `workers` > 1, the shards are built by a pool of processes sharing the
+    embedding `rate` and `concurrency`. An embedding cache has one writer at a
+    time, so each process caches the vectors of its shard in its own folder.
+    """
+    destination = pathlib.Path(destination)
+    keys = shard_keys(df, shard_by)
+    if keys.null_count():
+        logger.warning("%i events without a %s are left out of the shards.", keys.null_count(), shard_by)
+    names = sorted(set(keys.drop_nulls().to_list()))
+
+    layout = read_layout(destination)
+    if layout is not None and layout["shard_by"] != shard_by:
+        logger.warning("The store is sharded by %s, not %s: building every shard.", layout["shard_by"], shard_by)
+        layout, shards = None, None
+    folders: Dict[str, str] = dict(layout["shards"]) if layout is not None else {}
+
+    if shards:
+        missing = sorted(set(shards) - set(names))
+        if missing:
+            logger.warning("No events for the shards %s.", missing)
+        names = [name for name in names if name in set(shards)]
+    removed = {} if shards else {name: folder for name, folder in folders.items() if name not in names}
+
+    workers = max(1, min(workers, len(names)))
+    options = {
+        **options,
+        "rate": options.get("rate", config.EMBED_REQUESTS_PER_SECOND) / workers,
+        "concurrency": max(1, options.get("concurrency", config.EMBED_CONCURRENCY) // workers),
+    }
+    jobs = {name: (df.filter(keys == name), shard_folder(name)) for name in names}
+    del df
+
+    if workers > 1:
+        level = logging.getLogger().getEffectiveLevel()
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=config.setup_logging, initargs=(level,)
+        ) as pool:
+            futures = {
+                pool.submit(
+                    build_store, part, destination / folder,
+                    cache_folder=config.EMBEDDING_CACHE_FOLDER / "shards" / folder, **options
+                ): name
+                for name, (part, folder) in jobs.items()
+            }
+            for future in as_completed(futures):
+                future.result()
+                logger.info("Shard '%s' built.", futures[future])
+    else:
+        for name, (part, folder) in jobs.items():
+            build_store(part, destination / folder, **options)
+            logger.info("Shard '%s' built.", name)
+
+    folders = {name: folder for name, folder in folders.items() if name not in removed}
+    folders.update({name: folder for name, (_, folder) in jobs.items()})
+    save_layout(destination, shard_by, folders)
+    for folder in removed.values():
+        shutil.rmtree(destination / folder, ignore_errors=True)
+    logger.info("Sharded store saved to '%s': %i shards, %i built.", destination, len(folders), len(jobs))
+
+def shard_keys(df: pl.DataFrame, shard_by: str) -> pl.Series:
+    """
+    Shard of each event of `df`: its `location_region`, or the month of its
+    `firstdate_begin` ("2025-06").
+
+    Raises:
+        ValueError for another `shard_by`, or without the column of the key.
+    """
+    column = {"region": "location_region", "month": "firstdate_begin"}.get(shard_by)
+    if column is None:
+        raise ValueError(f"Unknown shard key '{shard_by}', expected one of {config.SHARD_BY_TYPES}.")
+    if column not in df.columns:
+        raise ValueError(f"The events have no '{column}' column to shard by {shard_by}, fetch them again.")
+    if shard_by == "month":
+        return df.get_column(column).dt.strftime("%Y-%m")
+    return df.get_column(column)
+
+def drop_shards(destination: pathlib.Path) -> None:
+    """ Remove the shards file and the shards of the store in `destination`. """
+    layout = read_layout(destination)
+    (pathlib.Path(destination) / SHARDS_FILE).unlink(missing_ok=True)
+    for folder in layout["shards"].values():
+        shutil.rmtree(pathlib.Path(destination) / folder, ignore_errors=True)
+    logger.info("Shards of '%s' removed.", destination)
+
+def read_source(
+    source: pathlib.Path,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    regions: Optional[Sequence[str]] = None,
+    columns: Optional[Sequence[str]] = None
+) -> pl.DataFrame:
+    """
+    The events of `source` (see `dataset.scan_events`) beginning in [`start`, `end`),
+    of the `regions`, with the `columns` found in them (all without).
+    """
+    return dataset.scan_events(source, start=start, end=end, regions=regions, columns=columns).collect()
+
+def get_embeddings() -> MistralAIEmbeddings:
+    # Retries are handled by `embed_batch`, which knows about the other workers
+    return MistralAIEmbeddings(
+        api_key=config.load_api_key(),
+        model=config.EMBEDDING_MODEL,
+        max_retries=1
+    )
+
+def embed_documents(
+    embeddings: CachedEmbeddings,
+    chunks: Iterable[List[str]],
+    batch_tokens: int = config.EMBED_BATCH_TOKENS,
+    concurrency: int = config.EMBED_CONCURRENCY,
+    rate: float = config.EMBED_REQUESTS_PER_SECOND,
+    checkpoint_folder: Optional[pathlib.Path] = None
+) -> np.ndarray:
+    """
+    Embed the texts of `chunks` (see `iter_texts`), as a (n, dim) float32 matrix
+    in the order of the texts. The texts found in the embedding cache are not sent;
+    the others go through `embed_texts` and are added to the cache batch by batch.
+    Only one chunk of texts is held in memory at a time.
+    """
+    results = []
+    for texts in chunks:
+        cached = embeddings.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+        computed = embed_texts(
+            embeddings.embeddings, missing,
+            batch_tokens=batch_tokens, concurrency=concurrency, rate=rate,
+            checkpoint_folder=checkpoint_folder, on_batch=embeddings.cache.put_many
+        )
+        by_text = dict(zip(missing, computed))
+        results.append(np.stack([by_text[text] if vector is None else vector for text, vector in zip(texts, cached)]))
+
+    if not results:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(results)
+
+def embed_texts(
+    embeddings,
+    texts: List[str],
+    batch_tokens: int = config.EMBED_BATCH_TOKENS,
+    concurrency: int = config.EMBED_CONCURRENCY,
+    rate: Optional[float] = config.EMBED_REQUESTS_PER_SECOND,
+    checkpoint_folder: Optional[pathlib.Path] = None,
+    on_batch: Optional[Callable[[List[str], np.ndarray], None]] = None
+) -> np.ndarray:
+    """
+    Embed `texts` with the `embeddings` backend, in token-budgeted batches sent
+    concurrently by `concurrency` threads, throttled to `rate` requests per second.
+
+    Each finished batch is saved in `checkpoint_folder` (if given) and passed to
+    `on_batch`. Batches already in the checkpoint are not sent again.
+    When a batch fails, the other batches still finish and are checkpointed
+    before the error is raised.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    batches = make_batches(texts, batch_tokens)
+    checkpoint = EmbeddingCheckpoint(checkpoint_folder) if checkpoint_folder else None
+    bucket = TokenBucket(rate) if rate else None
+    results: List[Optional[np.ndarray]] = [None] * len(batches)
+
+    if checkpoint:
+        for i, batch in enumerate(batches):
+            results[i] = checkpoint.load(batch)
+            if results[i] is not None and on_batch:
+                on_batch(batch, results[i])
+    todo = [i for i, vectors in enumerate(results) if vectors is None]
+    logger.info(
+        "Embedding %i texts: %i batches, %i from checkpoint, concurrency=%i, rate=%s/s.",
+        len(texts), len(batches), len(batches) - len(todo), concurrency, rate
+    )
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(embed_batch, embeddings, batches[i], bucket): i for i in todo}
+
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            if checkpoint:
+                checkpoint.save(batches[i], results[i])
+            if on_batch:
+                on_batch(batches[i], results[i])
+            logger.debug("Batch %i/%i embedded (%i texts).", i + 1, len(batches), len(batches[i]))
+
+    if errors:
+        logger.error("%i embedding batches failed, the finished ones are checkpointed.", len(errors))
+        raise errors[0]
+
+    return np.concatenate(results)
+
+def embed_batch(embeddings, texts: List[str], bucket: Optional["TokenBucket"] = None) -> np.ndarray:
+    """
+    Embed one batch, retrying on 429 and 5xx responses.
+    A 429 pauses the shared `bucket`, so every worker backs off, not only this one.
+    """
+    for attempt in range(config.EMBED_MAX_RETRIES + 1):
+        if bucket:
+            bucket.acquire()
+        try:
+            with metrics.span("embed_batch"):
+                vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+            metrics.count("embedded_texts", len(texts))
+            return vectors
+        except Exception as e:
+            response = http_response(e)
+            if response is None or response.status_code not in RETRY_STATUSES or attempt == config.EMBED_MAX_RETRIES:
+                raise
+
+            delay = config.EMBED_BACKOFF * 2 ** attempt
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                delay = max(delay, float(retry_after))
+            logger.warning("Embedding request failed (%i), retrying in %.2fs.", response.status_code, delay)
+
+            if bucket and response.status_code == 429:
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+def http_response(error: BaseException):
+    """ Find the HTTP response behind `error` (httpx/requests error, possibly wrapped by tenacity). """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        response = getattr(error, "response", None)
+        if response is not None and hasattr(response, "status_code"):
+            return response
+        last_attempt = getattr(error, "last_attempt", None)
+        error = (last_attempt.exception() if last_attempt else None) or error.__cause__ or error.__context__
+    return None
+
+def estimate_tokens(text: str) -> int:
+    """ Conservative token count estimate, without a tokenizer. """
+    return len(text) // config.EMBED_CHARS_PER_TOKEN + 1
+
+def make_batches(texts: List[str], batch_tokens: int) -> List[List[str]]:
+    """ Pack consecutive texts in batches of at most `batch_tokens` estimated tokens. """
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    tokens = 0
+
+    for text in texts:
+        text_tokens = estimate_tokens(text)
+        if batch and tokens + text_tokens > batch_tokens:
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += text_tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` requests per second, in bursts of
+    at most `capacity`. `pause` blocks every caller for a while (after a 429).
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+class EmbeddingCheckpoint:
+    """ Finished batches saved as .npy files named by the hash of their texts. """
+    def __init__(self, folder: pathlib.Path):
+        self.folder = pathlib.Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, texts: List[str]) -> pathlib.Path:
+        digest = blake2b("\0".join(texts).encode("utf-8"), digest_size=16).hexdigest()
+        return self.folder / f"{digest}.npy"
+
+    def load(self, texts: List[str]) -> Optional[np.ndarray]:
+        path = self._path(texts)
+        return np.load(path) if path.exists() else None
+
+    def save(self, texts: List[str], vectors: np.ndarray) -> None:
+        path = self._path(texts)
+        tmp_file = path.with_name(f".{path.stem}.tmp.npy")
+        np.save(tmp_file, vectors)
+        os.replace(tmp_file, path)
+
+def checkpoint_path(destination: pathlib.Path) -> pathlib.Path:
+    destination = pathlib.Path(destination)
+    return destination.with_name(f".{destination.name}.checkpoint")
+
+def load_vector_store(destination: pathlib.Path) -> Optional[VectorStore]:
+    """
+    Load the vector store saved in `destination` in memory, for an incremental update.
+    Returns None if there is no store, or if it was embedded with another model.
+    """
+    try:
+        vector_store = VectorStore.load(destination, mmap=False)
+    except FileNotFoundError:
+        logger.warning("No vector store in '%s', building a new one.", destination)
+        return None
+
+    if vector_store.manifest.get("embedding_model") != config.EMBEDDING_MODEL:
+        logger.warning("The vector store in '%s' uses another embedding model, building a new one.", destination)
+        return None
+
+    return vector_store
+
+def diff_vector_store(vector_store: VectorStore, documents: pa.Table) -> tuple:
+    """
+    Diff the `documents` table (see `documents_frame`) against the store by content hash.
+    Returns the rows to add (new or changed) and the ids to remove (missing or changed).
+    """
+    stored = vector_store.documents
+
+    def keys(table: pa.Table) -> pa.ChunkedArray:
+        return pc.binary_join_element_wise(
+            table.column("doc_id").cast(pa.string()), table.column("content_hash").cast(pa.string()), "\0"
+        )
+
+    to_add = documents.filter(pc.invert(pc.is_in(keys(documents), value_set=keys(stored).combine_chunks())))
+    stored_ids = stored.column("doc_id").cast(pa.string())
+    kept = pc.is_in(stored_ids, value_set=documents.column("doc_id").cast(pa.string()).combine_chunks())
+    changed = pc.is_in(stored_ids, value_set=to_add.column("doc_id").cast(pa.string()).combine_chunks())
+    to_remove = stored_ids.filter(pc.or_(pc.invert(kept), changed)).to_pylist()
+
+    logger.info(
+        "Incremental update: %i unchanged, %i to embed, %i to remove.",
+        len(documents) - len(to_add), len(to_add), len(to_remove)
+    )
+    return to_add, to_remove
+
+def remove_documents(vector_store: VectorStore, doc_ids: List[str]) -> None:
+    """ Remove `doc_ids` from the index and the documents table. """
+    if not doc_ids:
+        return
+
+    vector_store.index.remove_ids(np.array([faiss_id(doc_id) for doc_id in doc_ids], dtype=np.int64))
+    removed = pc.is_in(vector_store.documents.column("doc_id").cast(pa.string()), value_set=pa.array(doc_ids, pa.string()))
+    vector_store.documents = vector_store.documents.filter(pc.invert(removed))
+    vector_store.reset_caches()
+
+def add_documents_with_ids(vector_store: VectorStore, documents: pa.Table, vectors: np.ndarray) -> None:
+    """ Add the rows of `documents` and their `vectors` (in the same order) to the index under their faiss ids. """
+    if not len(documents):
+        return
+
+    with metrics.span("faiss_add"):
+        vector_store.index.add_with_ids(vectors, documents.column("faiss_id").to_numpy())
+
+    added = documents
+    if len(vector_store.documents):
+        added = pa.concat_tables([vector_store.documents, added], promote_options="permissive")
+    vector_store.documents = added.sort_by("faiss_id")
+    vector_store.reset_caches()
+
 def retrieve_id_column_from_df(df: pl.DataFrame, id_column: str) -> list[int]:
     if id_column not in df.columns:
         raise ValueError("ID column '%s' not in DataFrame." % id_column)
@@ -84,42 +644,155 @@ def retrieve_id_column_from_df(df: pl.DataFrame, id_column: str) -> list[int]:
 def create_uuids(number: int) -> list[str]:
     return [str(uuid4()) for _ in range(number)]
 
-def df_to_documents(df: pl.DataFrame, columns: list[str]) -> list[Document]:
+def page_content_expr(columns: List[str]) -> pl.Expr:
+    """ The non-empty values of `columns`, joined by blank lines, as a Polars expression. """
+    values = [pl.col(col).cast(pl.Utf8) for col in columns]
+    non_empty = [pl.when(value != "").then(value) for value in values]
+    return pl.concat_str(non_empty, separator="\n\n", ignore_nulls=True).alias("page_content")
+
+def documents_frame(df: pl.DataFrame, columns: List[str], ids: Sequence) -> pa.Table:
     """
-    Transform a polars DataFrame into a list of LangChain Documents,
-    with page_content for the RAG and metadata.
+    Columnar documents of `df`: the sidecar table of rag_poc.vector_store, one row
+    per document in the order of `df` (the last row of a duplicated id is kept).
+
+    The page_content (the `columns`, see `page_content_expr`) is computed by Polars,
+    the other columns stay Arrow columns used as metadata, and only the faiss ids
+    and the content hashes are computed row by row.
 
     Parameters:
         df: The polars DataFrame.
-        columns: The list of columns to add to the page_content of the Document.
-    
+        columns: The list of columns to add to the page_content of the documents.
+        ids: The document id of each row.
+
     Raises:
         ValueError if the columns are not in the dataframe.
     """
     if not all(col in df.columns for col in columns):
         raise ValueError("Some columns are missing from the dataframe.")
 
-    docs = df.to_dicts()
-    documents = []
+    reserved = [*RESERVED_COLUMNS, *CHUNK_COLUMNS, "content_hash"]
+    frame = (
+        df.drop([col for col in df.columns if col in reserved])
+        .with_columns(page_content_expr(columns), pl.Series("doc_id", [str(i) for i in ids], dtype=pl.Utf8))
+        .unique(subset="doc_id", keep="last", maintain_order=True)
+    )
+    doc_ids = frame.get_column("doc_id")
+    texts = frame.get_column("page_content")
+    hashes = [content_hash(text) for start in range(0, len(texts), config.INDEX_CHUNK_ROWS)
+              for text in texts.slice(start, config.INDEX_CHUNK_ROWS).to_list()]
 
-    for doc in docs:
-        #adding 'columns' to the page_content
-        text = "\n\n".join(filter(None, [doc.get(col) or "" for col in columns]))
-        #creating metada excluding columns used for the page_content
-        meta = {k:v for k, v in doc.items() if k not in columns}
-        documents.append(Document(page_content=text, metadata=meta))
+    metadata = frame.drop(["doc_id", "page_content", *columns]).to_arrow()
+    return pa.table({
+        "faiss_id": pa.array([faiss_id(doc_id) for doc_id in doc_ids.to_list()], pa.int64()),
+        "doc_id": doc_ids.to_arrow(),
+        "page_content": texts.to_arrow(),
+        **{name: metadata.column(name) for name in metadata.column_names},
+        "content_hash": pa.array(hashes, pa.string()),
+    })
+
+def chunk_documents(documents: pa.Table, chunk_size: int, chunk_overlap: int) -> pa.Table:
+    """
+    One row per chunk of `documents` (see `documents_frame`). A page_content longer
+    than `chunk_size` characters is split by `RecursiveCharacterTextSplitter` in
+    chunks overlapping by at most `chunk_overlap` characters, a shorter one is a
+    single chunk.
+
+    The `n`-th chunk of a document has the id `chunk_id(doc_id, n)`, the metadata
+    and content hash of the document (a changed document replaces all its chunks),
+    and the `CHUNK_COLUMNS`: doc_id, offset of the chunk in the page_content and
+    number of chunks of the document.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, strip_whitespace=False)
+    rows, numbers, starts, counts, texts = [], [], [], [], []
+    row = 0
+    for chunk in iter_texts(documents):
+        for text in chunk:
+            parts = (split_text(splitter, text) if len(text) > chunk_size else None) or [(0, text)]
+            for n, (start, part) in enumerate(parts):
+                rows.append(row)
+                numbers.append(n)
+                starts.append(start)
+                counts.append(len(parts))
+                texts.append(part)
+            row += 1
+
+    chunks = documents.take(pa.array(rows, pa.int64()))
+    doc_ids = [chunk_id(doc_id, n) for doc_id, n in zip(chunks.column("doc_id").to_pylist(), numbers)]
+    return pa.table({
+        "faiss_id": pa.array([faiss_id(doc_id) for doc_id in doc_ids], pa.int64()),
+        "doc_id": pa.array(doc_ids, pa.string()),
+        "page_content": pa.array(texts, pa.string()),
+        **{name: chunks.column(name) for name in chunks.column_names if name not in RESERVED_COLUMNS},
+        "parent_id": chunks.column("doc_id"),
+        "chunk_start": pa.array(starts, pa.int32()),
+        "chunk_count": pa.array(counts, pa.int32()),
+    })
+
+def split_text(splitter: RecursiveCharacterTextSplitter, text: str) -> List[tuple]:
+    """
+    The (offset, chunk) of `text` split by `splitter`, which keeps the whitespace.
+    Each chunk is located at its last occurrence starting within the text covered
+    by the previous ones, so the chunks rebuild `text` whatever its repetitions;
+    a whitespace-only piece is joined to the next chunk.
+    """
+    parts = []
+    end = 0
+    pending: Optional[int] = None
+    for chunk in splitter.split_text(text):
+        start = text.rfind(chunk, 0, end + len(chunk))
+        if start < 0 or start + len(chunk) <= end:
+            continue
+        end = start + len(chunk)
+        if pending is not None:
+            start, pending = min(start, pending), None
+        if not chunk.strip():
+            pending = start
+            continue
+        parts.append((start, text[start:end]))
+    if pending is not None and parts:
+        parts[-1] = (parts[-1][0], text[parts[-1][0]:end])
+    return parts
+
+def iter_texts(documents: pa.Table, chunk_rows: int = config.INDEX_CHUNK_ROWS) -> Iterator[List[str]]:
+    """ The page_content of the rows of `documents`, by chunks of `chunk_rows`. """
+    for batch in documents.select(["page_content"]).to_batches(max_chunksize=chunk_rows):
+        yield batch.column(0).to_pylist()
+
+def iter_documents(documents: pa.Table, chunk_rows: int = config.INDEX_CHUNK_ROWS) -> Iterator[List[Document]]:
+    """ LangChain Documents of the rows of `documents`, created lazily by chunks of `chunk_rows`. """
+    for batch in documents.to_batches(max_chunksize=chunk_rows):
+        yield [row_to_document(row) for row in batch.to_pylist()]
+
+def df_to_documents(df: pl.DataFrame, columns: list[str]) -> list[Document]:
+    """
+    Transform a polars DataFrame into a list of LangChain Documents,
+    with page_content for the RAG and metadata. Builds every document at once:
+    prefer `documents_frame` and `iter_documents` for large frames.
+
+    Parameters:
+        df: The polars DataFrame.
+        columns: The list of columns to add to the page_content of the Document.
+
+    Raises:
+        ValueError if the columns are not in the dataframe.
+    """
+    documents = documents_frame(df, columns, range(len(df)))
+    return [
+        Document(page_content=doc.page_content, metadata={k: v for k, v in doc.metadata.items() if k != "content_hash"})
+        for chunk in iter_documents(documents) for doc in chunk
+    ]
 
-    return documents
-    
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
 
     build_index(
-        source=config.DATA_FILE,        
+        source=config.EVENTS_DATASET,
         destination=config.VECTORS_FOLDER,
         columns=config.COLUMN_EMBEDDING,
-        id_column=config.ID_COLUMN
+        id_column=config.ID_COLUMN,
+        chunk_size=config.CHUNK_SIZE,
+        chunk_overlap=config.CHUNK_OVERLAP
     )
 
     logging.info("✅ Vector store saved.")
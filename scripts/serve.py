@@ -0,0 +1,329 @@
+"""
+Headless retrieval / recommendation HTTP API.
+
+Endpoints:
+    GET  /health     : version and size of the vector store
+    POST /search     : {"query", "k", "filters"} -> {"documents": [...], "timings": {...}}
+    GET  /metrics    : counters and histograms of rag_poc.metrics, Prometheus text format
+                       (404 unless the metrics are enabled, `python -m run --metrics FILE serve`)
+    POST /recommend  : {"query", "k", "filters", "temperature", "stream"} -> {"answer", "documents", "cached", "timings"}
+                       With "stream": true, the response is NDJSON: a {"documents": [...]}
+                       line, one {"token": "..."} line per generated chunk, then
+                       {"done": true, "cached": false, "timings": {...}}.
+                       The answer of a near-identical question asked with the same
+                       settings comes from the answer cache (rag_poc.answer_cache),
+                       with "cached": true and documents without a score.
+
+The optional "filters" restrict the search to some events, see rag_poc.filters:
+    {"start": ISO date, "end": ISO date, "cities": [...], "near": {"lat", "lon"}, "radius_km"}
+
+The event loop only parses requests and writes responses: the query embedding and
+the FAISS search run outside of it, on the process-wide vector store of
+rag_poc.retrieval, and the generation uses the async API of the chat model.
+Concurrent queries are coalesced by a `QueryBatcher` (one embedding call and one
+FAISS search per batch); with `batch_max=1`, each query is searched on its own
+in a bounded thread pool, like the filtered queries. Requests beyond `max_pending`
+in flight are answered 503. The "timings" of a search are its milliseconds in total
+and, outside of a batch, per stage (embed_ms, search_ms, rerank_ms); those of a
+recommendation are its query embedding for the answer cache (embed_ms), retrieval_ms,
+time to first token (ttft_ms) and generate_ms.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+import json
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from langchain.schema import Document
+
+from rag_poc import config, metrics, retrieval
+from rag_poc.answer_cache import CachedAnswer
+from rag_poc.batching import QueryBatcher
+from rag_poc.filters import EventFilter
+
+logger = logging.getLogger(__name__)
+
+MAX_K = 50
+
+POOL = web.AppKey("pool", ThreadPoolExecutor)
+BATCHER = web.AppKey("batcher", QueryBatcher)
+LIMITS = web.AppKey("limits", dict)
+
+dumps = partial(json.dumps, ensure_ascii=False, default=str)
+
+def create_app(
+    workers: int = config.SERVE_WORKERS,
+    max_pending: int = config.SERVE_MAX_PENDING,
+    batch_wait_ms: float = config.QUERY_BATCH_WAIT_MS,
+    batch_max: int = config.QUERY_BATCH_MAX
+) -> web.Application:
+    app = web.Application(middlewares=[limit_pending])
+    app[POOL] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    app[BATCHER] = QueryBatcher(retrieval.search_many, batch_wait_ms / 1000, batch_max) if batch_max > 1 else None
+    app[LIMITS] = {"max_pending": max_pending, "pending": 0}
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_text)
+    app.router.add_post("/search", search)
+    app.router.add_post("/recommend", recommend)
+    app.on_startup.append(open_store)
+    app.on_cleanup.append(close_workers)
+    return app
+
+def run_server(
+    host: str = config.SERVE_HOST,
+    port: int = config.SERVE_PORT,
+    workers: int = config.SERVE_WORKERS,
+    max_pending: int = config.SERVE_MAX_PENDING,
+    batch_wait_ms: float = config.QUERY_BATCH_WAIT_MS,
+    batch_max: int = config.QUERY_BATCH_MAX
+) -> None:
+    logger.info("Serving on http://%s:%i (%i search workers, batches of %i).", host, port, workers, batch_max)
+    web.run_app(create_app(workers, max_pending, batch_wait_ms, batch_max), host=host, port=port, print=None)
+
+# ------ lifecycle ------
+
+async def open_store(app: web.Application) -> None:
+    """ Open the store before the first request; a missing store stops the server. """
+    store = await asyncio.get_running_loop().run_in_executor(app[POOL], retrieval.get_vector_store)
+    logger.info("Vector store version %s: %i documents.", store.version, len(store))
+
+async def close_workers(app: web.Application) -> None:
+    if app[BATCHER] is not None:
+        app[BATCHER].close()
+        logger.info("Mean query batch size: %.1f.", app[BATCHER].mean_batch_size)
+    app[POOL].shutdown(wait=False, cancel_futures=True)
+
+@web.middleware
+async def limit_pending(request: web.Request, handler):
+    limits = request.app[LIMITS]
+    if limits["pending"] >= limits["max_pending"]:
+        return web.json_response({"error": "Too many requests in flight."}, status=503, dumps=dumps)
+
+    limits["pending"] += 1
+    try:
+        return await handler(request)
+    finally:
+        limits["pending"] -= 1
+
+# ------ handlers ------
+
+async def health(request: web.Request) -> web.Response:
+    # Opening a new store version reads it from disk: kept off the event loop
+    store = await asyncio.get_running_loop().run_in_executor(request.app[POOL], retrieval.get_vector_store)
+    return web.json_response({"status": "ok", "version": store.version, "documents": len(store)}, dumps=dumps)
+
+async def metrics_text(request: web.Request) -> web.Response:
+    if not metrics.enabled():
+        raise web.HTTPNotFound(text=dumps({"error": "The metrics are disabled."}), content_type="application/json")
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+async def search(request: web.Request) -> web.Response:
+    body = await read_body(request)
+    timings: Dict[str, float] = {}
+    results = await run_search(request.app, body["query"], body["k"], body["filters"], timings)
+    documents = [document_to_json(doc, score) for doc, score in results]
+    return web.json_response({"documents": documents, "timings": timings}, dumps=dumps)
+
+async def recommend(request: web.Request) -> web.StreamResponse:
+    body = await read_body(request)
+    timings: Dict[str, float] = {}
+    loop = asyncio.get_running_loop()
+    cache = retrieval.get_answer_cache()
+    vector = None
+    if cache is not None:
+        lookup = partial(
+            retrieval.lookup_answer, body["query"], body["k"], body["temperature"], cache, body["filters"], timings
+        )
+        vector, context, hit = await loop.run_in_executor(request.app[POOL], lookup)
+        if hit is not None:
+            return await send_cached_answer(request, body, hit, timings)
+
+    results = await run_search(request.app, body["query"], body["k"], body["filters"], timings, vector)
+    timings["retrieval_ms"] = timings.pop("total_ms")
+    metrics.observe("query_retrieval", timings["retrieval_ms"])
+    docs = [doc for doc, _ in results]
+    documents = [document_to_json(doc, score) for doc, score in results]
+
+    prompt = retrieval.build_prompt(body["query"], docs)
+    model = retrieval.get_chat_model(body["temperature"])
+    # The generated answer is cached off the event loop: the sqlite backend writes to disk
+    cache_answer = (
+        partial(cache.put, body["query"], vector, context, documents=docs) if cache is not None else None
+    )
+
+    if not body["stream"]:
+        start = time.perf_counter()
+        message = await model.ainvoke(prompt)
+        timings["generate_ms"] = 1000 * (time.perf_counter() - start)
+        metrics.observe("query_generate", timings["generate_ms"])
+        if cache_answer is not None:
+            await loop.run_in_executor(request.app[POOL], partial(cache_answer, answer=message.content))
+        return web.json_response(
+            {"answer": message.content, "documents": documents, "cached": False, "timings": timings}, dumps=dumps
+        )
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+    await response.prepare(request)
+    await write_line(response, {"documents": documents})
+    parts = []
+    start = time.perf_counter()
+    try:
+        async for chunk in model.astream(prompt):
+            if chunk.content:
+                if "ttft_ms" not in timings:
+                    timings["ttft_ms"] = 1000 * (time.perf_counter() - start)
+                    metrics.observe("query_ttft", timings["ttft_ms"])
+                metrics.count("generated_chunks")
+                parts.append(chunk.content)
+                await write_line(response, {"token": chunk.content})
+    except Exception as e:
+        logger.exception("Generation failed.")
+        await write_line(response, {"error": str(e)})
+    else:
+        timings["generate_ms"] = 1000 * (time.perf_counter() - start)
+        metrics.observe("query_generate", timings["generate_ms"])
+        if cache_answer is not None:
+            await loop.run_in_executor(request.app[POOL], partial(cache_answer, answer="".join(parts)))
+        await write_line(response, {"done": True, "cached": False, "timings": timings})
+    logger.info("Recommendation timings: %s", retrieval.format_timings(timings))
+    await response.write_eof()
+    return response
+
+async def send_cached_answer(
+    request: web.Request,
+    body: Dict[str, Any],
+    hit: CachedAnswer,
+    timings: Dict[str, float]
+) -> web.StreamResponse:
+    """ The answer of the cache, in the response format of `recommend`; its documents have no score. """
+    documents = [document_to_json(doc, None) for doc in hit.documents]
+    if not body["stream"]:
+        return web.json_response(
+            {"answer": hit.answer, "documents": documents, "cached": True, "timings": timings}, dumps=dumps
+        )
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+    await response.prepare(request)
+    await write_line(response, {"documents": documents})
+    await write_line(response, {"token": hit.answer})
+    await write_line(response, {"done": True, "cached": True, "timings": timings})
+    await response.write_eof()
+    return response
+
+# ------ helpers ------
+
+async def read_body(request: web.Request) -> Dict[str, Any]:
+    """
+    Parse and validate the JSON body of a query request.
+
+    Raises:
+        HTTPBadRequest if the body is not JSON, or the query or the parameters are invalid.
+    """
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise bad_request("The body must be JSON.")
+
+    query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        raise bad_request("'query' must be a non-empty string.")
+
+    # bool is a subclass of int: true / false are not numbers here
+    k = body.get("k", 3)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_K:
+        raise bad_request(f"'k' must be an integer between 1 and {MAX_K}.")
+
+    temperature = body.get("temperature", 0.7)
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0.0 <= temperature <= 1.0:
+        raise bad_request("'temperature' must be between 0 and 1.")
+
+    stream = body.get("stream", False)
+    if not isinstance(stream, bool):
+        raise bad_request("'stream' must be a boolean.")
+
+    return {
+        "query": query,
+        "k": k,
+        "filters": parse_filters(body.get("filters")),
+        "temperature": float(temperature),
+        "stream": stream,
+    }
+
+def parse_filters(data: Any) -> Optional[EventFilter]:
+    """
+    The `EventFilter` of the "filters" object of a request, None if there is none.
+
+    Raises:
+        HTTPBadRequest if a filter is invalid.
+    """
+    if data is None:
+        return None
+    if not isinstance(data, dict) or set(data) - {"start", "end", "cities", "near", "radius_km"}:
+        raise bad_request("'filters' must be an object with 'start', 'end', 'cities', 'near' and 'radius_km' keys.")
+
+    dates = {}
+    for key in ("start", "end"):
+        try:
+            dates[key] = datetime.fromisoformat(data[key]) if data.get(key) is not None else None
+        except (TypeError, ValueError):
+            raise bad_request(f"'filters.{key}' must be an ISO 8601 date.")
+
+    cities = data.get("cities") or []
+    if not isinstance(cities, list) or not all(isinstance(city, str) for city in cities):
+        raise bad_request("'filters.cities' must be a list of strings.")
+
+    near = data.get("near")
+    if near is not None:
+        lat, lon = (near.get("lat"), near.get("lon")) if isinstance(near, dict) else (None, None)
+        if not (is_number(lat) and -90 <= lat <= 90 and is_number(lon) and -180 <= lon <= 180):
+            raise bad_request("'filters.near' must be an object with 'lat' in [-90, 90] and 'lon' in [-180, 180].")
+        near = (float(lat), float(lon))
+
+    radius_km = data.get("radius_km", config.FILTER_RADIUS_KM)
+    if not is_number(radius_km) or radius_km <= 0:
+        raise bad_request("'filters.radius_km' must be a positive number.")
+
+    return EventFilter(dates["start"], dates["end"], tuple(cities), near, float(radius_km)) or None
+
+def is_number(value: Any) -> bool:
+    """ Whether `value` is a finite JSON number: bool is a subclass of int, and NaN / Infinity parse as floats. """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def bad_request(message: str) -> web.HTTPBadRequest:
+    return web.HTTPBadRequest(text=dumps({"error": message}), content_type="application/json")
+
+async def run_search(
+    app: web.Application,
+    query: str,
+    k: int,
+    filters: Optional[EventFilter] = None,
+    timings: Optional[Dict[str, float]] = None,
+    vector: Optional[List[float]] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Embed `query` and search the store (`retrieval.search`), in a batch or in the
+    worker pool; filtered queries, with their own ID selector, are not batched.
+    Outside of a batch, the `vector` of the query, if already embedded, is reused.
+    `timings` receives the total_ms of the search, and its stages outside of a batch.
+    """
+    start = time.perf_counter()
+    if app[BATCHER] is not None and filters is None:
+        results = await asyncio.wrap_future(app[BATCHER].submit(query, k))
+    else:
+        search_store = partial(retrieval.search, query, k, vector=vector, filters=filters, timings=timings)
+        results = await asyncio.get_running_loop().run_in_executor(app[POOL], search_store)
+    if timings is not None:
+        timings["total_ms"] = 1000 * (time.perf_counter() - start)
+    return results
+
+def document_to_json(doc: Document, score: Optional[float]) -> Dict[str, Any]:
+    return {"id": doc.id, "score": score, "page_content": doc.page_content, "metadata": doc.metadata}
+
+async def write_line(response: web.StreamResponse, data: Dict[str, Any]) -> None:
+    await response.write((dumps(data) + "\n").encode("utf-8"))
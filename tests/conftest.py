@@ -0,0 +1,224 @@
+"""
+Shared fixtures for the tests.
+
+- `make_event`: build a raw OpenAgenda record that passes the `Event` validation.
+- `stub_api`: start a local stub of the OpenAgenda export endpoint serving a list of records.
+- `fake_embeddings`: deterministic bag-of-words embeddings counting the embedded texts.
+- `data_folders`: point the `config` data folders to a temporary directory.
+- `make_store`: write a flat vector store (and its BM25 index) of events embedded with `CountingEmbeddings`.
+- `make_chat_model`: build a local chat model streaming its answer word by word, with configurable delays.
+"""
+from datetime import datetime, timedelta, timezone
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+import numpy as np
+import pytest
+
+from rag_poc import config, faiss_index
+from rag_poc.vector_store import content_hash, documents_table, faiss_id, save_store
+
+
+def build_event(i: int, region: str = config.REGION, updatedat: str = "2025-01-01T00:00:00+00:00") -> dict:
+    begin = datetime.now(timezone.utc) + timedelta(days=i % 300, hours=1)
+    return {
+        "uid": f"event{i:05d}",
+        "canonicalurl": f"https://example.com/event{i}",
+        "title_fr": f"Évènement {i}",
+        "description_fr": "Une description.",
+        "longdescription_fr": "<p>Contenu long</p>",
+        "conditions_fr": None,
+        "location_city": "Rennes",
+        "keywords_fr": ["musique"],
+        "firstdate_begin": begin.isoformat(),
+        "firstdate_end": (begin + timedelta(hours=2)).isoformat(),
+        "lastdate_begin": (begin + timedelta(days=1)).isoformat(),
+        "lastdate_end": (begin + timedelta(days=1, hours=2)).isoformat(),
+        "accessibility_label_fr": None,
+        "location_coordinates": {"lat": 48.11, "lon": -1.67},
+        "location_region": region,
+        "updatedat": updatedat,
+    }
+
+
+class StubServer:
+    """ Serve `events` like the export endpoint: `where` date window and `updatedat`, `limit`, `offset`. """
+
+    def __init__(self, events: list[dict], latency: float = 0.0):
+        self.events = sorted(events, key=lambda e: e["uid"])
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                start = datetime.fromisoformat(re.search(r'firstdate_begin >= "([^"]+)"', query["where"]).group(1))
+                end = datetime.fromisoformat(re.search(r'firstdate_begin < "([^"]+)"', query["where"]).group(1))
+                updated = re.search(r'updatedat > "([^"]+)"', query["where"])
+                selected = [
+                    e for e in stub.events
+                    if start <= datetime.fromisoformat(e["firstdate_begin"]).replace(tzinfo=None) < end
+                    and (updated is None or e["updatedat"] > updated.group(1))
+                ]
+                offset, limit = int(query["offset"]), int(query["limit"])
+                body = json.dumps(selected[offset:offset + limit]).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/exports/json"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+class CountingEmbeddings(Embeddings):
+    """ Deterministic bag-of-words embeddings counting the embedded texts. """
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.embedded: list[str] = []
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int.from_bytes(blake2b(word.encode()).digest()[:8], 'little') % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class DelayedChatModel(BaseChatModel):
+    """
+    Chat model answering `answer` word by word: the first word after
+    `first_token_delay` seconds, then one every `token_delay` seconds.
+    The prompts it received are kept in `prompts`.
+    """
+    answer: str = "Allez au concert."
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+    prompts: list = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "delayed-fake"
+
+    def _tokens(self) -> list[str]:
+        words = self.answer.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.prompts.append(messages[-1].content)
+        time.sleep(self.first_token_delay + self.token_delay * (len(self._tokens()) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+@pytest.fixture
+def fake_embeddings():
+    return CountingEmbeddings()
+
+
+@pytest.fixture
+def make_chat_model():
+    return DelayedChatModel
+
+
+@pytest.fixture
+def make_event():
+    return build_event
+
+
+@pytest.fixture
+def stub_api():
+    """ Factory starting a `StubServer`, shut down at teardown. """
+    servers = []
+
+    def start(events: list[dict], latency: float = 0.0) -> StubServer:
+        server = StubServer(events, latency).__enter__()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+@pytest.fixture
+def data_folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATA", tmp_path)
+    monkeypatch.setattr(config, "RAW", tmp_path / "raw")
+    monkeypatch.setattr(config, "EVENTS_DATASET", tmp_path / "raw" / "events")
+    monkeypatch.setattr(config, "VECTORS_FOLDER", tmp_path / "vectors")
+    monkeypatch.setattr(config, "ERROR_FILE", tmp_path / "error")
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_FOLDER", tmp_path / "embedding_cache")
+    monkeypatch.setattr(config, "QUERY_EMBEDDING_CACHE_FOLDER", tmp_path / "query_embedding_cache")
+    monkeypatch.setattr(config, "ANSWER_CACHE_FILE", tmp_path / "answer_cache.sqlite")
+    return tmp_path
+
+
+@pytest.fixture
+def make_store():
+    """
+    Factory writing a vector store in `folder` from `texts` (doc_id -> text),
+    with optional per-document `metadata` (doc_id -> dict).
+    """
+    embeddings = CountingEmbeddings()
+
+    def write(folder, texts: dict, metadata: dict = None):
+        documents = {
+            doc_id: Document(
+                page_content=text,
+                metadata={"content_hash": content_hash(text), **(metadata or {}).get(doc_id, {})},
+            )
+            for doc_id, text in texts.items()
+        }
+        vectors = np.array(embeddings.embed_documents(list(texts.values())), dtype=np.float32)
+        index, params = faiss_index.create_index("flat", vectors)
+        index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in texts], dtype=np.int64))
+        return save_store(
+            folder, index, documents_table(documents), params, config.EMBEDDING_MODEL,
+            lexical_fields=config.LEXICAL_FIELDS
+        )
+
+    return write
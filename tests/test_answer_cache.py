@@ -0,0 +1,134 @@
+"""
+Tests for rag_poc.answer_cache and its use in rag_poc.retrieval.recommend
+
+Both backends (in-memory and SQLite) run the same tests.
+
+Includes
+--------
+- A near-duplicate question gets the cached answer and documents, a different one misses.
+- Another context (store version, temperature, k) misses.
+- Entries expire after the TTL, and the least recently used are evicted.
+- An expired closest question does not hide a valid one within the threshold.
+- The SQLite cache is shared between instances (processes).
+- `recommend` generates once for repeated questions, and again after a new index.
+"""
+from types import SimpleNamespace
+
+from langchain.schema import Document
+import numpy as np
+import pytest
+
+from rag_poc import answer_cache, config, retrieval
+from rag_poc.answer_cache import MemoryAnswerCache, SqliteAnswerCache, answer_context
+
+CONTEXT = answer_context("v1", 0.7, 3)
+DOCS = [Document(id="a", page_content="concert de jazz", metadata={"canonicalurl": "https://example.com/a"})]
+
+
+def vector(seed, noise=0.0):
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal(64)
+    return base + noise * np.random.default_rng(seed + 100).standard_normal(64)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**options):
+        if request.param == "memory":
+            return MemoryAnswerCache(**options)
+        return SqliteAnswerCache(tmp_path / "answers.sqlite", **options)
+    return make
+
+
+def test_near_duplicate_question_hits(make_cache):
+    cache = make_cache(threshold=0.95)
+    cache.put("concert à Rennes ce week-end", vector(0), CONTEXT, "Allez au concert.", DOCS)
+
+    hit = cache.get(vector(0, noise=0.05), CONTEXT)
+    miss = cache.get(vector(1), CONTEXT)
+
+    assert hit.answer == "Allez au concert." and hit.similarity >= 0.95
+    assert hit.documents[0].id == "a" and hit.documents[0].metadata == DOCS[0].metadata
+    assert miss is None
+    assert cache.hit_rate == 0.5
+
+
+def test_other_context_misses(make_cache):
+    cache = make_cache()
+    cache.put("q", vector(0), CONTEXT, "answer", DOCS)
+
+    assert cache.get(vector(0), answer_context("v2", 0.7, 3)) is None
+    assert cache.get(vector(0), answer_context("v1", 0.2, 3)) is None
+    assert cache.get(vector(0), answer_context("v1", 0.7, 5)) is None
+
+
+def test_entries_expire(make_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = make_cache(ttl=60)
+    cache.put("q", vector(0), CONTEXT, "answer", DOCS)
+
+    now[0] += 30
+    assert cache.get(vector(0), CONTEXT) is not None
+    now[0] += 31
+    assert cache.get(vector(0), CONTEXT) is None
+
+
+def test_expired_closest_question_is_skipped(make_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = make_cache(threshold=0.9, ttl=60)
+    cache.put("old", vector(0), CONTEXT, "old answer", DOCS)
+    now[0] += 50
+    cache.put("recent", vector(0, noise=0.1), CONTEXT, "recent answer", DOCS)
+
+    now[0] += 20
+    hit = cache.get(vector(0), CONTEXT)
+
+    assert hit is not None and hit.answer == "recent answer"
+
+
+def test_least_recently_used_is_evicted(make_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = make_cache(max_entries=2)
+
+    for seed in (0, 1):
+        cache.put(f"q{seed}", vector(seed), CONTEXT, f"answer {seed}", DOCS)
+        now[0] += 1
+    cache.get(vector(0), CONTEXT)
+    now[0] += 1
+    cache.put("q2", vector(2), CONTEXT, "answer 2", DOCS)
+
+    assert len(cache) == 2
+    assert cache.get(vector(1), CONTEXT) is None
+    assert cache.get(vector(0), CONTEXT).answer == "answer 0"
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    writer = SqliteAnswerCache(tmp_path / "answers.sqlite")
+    reader = SqliteAnswerCache(tmp_path / "answers.sqlite")
+
+    writer.put("q", vector(0), CONTEXT, "answer", DOCS)
+
+    assert reader.get(vector(0), CONTEXT).answer == "answer"
+
+
+def test_recommend_uses_the_cache(data_folders, make_store, fake_embeddings, monkeypatch):
+    retrieval.clear_caches()
+    prompts = []
+    chat_model = SimpleNamespace(invoke=lambda prompt: prompts.append(prompt) or SimpleNamespace(content="Allez-y."))
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: chat_model)
+    events = {"a": "concert de jazz", "b": "exposition de peinture"}
+    make_store(config.VECTORS_FOLDER, events)
+    cache = MemoryAnswerCache()
+
+    first = retrieval.recommend("concert de jazz à Rennes", cache=cache)
+    second = retrieval.recommend("Concert de jazz à Rennes", cache=cache)
+    make_store(config.VECTORS_FOLDER, {**events, "c": "festival de jazz"})
+    third = retrieval.recommend("concert de jazz à Rennes", cache=cache)
+
+    assert not first.cached and second.cached and not third.cached
+    assert second.answer == first.answer and [d.id for d in second.documents] == [d.id for d in first.documents]
+    assert len(prompts) == 2
@@ -0,0 +1,82 @@
+"""
+Tests for rag_poc.batching and the batched search of rag_poc.vector_store
+
+Includes
+--------
+- A batched search returns the same results as one search per query.
+- Concurrent queries are coalesced, and each caller gets its own results.
+- A failing batch raises in every caller.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from rag_poc import config, retrieval
+from rag_poc.batching import QueryBatcher
+from rag_poc.vector_store import VectorStore
+
+EVENTS = {f"e{i}": f"évènement {word} numéro {i}" for i, word in enumerate(
+    ["jazz", "peinture", "noël", "cinéma", "théâtre", "danse", "cirque", "opéra"]
+)}
+QUERIES = ["jazz", "peinture", "noël", "cinéma", "théâtre", "danse", "cirque", "opéra"] * 4
+
+
+@pytest.fixture
+def store(data_folders, make_store, fake_embeddings):
+    make_store(config.VECTORS_FOLDER, EVENTS)
+    return VectorStore.load(config.VECTORS_FOLDER, fake_embeddings)
+
+
+def test_batch_search_matches_single_searches(store):
+    batched = store.batch_similarity_search_with_score(QUERIES[:8], k=3)
+
+    for query, results in zip(QUERIES[:8], batched):
+        single = store.similarity_search_with_score(query, k=3)
+        assert [doc.id for doc, _ in results] == [doc.id for doc, _ in single]
+        assert [score for _, score in results] == pytest.approx([score for _, score in single], abs=1e-5)
+
+
+def test_concurrent_queries_are_coalesced(store):
+    calls = []
+    gate = threading.Event()
+
+    def search_many(queries, k):
+        gate.wait(5)  # hold the first batch while the other queries queue up
+        calls.append(len(queries))
+        return store.batch_similarity_search_with_score(queries, k)
+
+    batcher = QueryBatcher(search_many, max_wait=0.05, max_batch=64)
+    with ThreadPoolExecutor(max_workers=len(QUERIES)) as pool:
+        futures = [pool.submit(batcher.search, query, 1 + i % 3) for i, query in enumerate(QUERIES)]
+        gate.set()
+        results = [future.result(timeout=10) for future in futures]
+    batcher.close()
+
+    assert sum(calls) == len(QUERIES) and len(calls) < len(QUERIES) / 2
+    for i, (query, result) in enumerate(zip(QUERIES, results)):
+        expected = store.similarity_search_with_score(query, k=1 + i % 3)
+        assert [doc.id for doc, _ in result] == [doc.id for doc, _ in expected]
+
+
+def test_failing_batch_raises_in_every_caller():
+    def search_many(queries, k):
+        raise RuntimeError("embedding API down")
+
+    batcher = QueryBatcher(search_many, max_wait=0.05)
+    futures = [batcher.submit(query, 3) for query in QUERIES[:4]]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="embedding API down"):
+            future.result(timeout=10)
+    batcher.close()
+
+
+def test_search_many_uses_the_current_store(data_folders, make_store, fake_embeddings, monkeypatch):
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    make_store(config.VECTORS_FOLDER, EVENTS)
+
+    results = retrieval.search_many(["jazz", "opéra"], k=1)
+
+    assert [r[0][0].id for r in results] == ["e0", "e7"]
@@ -0,0 +1,58 @@
+"""
+Tests for the end-to-end benchmark benchmarks.bench_pipeline and its offline stand-ins
+
+Includes
+--------
+- The stand-in of the export endpoint answers the date windows and offsets of the fetch queries.
+- A run on a small corpus times every step, and its JSON serves as the baseline of the next run.
+- Only the timings slower than the tolerance and the absolute margin are regressions.
+"""
+import json
+import pathlib
+import subprocess
+import sys
+
+import requests
+
+from benchmarks.bench_pipeline import compare
+from benchmarks.fakes import OpenAgendaServer
+from benchmarks.synthetic import openagenda_records
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def test_server_answers_the_fetch_queries():
+    records = openagenda_records(50, invalid=0.0)
+    begins = sorted(record["firstdate_begin"][:19] for record in records)
+
+    with OpenAgendaServer(records) as server:
+        where = f'location_region="Bretagne" AND firstdate_begin >= "{begins[10]}" AND firstdate_begin < "{begins[30]}"'
+        page = requests.get(server.url, params={"where": where, "limit": 15, "offset": 5}).json()
+        other = requests.get(server.url, params={"where": 'location_region="Normandie"', "limit": 10}).json()
+
+    assert len(page) == 15 and all(begins[10] <= record["firstdate_begin"][:19] < begins[30] for record in page)
+    assert other == [] and server.requests == 2
+
+
+def test_run_and_compare_with_baseline(tmp_path):
+    command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--events", "300", "--questions", "3", "--dim", "32"]
+    first = subprocess.run(command + ["--json", str(tmp_path / "run.json")], cwd=ROOT, capture_output=True, text=True)
+    assert first.returncode == 0, first.stderr
+
+    results = json.loads((tmp_path / "run.json").read_text())["results"]
+    assert results["fetch.events"] == 300
+    assert {"fetch.validate_ms", "index.embed_ms", "index.save_ms", "chat.ttft_p50_ms", "chat.total_p95_ms"} <= set(results)
+
+    # A generous margin: the second run is only expected to succeed and compare
+    second = subprocess.run(command + ["--baseline", str(tmp_path / "run.json"), "--min-ms", "10000"], cwd=ROOT, capture_output=True, text=True)
+    assert second.returncode == 0, second.stderr
+    assert "No regression" in second.stdout
+
+
+def test_compare_reports_slower_stages():
+    baseline = {"index.embed_ms": 100.0, "index.save_ms": 10.0, "chat.total_p50_ms": 50.0, "fetch.events": 300}
+    results = {"index.embed_ms": 150.0, "index.save_ms": 14.0, "chat.total_p50_ms": 55.0, "fetch.events": 900, "new_ms": 1.0}
+
+    regressions = compare(baseline, results, tolerance=0.2, min_ms=5.0)
+
+    assert regressions == ["index.embed_ms: 100.0 -> 150.0 ms (+50%)"]
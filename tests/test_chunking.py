@@ -0,0 +1,121 @@
+"""
+Tests for the chunked vector store: scripts.indexing.chunk_documents and the
+collapse of the chunks to their events in rag_poc.retrieval
+
+Includes
+--------
+- Long documents are split in overlapping chunks keeping their metadata, short ones stay whole.
+- The chunk offsets rebuild the text, even when the text repeats itself.
+- A search of a passage of a long event returns the event once, with its whole text.
+- An incremental build embeds only the chunks of changed events, a new chunking rebuilds the store.
+"""
+from unittest.mock import patch
+
+import polars as pl
+import pytest
+
+from rag_poc import config, retrieval
+from rag_poc.vector_store import VectorStore, chunk_id
+import scripts.indexing as indexing
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+WORDS = "ville plage musique festival théâtre danse marché atelier balade conte jardin port".split()
+LONG = "\n\n".join(
+    " ".join(WORDS[(i + j) % len(WORDS)] + str(i) for j in range(60)) for i in range(8)
+)
+EVENTS = {"long": LONG, "short": "concert de jazz au port", "other": "exposition de peinture"}
+
+
+def write_source(path, events):
+    pl.DataFrame({
+        "uid": list(events),
+        "title_fr": list(events.values()),
+        "canonicalurl": [f"https://example.com/{uid}" for uid in events],
+    }).write_parquet(path)
+
+
+@pytest.fixture
+def embeddings(fake_embeddings):
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+        yield fake_embeddings
+
+
+def build(source, destination, incremental=False, chunk_size=300):
+    indexing.build_index(
+        source=source, destination=destination, columns=["title_fr"], id_column="uid",
+        incremental=incremental, chunk_size=chunk_size, chunk_overlap=60,
+    )
+
+
+def test_chunk_documents():
+    frame = pl.DataFrame({"title_fr": list(EVENTS.values()), "canonicalurl": ["u1", "u2", "u3"]})
+    documents = indexing.documents_frame(frame, ["title_fr"], list(EVENTS))
+
+    chunks = indexing.chunk_documents(documents, chunk_size=300, chunk_overlap=60).to_pylist()
+
+    long = [chunk for chunk in chunks if chunk["parent_id"] == "long"]
+    # A chunk can start with the blank line separating it from the previous one
+    assert len(long) > 2 and all(len(chunk["page_content"]) <= 300 + 2 for chunk in long)
+    assert [chunk["doc_id"] for chunk in long] == [chunk_id("long", n) for n in range(len(long))]
+    assert {chunk["chunk_count"] for chunk in long} == {len(long)}
+    assert {chunk["canonicalurl"] for chunk in long} == {"u1"}
+    assert all(LONG[c["chunk_start"]:c["chunk_start"] + len(c["page_content"])] == c["page_content"] for c in long)
+    assert any(a["chunk_start"] + len(a["page_content"]) > b["chunk_start"] for a, b in zip(long, long[1:]))
+    assert [(c["doc_id"], c["page_content"], c["chunk_count"]) for c in chunks if c["parent_id"] == "short"] == [
+        ("short#0", EVENTS["short"], 1)
+    ]
+
+
+def test_split_text_rebuilds_repeated_text():
+    splitter = indexing.RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=8, strip_whitespace=False)
+    text = "la la la\n\nla la la\n\n\nla la la la la la la la la la\n"
+
+    parts = indexing.split_text(splitter, text)
+
+    rebuilt = ""
+    for start, part in parts:
+        rebuilt = rebuilt[:start] + part
+    assert rebuilt == text
+    assert len(parts) > 2 and all(part.strip() for _, part in parts)
+
+
+def test_search_collapses_chunks_to_events(tmp_path, embeddings, monkeypatch):
+    source = tmp_path / "events.parquet"
+    write_source(source, EVENTS)
+    build(source, config.VECTORS_FOLDER)
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: embeddings)
+
+    store = retrieval.get_vector_store()
+    passage = " ".join(LONG.split("\n\n")[5].split()[:8])
+    results = retrieval.search(passage, k=2)
+    batched = retrieval.search_many([passage], k=3)
+
+    assert store.chunking == {"size": 300, "overlap": 60}
+    assert len(store) > len(EVENTS)
+    assert [doc.id for doc, _ in results][0] == "long"
+    assert len({doc.id for doc, _ in results}) == 2
+    assert results[0][0].page_content == LONG
+    assert results[0][0].metadata["canonicalurl"] == "https://example.com/long"
+    assert "parent_id" not in results[0][0].metadata
+    assert sorted(doc.id for doc, _ in batched[0]) == sorted(EVENTS)
+
+
+def test_incremental_chunked_build(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, EVENTS)
+    build(source, destination)
+
+    write_source(source, {**EVENTS, "short": "concert de rock au port"})
+    embeddings.embedded.clear()
+    build(source, destination, incremental=True)
+
+    assert embeddings.embedded == ["concert de rock au port"]
+    assert VectorStore.load(destination, embeddings).index.ntotal == len(VectorStore.load(destination).documents)
+
+    build(source, destination, incremental=True, chunk_size=None)
+
+    store = VectorStore.load(destination, embeddings)
+    assert store.chunking is None
+    assert sorted(store.documents.column("doc_id").to_pylist()) == sorted(EVENTS)
@@ -0,0 +1,134 @@
+"""
+Tests for the raw events dataset: rag_poc.dataset and its use by the fetch and the index
+
+Includes
+--------
+- The events of a region are written in one file per month, sorted, with row group statistics;
+  rewriting a region leaves the others untouched.
+- A scan of a date window and of a region reads only its partitions and the columns asked for.
+- The paginated and incremental fetches write to the partitions of their region, one watermark per region.
+- The index of a date window reads only its events, and of them only the embedded, id and metadata columns.
+"""
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import polars as pl
+import pyarrow.parquet as pq
+import pytest
+
+from rag_poc import config, dataset
+from rag_poc.vector_store import VectorStore
+import scripts.fetching as fetching
+import scripts.indexing as indexing
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+BEGIN = datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+
+def events_frame(n=90, regions=("Bretagne", "Île-de-France")):
+    """ `n` events, one a day from BEGIN (three months), alternating between the `regions`. """
+    return pl.DataFrame({
+        "uid": [f"event{i:03d}" for i in range(n)],
+        "title_fr": [f"Évènement {i}" for i in range(n)],
+        "conditions_fr": ["Entrée libre"] * n,
+        "firstdate_begin": [BEGIN + timedelta(days=n - 1 - i) for i in range(n)],
+        "location_region": [regions[i % len(regions)] for i in range(n)],
+    })
+
+
+def test_write_region_by_month(tmp_path):
+    folder = tmp_path / "events"
+    events = events_frame()
+
+    assert dataset.write_region(events, folder, "Île-de-France") == 3
+    assert dataset.write_region(events, folder, "Bretagne") == 3
+
+    files = sorted(dataset.region_folder(folder, "Bretagne").rglob("*.parquet"))
+    assert [str(file.relative_to(folder).parent) for file in files] == [
+        "location_region=Bretagne/month=2025-05", "location_region=Bretagne/month=2025-06",
+        "location_region=Bretagne/month=2025-07",
+    ]
+    assert (folder / "location_region=%C3%8Ele-de-France" / "month=2025-07" / "part-0.parquet").exists()
+
+    part = pl.read_parquet(files[0])
+    assert "location_region" not in part.columns and part["firstdate_begin"].is_sorted()
+    assert pq.ParquetFile(files[0]).metadata.row_group(0).column(0).statistics is not None
+
+    dataset.write_region(events.head(0), folder, "Bretagne")
+    assert dataset.scan_events(folder).collect()["location_region"].unique().to_list() == ["Île-de-France"]
+    assert not list(tmp_path.glob(".*"))
+
+
+def test_scan_reads_only_the_window(tmp_path):
+    folder = tmp_path / "events"
+    events = events_frame()
+    for region in ("Bretagne", "Île-de-France"):
+        dataset.write_region(events, folder, region)
+
+    start, end = datetime(2025, 6, 10), datetime(2025, 7, 1)
+    scan = dataset.scan_events(folder, start=start, end=end, regions=["Bretagne"], columns=["uid", "title_fr", "nope"])
+
+    plan = scan.explain()
+    assert "month=2025-06" in plan and "month=2025-05" not in plan and "month=2025-07" not in plan
+    assert "Île" not in plan and "%C3%8E" not in plan
+    expected = events.filter(
+        (pl.col("location_region") == "Bretagne")
+        & pl.col("firstdate_begin").is_between(start.replace(tzinfo=timezone.utc), end.replace(tzinfo=timezone.utc), closed="left")
+    )
+    assert scan.collect().sort("uid").equals(expected.select("uid", "title_fr").sort("uid"))
+
+    # The same filters apply to a single file
+    events.write_parquet(tmp_path / "events.parquet")
+    single = dataset.scan_events(tmp_path / "events.parquet", start=start, end=end, regions=["Bretagne"])
+    assert single.collect()["uid"].sort().equals(expected["uid"].sort())
+
+
+def test_fetch_into_dataset(tmp_path, make_event, stub_api):
+    folder = tmp_path / "events"
+    events = [make_event(i) for i in range(40)]
+    stub = stub_api(events)
+
+    written = fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL, destination=folder, url=stub.url,
+    )
+    months = {str(path.name) for path in dataset.region_folder(folder, config.REGION).iterdir()}
+    assert written == 40 and len(months) > 1
+    assert fetching.watermark_path(folder, config.REGION).parent == folder
+
+    changed = make_event(3, updatedat="2025-02-01T00:00:00+00:00")
+    changed["title_fr"] = "Titre modifié"
+    stub.events = [changed if e["uid"] == changed["uid"] else e for e in events]
+    requests_before = stub.requests
+
+    assert fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL, destination=folder, url=stub.url,
+    ) == 1
+
+    df = dataset.scan_events(folder).collect()
+    assert stub.requests - requests_before == 1
+    assert df.height == 40 and df["uid"].n_unique() == 40
+    assert df.filter(pl.col("uid") == "event00003")["title_fr"].item() == "Titre modifié"
+    assert fetching.load_watermark(folder, config.REGION)["updatedat"] == "2025-02-01T00:00:00+00:00"
+
+
+def test_index_a_window(tmp_path, fake_embeddings):
+    folder = tmp_path / "events"
+    dataset.write_region(events_frame(regions=("Bretagne",)), folder, "Bretagne")
+    read = []
+
+    def read_source(source, **kwargs):
+        read.append(kwargs)
+        return dataset.scan_events(source, **kwargs).collect()
+
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings), \
+            patch.object(indexing, "read_source", side_effect=read_source):
+        indexing.build_index(
+            source=folder, destination=tmp_path / "vectors", columns=["title_fr"], id_column="uid",
+            start=datetime(2025, 6, 1), end=datetime(2025, 7, 1), shard_by=None,
+        )
+
+    documents = VectorStore.load(tmp_path / "vectors", fake_embeddings).documents
+    assert len(documents) == 30
+    assert "conditions_fr" not in documents.column_names and "location_region" in documents.column_names
+    assert set(read[0]["columns"]) == {"title_fr", "uid", *config.METADATA_COLUMNS}
@@ -0,0 +1,88 @@
+"""
+Tests for rag_poc.embedding_cache
+
+Includes
+--------
+- Cached vectors survive a reopening of the cache, keyed by model and normalized text.
+- Hit and miss counters.
+- Least recently used entries are evicted beyond the size budget.
+- Two instances writing the same folder (the indexer and an app) see each other's entries.
+- CachedEmbeddings only sends the misses to the backend.
+- Re-indexing unchanged documents never calls the embedding backend.
+"""
+from unittest.mock import patch
+
+import numpy as np
+import polars as pl
+
+from rag_poc.embedding_cache import CachedEmbeddings, EmbeddingCache
+import scripts.indexing as indexing
+
+
+def test_cache_persists_between_instances(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model-a")
+    cache.put_many(["Concert à  Rennes ", "Expo"], [[1.0, 0.0], [0.0, 1.0]])
+
+    reopened = EmbeddingCache(tmp_path, "model-a")
+    hit, miss = reopened.get_many(["Concert à Rennes", "Autre"])
+
+    np.testing.assert_array_equal(hit, [1.0, 0.0])
+    assert miss is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+    assert EmbeddingCache(tmp_path, "model-b").get_many(["Expo"]) == [None]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    dim = 4
+    cache = EmbeddingCache(tmp_path, "model", max_bytes=10 * (dim * 4 + 16 + 8))
+    texts = [f"text {i}" for i in range(10)]
+    cache.put_many(texts, np.eye(10, dim))
+    cache.get_many(texts[:5])  # texts 5..9 become the least recently used
+
+    cache.put_many(["new"], [[1.0, 1.0, 1.0, 1.0]])
+
+    assert len(cache) == 10
+    assert cache.get_many(["text 5"]) == [None]
+    assert all(v is not None for v in cache.get_many(texts[:5] + ["new"]))
+    assert cache.capacity <= 10
+
+
+def test_instances_share_the_folder(tmp_path):
+    indexer, app = EmbeddingCache(tmp_path, "model"), EmbeddingCache(tmp_path, "model")
+
+    indexer.put_many(["indexer text"], [[1.0, 1.0, 1.0, 1.0]])
+    app.put_many(["user question"], [[3.0, 3.0, 3.0, 3.0]])
+    indexer.put_many(["other text"], [[2.0, 2.0, 2.0, 2.0]])
+
+    np.testing.assert_array_equal(indexer.get_many(["indexer text"])[0], [1.0, 1.0, 1.0, 1.0])
+    np.testing.assert_array_equal(app.get_many(["other text"])[0], [2.0, 2.0, 2.0, 2.0])
+    reopened = EmbeddingCache(tmp_path, "model")
+    assert len(reopened) == 3
+    np.testing.assert_array_equal(
+        reopened.get_many(["indexer text", "user question"]), [[1.0] * 4, [3.0] * 4]
+    )
+
+
+def test_cached_embeddings_only_embeds_misses(tmp_path, fake_embeddings):
+    backend = fake_embeddings
+    embeddings = CachedEmbeddings(backend, EmbeddingCache(tmp_path, "fake"))
+
+    first = embeddings.embed_documents(["jazz", "rock", "jazz"])
+    second = embeddings.embed_documents(["rock", "blues"])
+    embeddings.embed_query("jazz")
+
+    assert backend.embedded == ["jazz", "rock", "blues"]
+    assert first[0] == first[2]
+    np.testing.assert_allclose(second[0], first[1])
+
+
+def test_reindexing_unchanged_text_skips_backend(tmp_path, data_folders, fake_embeddings):
+    source = tmp_path / "events.parquet"
+    pl.DataFrame({"uid": ["a", "b"], "title_fr": ["concert", "exposition"]}).write_parquet(source)
+    backend = fake_embeddings
+
+    with patch.object(indexing, "get_embeddings", return_value=backend):
+        for _ in range(2):
+            indexing.build_index(source, tmp_path / "vectors", columns=["title_fr"], id_column="uid")
+
+    assert backend.embedded == ["concert", "exposition"]
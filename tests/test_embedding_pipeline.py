@@ -0,0 +1,176 @@
+"""
+Tests for the batched embedding stage of scripts.indexing
+
+Runs `embed_texts` with `MistralAIEmbeddings` against a local fake of the
+Mistral embedding endpoint, which adds latency and answers 429.
+
+Includes
+--------
+- Batches respect the token budget and vectors come back in order.
+- 429 responses are retried until the batch succeeds.
+- Concurrency reduces the wall time.
+- The rate limiter caps the number of requests per second.
+- An interrupted run resumes from its checkpoint.
+"""
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+from langchain_mistralai import MistralAIEmbeddings
+import numpy as np
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from rag_poc import config
+import scripts.indexing as indexing
+
+DIM = 8
+
+
+def fake_vector(text: str) -> list[float]:
+    return list(np.frombuffer(blake2b(text.encode(), digest_size=DIM * 4).digest(), dtype=np.uint32) / 2**32)
+
+
+class FakeEmbeddingServer:
+    """
+    Fake `/embeddings` endpoint. `latency` is added to each request, and
+    `rate_limited(n)` decides whether the n-th request gets a 429.
+    Texts listed in `failing` get a persistent 400.
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limited=lambda n: False, failing=()):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.failing = set(failing)
+        self.requests = 0
+        self.batches: list[list[str]] = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+                with fake.lock:
+                    fake.requests += 1
+                    n = fake.requests
+                time.sleep(fake.latency)
+
+                if fake.rate_limited(n):
+                    return self.reply(429, {"message": "rate limited"}, {"Retry-After": "0.05"})
+                if fake.failing.intersection(texts):
+                    return self.reply(400, {"message": "bad input"})
+
+                with fake.lock:
+                    fake.batches.append(texts)
+                self.reply(200, {"data": [{"embedding": fake_vector(t), "index": i} for i, t in enumerate(texts)]})
+
+            def reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self) -> MistralAIEmbeddings:
+        tokenizer = Tokenizer(models.WordLevel(vocab={"[UNK]": 0}, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        return MistralAIEmbeddings(
+            api_key="test", endpoint=f"http://127.0.0.1:{self.server.server_port}/",
+            max_retries=1, tokenizer=tokenizer,
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(**kwargs) -> FakeEmbeddingServer:
+        servers.append(FakeEmbeddingServer(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(config, "EMBED_BACKOFF", 0.01)
+    monkeypatch.setattr(config, "EMBED_MAX_RETRIES", 20)
+
+
+TEXTS = [f"événement numéro {i} " * (1 + i % 5) for i in range(60)]
+
+
+def test_batches_respect_token_budget():
+    batches = indexing.make_batches(TEXTS, batch_tokens=50)
+
+    assert sum(batches, []) == TEXTS
+    assert all(
+        sum(map(indexing.estimate_tokens, b)) <= 50 or len(b) == 1 for b in batches
+    )
+
+
+def test_vectors_in_order_despite_429(fake_server):
+    server = fake_server(latency=0.01, rate_limited=lambda n: n % 3 == 0)
+
+    vectors = indexing.embed_texts(server.client(), TEXTS, batch_tokens=60, concurrency=4, rate=None)
+
+    np.testing.assert_allclose(vectors, np.array([fake_vector(t) for t in TEXTS], dtype=np.float32))
+    assert server.requests > len(server.batches)
+
+
+def test_concurrency_reduces_wall_time(fake_server):
+    server = fake_server(latency=0.05)
+    timings = {}
+
+    for concurrency in (1, 8):
+        start = time.perf_counter()
+        indexing.embed_texts(server.client(), TEXTS, batch_tokens=60, concurrency=concurrency, rate=None)
+        timings[concurrency] = time.perf_counter() - start
+
+    assert timings[8] < timings[1] / 3
+
+
+def test_rate_limiter_caps_requests(fake_server):
+    server = fake_server()
+    n_batches = len(indexing.make_batches(TEXTS, batch_tokens=60))
+
+    start = time.perf_counter()
+    indexing.embed_texts(server.client(), TEXTS, batch_tokens=60, concurrency=8, rate=40)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= (n_batches - 1) / 40 * 0.9
+
+
+def test_interrupted_run_resumes_from_checkpoint(fake_server, tmp_path):
+    checkpoint = tmp_path / "checkpoint"
+    failing = fake_server(failing={TEXTS[-1]})
+
+    with pytest.raises(Exception):
+        indexing.embed_texts(failing.client(), TEXTS, batch_tokens=60, concurrency=2, rate=None,
+                             checkpoint_folder=checkpoint)
+    n_batches = len(indexing.make_batches(TEXTS, batch_tokens=60))
+    assert len(list(checkpoint.glob("*.npy"))) == n_batches - 1
+
+    server = fake_server()
+    vectors = indexing.embed_texts(server.client(), TEXTS, batch_tokens=60, concurrency=2, rate=None,
+                                   checkpoint_folder=checkpoint)
+
+    assert server.batches == [indexing.make_batches(TEXTS, batch_tokens=60)[-1]]
+    np.testing.assert_allclose(vectors, np.array([fake_vector(t) for t in TEXTS], dtype=np.float32))
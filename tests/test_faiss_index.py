@@ -0,0 +1,135 @@
+"""
+Tests for rag_poc.faiss_index and the --index-type option of scripts.indexing
+
+Includes
+--------
+- Every index type is trained, accepts ids and finds a vector from the corpus.
+- Small corpora fall back to a flat index.
+- The search parameters are saved with the store and applied when it is loaded.
+- An incremental build with removals rebuilds an HNSW index.
+- The PCA and the fp16 / int8 quantizers shrink the index and still find the corpus vectors.
+- A compressed store is searched with full-dimension queries, filtered, and rebuilt when the compression changes.
+"""
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+import polars as pl
+import pytest
+
+from benchmarks.synthetic import clustered_vectors
+from rag_poc import config, faiss_index
+from rag_poc.filters import EventFilter
+from rag_poc.vector_store import VectorStore
+import scripts.indexing as indexing
+
+
+@pytest.mark.parametrize("index_type", config.INDEX_TYPES)
+def test_every_index_type_finds_corpus_vectors(index_type):
+    vectors = clustered_vectors(3000, 32, n_clusters=16)
+    index, params = faiss_index.create_index(index_type, vectors)
+    index.add_with_ids(vectors, np.arange(100, 3100, dtype=np.int64))
+
+    _, ids = index.search(vectors[:20], 1)
+
+    assert params["index_type"] == index_type
+    assert np.mean(ids[:, 0] == np.arange(100, 120)) >= 0.9
+
+
+def test_small_corpus_falls_back_to_flat():
+    _, params = faiss_index.create_index("ivf-pq", clustered_vectors(50, 16))
+
+    assert params["index_type"] == "flat"
+    assert params["requested_type"] == "ivf-pq"
+
+
+def test_search_params_are_persisted(tmp_path, monkeypatch, data_folders, fake_embeddings):
+    monkeypatch.setattr(config, "ANN_MIN_VECTORS", 100)
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    pl.DataFrame({
+        "uid": [f"e{i}" for i in range(400)],
+        "title_fr": [f"évènement {i} numéro {i % 7}" for i in range(400)],
+    }).write_parquet(source)
+
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+        indexing.build_index(source, destination, columns=["title_fr"], id_column="uid",
+                             index_type="ivf-flat", nprobe=3)
+
+    store = VectorStore.load(destination, fake_embeddings)
+
+    assert store.manifest["index"]["index_type"] == "ivf-flat"
+    assert faiss.extract_index_ivf(store.index).nprobe == 3
+    assert store.index.ntotal == 400
+
+
+def test_hnsw_incremental_removal_rebuilds(tmp_path, monkeypatch, data_folders, fake_embeddings):
+    monkeypatch.setattr(config, "ANN_MIN_VECTORS", 10)
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    titles = [f"évènement {i}" for i in range(50)]
+
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+        pl.DataFrame({"uid": [f"e{i}" for i in range(50)], "title_fr": titles}).write_parquet(source)
+        indexing.build_index(source, destination, columns=["title_fr"], id_column="uid", index_type="hnsw")
+
+        pl.DataFrame({"uid": [f"e{i}" for i in range(40)], "title_fr": titles[:40]}).write_parquet(source)
+        indexing.build_index(source, destination, columns=["title_fr"], id_column="uid",
+                             index_type="hnsw", incremental=True)
+
+    store = VectorStore.load(destination, fake_embeddings)
+    assert store.index.ntotal == 40
+    assert store.manifest["index"]["index_type"] == "hnsw"
+
+
+@pytest.mark.parametrize("index_type, pca_dim, quantize", [
+    ("flat", None, "fp16"), ("flat", None, "int8"), ("flat", 16, None), ("ivf-flat", 16, "int8"),
+    ("hnsw", 16, "fp16"), ("ivf-pq", 16, None),
+])
+def test_compressed_indexes_find_corpus_vectors(index_type, pca_dim, quantize):
+    vectors = clustered_vectors(3000, 32, n_clusters=16)
+    full, _ = faiss_index.create_index(index_type, vectors)
+    index, params = faiss_index.create_index(index_type, vectors, pca_dim=pca_dim, quantize=quantize)
+    for i in (full, index):
+        i.add_with_ids(vectors, np.arange(100, 3100, dtype=np.int64))
+
+    _, ids = index.search(vectors[:20], 1)
+
+    assert (params.get("pca_dim"), params.get("quantize")) == (pca_dim, quantize)
+    assert np.mean(ids[:, 0] == np.arange(100, 120)) >= 0.9
+    assert faiss_index.index_bytes(index) < faiss_index.index_bytes(full)
+
+
+def test_quantize_needs_an_unquantized_index():
+    with pytest.raises(ValueError):
+        faiss_index.create_index("ivf-pq", clustered_vectors(2000, 16), quantize="int8")
+
+    _, params = faiss_index.create_index("flat", clustered_vectors(5, 16), pca_dim=8)
+    assert "pca_dim" not in params and params["requested_pca_dim"] == 8
+
+
+def test_compressed_store(tmp_path, monkeypatch, data_folders, fake_embeddings):
+    monkeypatch.setattr(config, "ANN_MIN_VECTORS", 100)
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    pl.DataFrame({
+        "uid": [f"e{i}" for i in range(400)],
+        "title_fr": [f"évènement {i} numéro {i % 7}" for i in range(400)],
+        "location_city": ["Brest" if i % 2 else "Rennes" for i in range(400)],
+    }).write_parquet(source)
+
+    def build(**kwargs):
+        with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+            indexing.build_index(source, destination, columns=["title_fr"], id_column="uid", incremental=True, **kwargs)
+        return VectorStore.load(destination, fake_embeddings)
+
+    store = build(pca_dim=24, quantize="int8")
+    query = fake_embeddings.embed_query("évènement 12 numéro 5")
+
+    assert isinstance(store.index, faiss.IndexPreTransform) and store.manifest["index"]["quantize"] == "int8"
+    assert store.index.d == fake_embeddings.dim
+    assert store.similarity_search_with_score_by_vector(query, k=1)[0][0].id == "e12"
+    assert [doc.metadata["location_city"] for doc, _ in store.similarity_search_with_score_by_vector(
+        query, k=3, filters=EventFilter(cities=("Rennes",))
+    )] == ["Rennes"] * 3
+    assert store.get_vectors(store._ids[:5]).shape == (5, fake_embeddings.dim)
+
+    store = build()
+    assert not isinstance(store.index, faiss.IndexPreTransform) and "quantize" not in store.manifest["index"]
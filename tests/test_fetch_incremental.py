@@ -0,0 +1,109 @@
+"""
+Tests for scripts.fetching.fetch_data_incremental
+
+Includes
+--------
+- Without a watermark, a full fetch is run and a watermark is saved.
+- With a watermark, only the updated events are requested and upserted by uid.
+- Events that left the `since` window are dropped from the store.
+- Events updated into invalid or out-of-region ones are dropped from the store.
+"""
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+import pytest
+
+from rag_poc import config
+import scripts.fetching as fetching
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+
+def test_first_run_is_a_full_fetch(tmp_path, make_event, stub_api):
+    destination = tmp_path / "events.parquet"
+    stub = stub_api([make_event(i, updatedat=f"2025-01-0{1 + i % 3}T00:00:00+00:00") for i in range(10)])
+
+    written = fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL,
+        destination=destination, url=stub.url,
+    )
+
+    assert written == 10
+    assert pl.read_parquet(destination).height == 10
+    assert fetching.load_watermark(destination)["updatedat"] == "2025-01-03T00:00:00+00:00"
+
+
+def test_incremental_run_upserts_delta(tmp_path, make_event, stub_api):
+    destination = tmp_path / "events.parquet"
+    events = [make_event(i) for i in range(10)]
+    stub = stub_api(events)
+    fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL,
+        destination=destination, url=stub.url,
+    )
+    requests_before = stub.requests
+
+    # One event is modified, one is new
+    changed = make_event(3, updatedat="2025-02-01T00:00:00+00:00")
+    changed["title_fr"] = "Titre modifié"
+    stub.events = sorted(
+        [e for e in events if e["uid"] != changed["uid"]]
+        + [changed, make_event(42, updatedat="2025-02-02T00:00:00+00:00")],
+        key=lambda e: e["uid"],
+    )
+
+    written = fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL,
+        destination=destination, url=stub.url,
+    )
+
+    df = pl.read_parquet(destination)
+    assert written == 2
+    assert stub.requests - requests_before == 1
+    assert df.height == 11
+    assert df["uid"].n_unique() == 11
+    assert df.filter(pl.col("uid") == "event00003")["title_fr"].item() == "Titre modifié"
+    assert fetching.load_watermark(destination)["updatedat"] == "2025-02-02T00:00:00+00:00"
+
+
+def test_incremental_run_drops_rejected_events(tmp_path, make_event, stub_api):
+    destination = tmp_path / "events.parquet"
+    events = [make_event(i) for i in range(5)]
+    stub = stub_api(events)
+    fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL,
+        destination=destination, url=stub.url,
+    )
+
+    # One event loses its title, one moves to another region
+    invalid = {**make_event(1, updatedat="2025-02-01T00:00:00+00:00"), "title_fr": None}
+    moved = make_event(2, region="Normandie", updatedat="2025-02-01T00:00:00+00:00")
+    stub.events = [invalid, moved] + [e for e in events if e["uid"] not in (invalid["uid"], moved["uid"])]
+
+    written = fetching.fetch_data_incremental(
+        region=config.REGION, limit=1000, since=0, until=config.UNTIL,
+        destination=destination, url=stub.url,
+    )
+
+    assert written == 0
+    assert sorted(pl.read_parquet(destination)["uid"].to_list()) == ["event00000", "event00003", "event00004"]
+
+
+def test_upsert_drops_expired_events(tmp_path):
+    now = datetime.now(timezone.utc)
+    row = {
+        "uid": "old", "canonicalurl": "", "title_fr": "", "description_fr": None,
+        "longdescription_fr": None, "location_city": None, "conditions_fr": None,
+        "keywords_fr": None, "firstdate_begin": now - timedelta(days=10),
+        "firstdate_end": now, "lastdate_begin": now, "lastdate_end": now,
+        "accessibility_label_fr": None, "location_coordinates": None,
+    }
+    destination = tmp_path / "events.parquet"
+    delta = tmp_path / "delta.parquet"
+    schema = fetching.validation.EVENT_SCHEMA
+    pl.DataFrame([row, {**row, "uid": "kept", "firstdate_begin": now}], schema=schema).write_parquet(destination)
+    pl.DataFrame([{**row, "uid": "new", "firstdate_begin": now}], schema=schema).write_parquet(delta)
+
+    fetching.upsert_parquet(destination, delta, id_column="uid", since=5)
+
+    assert sorted(pl.read_parquet(destination)["uid"].to_list()) == ["kept", "new"]
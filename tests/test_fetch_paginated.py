@@ -0,0 +1,92 @@
+"""
+Tests for scripts.fetching.fetch_data_paginated
+
+Runs the paginated fetch against a local stub of the OpenAgenda export endpoint.
+
+Includes
+--------
+- All events of the window are written once, across date and offset pages.
+- Invalid documents are left out of the Parquet file, and a run without errors keeps the error file.
+- The wall time scales with the number of workers.
+- An empty API response raises ValueError.
+"""
+import time
+
+import polars as pl
+import pytest
+
+from rag_poc import config
+import scripts.fetching as fetching
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+
+def test_paginated_fetch_writes_every_event(tmp_path, make_event, stub_api):
+    """
+    Events spread over several date pages, some needing offset pages, are all written once.
+    Documents failing validation are not written.
+    """
+    events = [make_event(i) for i in range(120)] + [make_event(999, region="Normandie")]
+    destination = tmp_path / "out.parquet"
+    stub = stub_api(events)
+
+    written = fetching.fetch_data_paginated(
+        region=config.REGION, limit=10_000, since=0, until=config.UNTIL,
+        destination=destination, workers=4, page_days=60, page_size=10, url=stub.url,
+    )
+
+    df = pl.read_parquet(destination)
+    assert written == 120
+    assert sorted(df["uid"].to_list()) == [f"event{i:05d}" for i in range(120)]
+    assert df["longdescription_fr"][0] == "Contenu long"
+    assert (tmp_path / "error.jsonl").read_text().count("\n") == 1
+
+    stub.events = events[:-1]
+    fetching.fetch_data_paginated(
+        region=config.REGION, limit=10_000, since=0, until=config.UNTIL,
+        destination=destination, workers=4, page_days=60, page_size=10, url=stub.url,
+    )
+    assert "event00999" in (tmp_path / "error.jsonl").read_text()
+
+
+def test_paginated_fetch_respects_limit(tmp_path, make_event, stub_api):
+    """ No more than `limit` events are written. """
+    stub = stub_api([make_event(i) for i in range(50)])
+
+    written = fetching.fetch_data_paginated(
+        region=config.REGION, limit=15, since=0, until=config.UNTIL,
+        destination=tmp_path / "out.parquet", workers=2, page_days=30, page_size=5, url=stub.url,
+    )
+
+    assert written == 15
+    assert pl.read_parquet(tmp_path / "out.parquet").height == 15
+
+
+def test_paginated_fetch_scales_with_workers(tmp_path, make_event, stub_api):
+    """ With a slow server, 8 workers finish well before a single one. """
+    stub = stub_api([make_event(i) for i in range(40)], latency=0.05)
+    timings = {}
+
+    for workers in (1, 8):
+        start = time.perf_counter()
+        fetching.fetch_data_paginated(
+            region=config.REGION, limit=10_000, since=0, until=config.UNTIL,
+            destination=tmp_path / f"out_{workers}.parquet", workers=workers,
+            page_days=30, page_size=1000, url=stub.url,
+        )
+        timings[workers] = time.perf_counter() - start
+
+    assert timings[8] < timings[1] / 3
+
+
+def test_paginated_fetch_no_data(tmp_path, stub_api):
+    """ An API returning nothing raises ValueError and leaves no output file. """
+    stub = stub_api([])
+
+    with pytest.raises(ValueError):
+        fetching.fetch_data_paginated(
+            region=config.REGION, limit=100, since=0, until=30,
+            destination=tmp_path / "out.parquet", workers=2, url=stub.url,
+        )
+
+    assert not (tmp_path / "out.parquet").exists()
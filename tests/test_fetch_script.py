@@ -16,7 +16,7 @@ import scripts.fetching as fetching
 # SUCCESS CASE
 # ---------------------------------------------------------------------------
 @patch("scripts.fetching.pl.DataFrame.write_parquet")                     
-@patch("scripts.fetching.validation.Event.model_validate", side_effect=lambda x: x)  
+@patch("scripts.fetching.validation.validate_batch", side_effect=lambda docs, **kwargs: (fetching.pl.DataFrame(docs), []))
 @patch("scripts.fetching.get_json_from_api")                              
 def test_main_success(mock_fetch, mock_validate, mock_write, tmp_path):
     """
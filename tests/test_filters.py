@@ -0,0 +1,127 @@
+"""
+Tests for rag_poc.filters and the filtered search of rag_poc.vector_store
+
+Includes
+--------
+- The metadata index selects the events by date window, city (case and accents ignored) and radius.
+- A filtered search only returns matching events, even when closer events are filtered out.
+- The ID selector keeps the search parameters of the approximate indexes.
+- /search accepts filters and rejects invalid ones.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from aiohttp.test_utils import TestClient, TestServer
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from rag_poc import config, faiss_index, retrieval
+from rag_poc.answer_cache import answer_context
+from rag_poc.filters import EventFilter, MetadataIndex
+from rag_poc.vector_store import VectorStore
+from scripts import serve
+
+BREST, RENNES, VITRE = (48.39, -4.49), (48.11, -1.68), (48.12, -1.21)
+
+
+def day(d: int) -> datetime:
+    return datetime(2025, 6, d, tzinfo=timezone.utc)
+
+
+def event(city, coordinates, begin, end):
+    lat, lon = coordinates
+    return {"location_city": city, "location_coordinates": {"lat": lat, "lon": lon},
+            "firstdate_begin": day(begin), "lastdate_end": day(end)}
+
+
+EVENTS = {
+    "jazz-brest": ("concert de jazz", event("Brest", BREST, 7, 8)),
+    "jazz-rennes": ("concert de jazz au parc", event("Rennes", RENNES, 7, 8)),
+    "jazz-vitre": ("concert de jazz en plein air", event("Vitré", VITRE, 20, 21)),
+    "expo-brest": ("exposition de peinture", event("brest", BREST, 1, 30)),
+}
+
+
+@pytest.fixture
+def store(data_folders, make_store, fake_embeddings):
+    make_store(config.VECTORS_FOLDER, {k: v[0] for k, v in EVENTS.items()}, metadata={k: v[1] for k, v in EVENTS.items()})
+    return VectorStore.load(config.VECTORS_FOLDER, fake_embeddings)
+
+
+def selected(store, **filters):
+    rows = store.select(EventFilter(**filters))
+    return sorted(store.documents.column("doc_id").take(rows).to_pylist())
+
+
+def test_metadata_index_selects_rows(store):
+    assert store.cities == ["Brest", "Rennes", "Vitré"]
+    assert selected(store, start=day(9)) == ["expo-brest", "jazz-vitre"]
+    assert selected(store, start=day(7), end=day(9)) == ["expo-brest", "jazz-brest", "jazz-rennes"]
+    assert selected(store, cities=("BREST",)) == ["expo-brest", "jazz-brest"]
+    assert selected(store, cities=("vitre", "Quimper")) == ["jazz-vitre"]
+    assert selected(store, near=RENNES, radius_km=50) == ["jazz-rennes", "jazz-vitre"]
+    assert selected(store, near=RENNES, radius_km=10) == ["jazz-rennes"]
+    assert selected(store, near=RENNES, radius_km=50, end=day(10)) == ["jazz-rennes"]
+
+
+def test_rows_without_metadata_are_never_selected():
+    documents = pa.table({"page_content": ["a", "b"], "location_city": [None, "Brest"],
+                          "firstdate_begin": ["2025-06-01T10:00:00+02:00", None]})
+    index = MetadataIndex.build(documents)
+
+    assert index.select(EventFilter(end=day(2))).tolist() == [0]
+    assert index.select(EventFilter(cities=("Brest",))).tolist() == [1]
+    assert index.select(EventFilter(near=BREST)).tolist() == []
+
+
+def test_filtered_search_returns_only_matches(store):
+    unfiltered = store.similarity_search("concert de jazz", k=1)
+    in_vitre = store.similarity_search("concert de jazz", k=3, filters=EventFilter(cities=("Vitré",)))
+    this_weekend = store.hybrid_search_with_score("concert de jazz", k=3, filters=EventFilter(start=day(7), end=day(9), near=BREST))
+
+    assert unfiltered[0].id == "jazz-brest"
+    assert [doc.id for doc in in_vitre] == ["jazz-vitre"]
+    assert [doc.id for doc, _ in this_weekend] == ["jazz-brest", "expo-brest"]
+    assert store.similarity_search("jazz", k=3, filters=EventFilter(cities=("Quimper",))) == []
+
+
+@pytest.mark.parametrize("index_type", ["ivf-flat", "hnsw"])
+def test_selector_keeps_search_parameters(index_type, monkeypatch):
+    monkeypatch.setattr(config, "ANN_MIN_VECTORS", 100)
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64) * 3
+    index, params = faiss_index.create_index(index_type, vectors, nprobe=7, ef_search=33)
+    index.add_with_ids(vectors, ids)
+
+    search_params = faiss_index.selector_params(index, faiss_index.id_selector(ids[::10]))
+    _, found = index.search(vectors[:5], 5, params=search_params)
+
+    assert np.isin(found, ids[::10]).all()
+    assert (search_params.nprobe if index_type == "ivf-flat" else search_params.efSearch) == (7 if index_type == "ivf-flat" else 33)
+
+
+def test_filters_change_the_answer_context():
+    filters = EventFilter(cities=("Brest",))
+
+    assert answer_context("v1", 0.7, 3, filters) != answer_context("v1", 0.7, 3)
+    assert answer_context("v1", 0.7, 3, filters) == answer_context("v1", 0.7, 3, EventFilter(cities=("brest",)))
+
+
+def test_search_endpoint_filters(store, monkeypatch, fake_embeddings):
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+
+    async def main():
+        async with TestClient(TestServer(serve.create_app())) as client:
+            filtered = await client.post("/search", json={
+                "query": "concert de jazz", "k": 3,
+                "filters": {"start": "2025-06-07", "end": "2025-06-09", "near": {"lat": BREST[0], "lon": BREST[1]}, "radius_km": 30},
+            })
+            invalid = await client.post("/search", json={"query": "jazz", "filters": {"start": "demain"}})
+            return await filtered.json(), invalid.status
+
+    filtered, invalid_status = asyncio.run(main())
+
+    assert [doc["id"] for doc in filtered["documents"]] == ["jazz-brest", "expo-brest"]
+    assert invalid_status == 400
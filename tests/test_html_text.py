@@ -0,0 +1,70 @@
+"""
+Tests for rag_poc.html_text
+
+Includes
+--------
+- `html_to_text` gives the text of BeautifulSoup (html.parser, separator " ")
+  on the markup of event descriptions and on its edge cases: entities, void and
+  unclosed tags, whitespace, comments, scripts, CDATA, broken markup.
+- Same output on random concatenations of these fragments.
+- `clean_texts` in a process pool cleans by chunks and keeps the order of the texts.
+"""
+import random
+
+from bs4 import BeautifulSoup
+import pytest
+
+from rag_poc.html_text import clean_html, clean_texts, cleaning_pool, html_to_text
+
+CASES = [
+    "<p>Concert de <b>jazz</b> au port.</p>\n<p>Entrée libre</p>",
+    "<ul><li>Atelier</li>\n  <li>Goûter</li></ul>",
+    "Ciné-débat&nbsp;: &laquo;&#160;Les Glaneurs&#xA0;&raquo; &amp; rencontre",
+    "Prix : 5&euro; &#128; &#150; &#0; &#x110000; &#55296;",
+    "Tom &amp Jerry &foo; &#12ab; &#xZZ; & < > a<b",
+    "ligne 1<br>ligne 2<br/>ligne 3</br>fin",
+    "<pre>  deux  espaces\n</pre>   \n  <textarea>\n</textarea>",
+    "<script>var x = '<p>';</script><style>p {}</style>visible<template><p>non</p></template>",
+    "<ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby>",
+    "<!DOCTYPE html><!-- commentaire --><?php echo 1 ?><![CDATA[données]]><![if !IE]>fin",
+    "<b><pre>a</b>   <i>b</i>",
+    "<div><p>non fermé<div>  \t </span>texte",
+    "<P CLASS='x'>Majuscules</P><SCRIPT>caché</Script>",
+    "<a href='?a=1&amp;b=2'>lien</a><img src=x alt='<b>'>",
+    "<p>incomplet <",
+    "<!-",
+]
+
+FRAGMENTS = [
+    "<p>", "</p>", "<b>", "</b>", "<br>", "<br/>", "</br>", "<pre>", "</pre>", "<script>", "</script>",
+    "<template>", "</template>", "<rt>", "<!-- c -->", "<![CDATA[x y]]>", "&amp;", "&nbsp;", "&foo;",
+    "&#39;", "&#150;", "&", "<", " ", "\n", "  \n ", "\xa0", "texte", "é à", "<img src='a'>", "<div class=x>",
+]
+
+
+def bs4_text(markup: str) -> str:
+    return BeautifulSoup(markup, "html.parser").get_text(separator=" ")
+
+
+@pytest.mark.parametrize("markup", CASES)
+def test_same_text_as_beautifulsoup(markup):
+    assert html_to_text(markup) == bs4_text(markup)
+
+
+def test_same_text_on_random_markup():
+    rng = random.Random(0)
+    for _ in range(2000):
+        markup = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+        assert html_to_text(markup) == bs4_text(markup), markup
+
+
+def test_clean_texts_in_a_pool():
+    texts = [None, "", "  brut  ", *CASES, "&amp; fin"]
+
+    with cleaning_pool(2) as pool:
+        cleaned = clean_texts(texts, executor=pool, chunk_size=3)
+
+    assert cleaned == [clean_html(v) for v in texts]
+    assert cleaned[:3] == [None, None, "brut"]
+    with cleaning_pool(1) as pool:
+        assert pool is None
@@ -0,0 +1,131 @@
+"""
+Tests for the incremental update of the FAISS vector store in scripts.indexing
+
+Includes
+--------
+- A full build stores every document under its faiss id.
+- An incremental build embeds only new or changed documents and removes deleted ones,
+  and the lexical index follows.
+- After a removal and an addition keeping the count, the stored vectors are those of the new ids.
+- The columnar documents join the non-empty text columns, keep the other columns
+  as metadata, hash the contents and keep the last row of a duplicated id.
+"""
+from unittest.mock import patch
+
+import faiss
+from langchain.schema import Document
+import numpy as np
+import polars as pl
+import pytest
+
+from rag_poc.vector_store import VectorStore, content_hash, documents_table, faiss_id
+import scripts.indexing as indexing
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+
+def write_source(path, rows):
+    pl.DataFrame(
+        {
+            "uid": [uid for uid, _ in rows],
+            "title_fr": [title for _, title in rows],
+            "canonicalurl": [f"https://example.com/{uid}" for uid, _ in rows],
+        }
+    ).write_parquet(path)
+
+
+@pytest.fixture
+def embeddings(fake_embeddings):
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+        yield fake_embeddings
+
+
+def build(source, destination, incremental=False):
+    indexing.build_index(
+        source=source, destination=destination, columns=["title_fr"],
+        id_column="uid", incremental=incremental,
+    )
+
+
+def load(destination, embeddings):
+    return VectorStore.load(destination, embeddings)
+
+
+def test_full_build_is_id_mapped(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, [("a", "concert de jazz"), ("b", "exposition de peinture")])
+
+    build(source, destination)
+
+    store = load(destination, embeddings)
+    assert store.index.ntotal == 2
+    assert store.get_documents([faiss_id("b")])[0].id == "b"
+    assert store.similarity_search("jazz", k=1)[0].metadata["canonicalurl"] == "https://example.com/a"
+
+
+def test_incremental_build_embeds_only_the_delta(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, [("a", "concert de jazz"), ("b", "exposition de peinture"), ("c", "marché de noël")])
+    build(source, destination)
+    embeddings.embedded.clear()
+
+    # 'a' unchanged, 'b' changed, 'c' removed, 'd' new
+    write_source(source, [("a", "concert de jazz"), ("b", "exposition de sculpture"), ("d", "festival de cinéma")])
+    build(source, destination, incremental=True)
+
+    assert sorted(embeddings.embedded) == ["exposition de sculpture", "festival de cinéma"]
+
+    store = load(destination, embeddings)
+    assert store.index.ntotal == 3
+    assert sorted(store.content_hashes()) == ["a", "b", "d"]
+    assert store.similarity_search("sculpture", k=1)[0].page_content == "exposition de sculpture"
+    # The BM25 index is rebuilt from the updated documents
+    assert store.hybrid_search_with_score("sculpture", k=1)[0][0].id == "b"
+    assert len(store.lexical.search("peinture", k=3)[0]) == 0
+
+
+def test_incremental_build_without_store_builds_from_scratch(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, [("a", "concert de jazz")])
+
+    build(source, destination, incremental=True)
+
+    assert load(destination, embeddings).index.ntotal == 1
+
+
+def test_documents_frame_is_columnar():
+    df = pl.DataFrame({
+        "title_fr": ["Concert", "Expo", None, "Marché"],
+        "description_fr": ["de jazz", "", None, "de Noël"],
+        "location_city": ["Rennes", "Brest", "Vitré", "Dinan"],
+    })
+
+    table = indexing.documents_frame(df, ["title_fr", "description_fr"], ["a", "b", "c", "a"])
+
+    assert table.column("doc_id").to_pylist() == ["b", "c", "a"]
+    assert table.column("page_content").to_pylist() == ["Expo", "", "Marché\n\nde Noël"]
+    assert table.column("faiss_id").to_pylist() == [faiss_id(doc_id) for doc_id in "bca"]
+    assert table.column("content_hash").to_pylist() == [content_hash(text) for text in ("Expo", "", "Marché\n\nde Noël")]
+    assert [texts for texts in indexing.iter_texts(table, chunk_rows=2)] == [["Expo", ""], ["Marché\n\nde Noël"]]
+
+    documents = [doc for chunk in indexing.iter_documents(table, chunk_rows=2) for doc in chunk]
+    assert documents[2].id == "a"
+    assert documents[2].metadata == {"location_city": "Dinan", "content_hash": content_hash("Marché\n\nde Noël")}
+    assert indexing.df_to_documents(df, ["title_fr"])[0].metadata == {"description_fr": "de jazz", "location_city": "Rennes"}
+
+
+def test_vectors_follow_removal_and_addition():
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(4))
+    store = VectorStore({"version": None, "index": {"index_type": "flat"}}, index, documents_table({}))
+    documents = {f"doc{i}": Document(page_content=f"texte {i}", metadata={"content_hash": str(i)}) for i in range(3)}
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    indexing.add_documents_with_ids(store, documents_table(documents), vectors[np.argsort([faiss_id(d) for d in documents])])
+    np.testing.assert_array_equal(store.get_vectors([faiss_id("doc0")]), vectors[:1])
+
+    indexing.remove_documents(store, ["doc0"])
+    new = documents_table({"doc3": Document(page_content="texte 3", metadata={"content_hash": "3"})})
+    indexing.add_documents_with_ids(store, new, np.full((1, 4), 100, dtype=np.float32))
+
+    assert store.index.ntotal == 3
+    np.testing.assert_array_equal(store.get_vectors([faiss_id("doc3"), faiss_id("doc1")]), [[100] * 4, vectors[1]])
+    assert store.get_documents([faiss_id("doc3")])[0].id == "doc3"
@@ -0,0 +1,87 @@
+"""
+Tests for rag_poc.lexical and the hybrid search of rag_poc.vector_store
+
+Includes
+--------
+- The analyzer folds accents and case, drops stop words and stems plurals and feminines.
+- BM25 ranks the documents sharing the rarest query terms first, and skips non-matching ones.
+- A saved index is memory-mapped back with the same results.
+- The reciprocal-rank fusion favours the documents ranked well by both rankings.
+- The hybrid search finds a town or a keyword from the metadata that the dense search misses.
+"""
+import numpy as np
+import pytest
+
+from rag_poc import config, retrieval
+from rag_poc.lexical import LexicalIndex, analyze, reciprocal_rank_fusion
+from rag_poc.vector_store import VectorStore
+
+TEXTS = [
+    "Concert de jazz à Rennes",
+    "Exposition de peintures à Brest",
+    "Festival des musiciennes bretonnes, Rennes",
+    "Marché de Noël",
+]
+
+
+def test_analyze_folds_and_stems():
+    assert analyze("Les THÉÂTRES de la Ville") == analyze("théâtre ville")
+    assert analyze("musiciennes") == analyze("musicien")
+    assert analyze("chanteuse") == analyze("chanteur")
+    assert analyze("festivaux") == analyze("festival")
+    assert analyze("le la les de à") == []
+
+
+def test_bm25_ranks_rare_terms_first():
+    index = LexicalIndex.build(TEXTS)
+
+    rows, scores = index.search("festival à Rennes", k=5)
+
+    assert rows.tolist() == [2, 0]
+    assert scores[0] > scores[1] > 0
+    assert index.search("opéra", k=5)[0].tolist() == []
+    assert index.search("rennes", k=1)[0].tolist() == [0]  # shorter document first
+
+
+def test_saved_index_is_memory_mapped(tmp_path):
+    index = LexicalIndex.build(TEXTS)
+    index.save(tmp_path, {"fields": []})
+
+    loaded = LexicalIndex.load(tmp_path)
+
+    assert isinstance(loaded.rows, np.memmap)
+    for query in ("jazz", "rennes bretonne", "noël peinture"):
+        expected_rows, expected_scores = index.search(query, k=4)
+        rows, scores = loaded.search(query, k=4)
+        assert rows.tolist() == expected_rows.tolist()
+        assert scores == pytest.approx(expected_scores)
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+
+    assert [item for item, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_hybrid_search_matches_metadata(data_folders, make_store, fake_embeddings, monkeypatch):
+    make_store(
+        config.VECTORS_FOLDER,
+        {"a": "concert de jazz", "b": "grand concert de jazz manouche", "c": "sortie en forêt"},
+        metadata={
+            "a": {"location_city": "Rennes", "keywords_fr": ["musique"]},
+            "b": {"location_city": "Vitré", "keywords_fr": ["musique"]},
+            "c": {"location_city": "Paimpont", "keywords_fr": ["randonnée", "nature"]},
+        },
+    )
+    store = VectorStore.load(config.VECTORS_FOLDER, fake_embeddings)
+
+    assert store.manifest["lexical"]["fields"] == list(config.LEXICAL_FIELDS)
+    assert store.similarity_search("concert à Vitré", k=1)[0].id == "a"  # the town is not embedded
+    assert store.hybrid_search_with_score("Vitré", k=1)[0][0].id == "b"
+    assert store.hybrid_search_with_score("randonnées", k=1)[0][0].id == "c"
+    assert [[doc.id for doc, _ in results] for results in store.batch_hybrid_search_with_score(["Vitré", "randonnée"], k=1)] == [["b"], ["c"]]
+
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    assert retrieval.retrieve("Vitré", k=1)[0].id == "b"
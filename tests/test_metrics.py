@@ -0,0 +1,107 @@
+"""
+Tests for rag_poc.metrics and the instrumentation of the pipeline
+
+Includes
+--------
+- Disabled, the spans are a shared no-op and nothing is recorded.
+- Enabled, the spans fill histograms and the counters add up, exported as Prometheus text and JSON.
+- `run.py --metrics --profile` records the spans of a fetch and writes the metrics and the cProfile.
+- The searches and prompts record the query spans, served at /metrics by the API.
+"""
+import asyncio
+import json
+import pstats
+
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from rag_poc import config, metrics, retrieval
+import run
+from scripts import serve
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+def test_disabled_metrics_record_nothing():
+    assert metrics.span("fetch_http") is metrics.span("validate")
+    with metrics.span("fetch_http"):
+        metrics.count("fetched_records", 10)
+
+    assert metrics.snapshot() == {"counters": {}, "histograms": {}}
+
+
+def test_spans_and_counters(tmp_path):
+    metrics.enable()
+    for ms in (0.5, 3, 3, 40, 60_000):
+        metrics.observe("embed_batch", ms)
+    with metrics.span("faiss_add"):
+        pass
+    metrics.count("embedded_texts", 64)
+    metrics.count("embedded_texts", 36)
+
+    snapshot = metrics.snapshot()
+    embed = snapshot["histograms"]["embed_batch"]
+    assert snapshot["counters"] == {"embedded_texts": 100}
+    assert embed["count"] == 5 and embed["sum_ms"] == pytest.approx(60_046.5)
+    assert (embed["p50_ms"], embed["p95_ms"]) == (5, None)  # bucket bounds, None beyond the last one
+    assert snapshot["histograms"]["faiss_add"]["count"] == 1
+
+    text = metrics.render_prometheus()
+    assert "rag_poc_embedded_texts_total 100" in text
+    assert 'rag_poc_embed_batch_ms_bucket{le="1"} 1' in text
+    assert 'rag_poc_embed_batch_ms_bucket{le="5"} 3' in text
+    assert 'rag_poc_embed_batch_ms_bucket{le="+Inf"} 5' in text
+    assert "rag_poc_embed_batch_ms_count 5" in text
+
+    metrics.save(tmp_path / "metrics.json")
+    metrics.save(tmp_path / "metrics.prom")
+    assert json.loads((tmp_path / "metrics.json").read_text()) == snapshot
+    assert (tmp_path / "metrics.prom").read_text() == text
+
+
+def test_run_records_metrics_and_profile(tmp_path, monkeypatch, make_event, stub_api):
+    stub = stub_api([make_event(i) for i in range(30)] + [make_event(99, region="Normandie")])
+    monkeypatch.setattr(config, "BASE_URL", stub.url.removesuffix("/exports/json"))
+
+    run.run([
+        "--metrics", str(tmp_path / "metrics.json"), "--profile", str(tmp_path / "fetch.prof"),
+        "fetch", "--paginated", "--destination", str(tmp_path / "events.parquet"), "--page-days", "100",
+    ])
+
+    recorded = json.loads((tmp_path / "metrics.json").read_text())
+    assert {"fetch_http", "validate", "html_clean", "parquet_write"} <= set(recorded["histograms"])
+    assert recorded["counters"] == {"fetched_records": 31, "rejected_records": 1}
+    assert pstats.Stats(str(tmp_path / "fetch.prof")).total_calls > 0
+
+
+def test_query_spans_served_by_the_api(monkeypatch, make_store, fake_embeddings, make_chat_model):
+    retrieval.clear_caches()
+    make_store(config.VECTORS_FOLDER, {"a": "concert de jazz", "b": "exposition de peinture"})
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: make_chat_model())
+
+    async def requests(client):
+        disabled = await client.get("/metrics")
+        metrics.enable()
+        await (await client.post("/recommend", json={"query": "jazz", "stream": True})).read()
+        response = await client.get("/metrics")
+        return disabled.status, response.status, await response.text()
+
+    async def main():
+        async with TestClient(TestServer(serve.create_app(batch_max=1))) as client:
+            return await requests(client)
+
+    disabled, status, text = asyncio.run(main())
+
+    assert disabled == 404 and status == 200
+    for name in ("query_embed", "query_search", "prompt_build", "query_retrieval", "query_ttft", "query_generate"):
+        assert f"rag_poc_{name}_ms_count 1" in text
+    assert "rag_poc_searched_queries_total 1" in text
@@ -0,0 +1,126 @@
+"""
+Tests for rag_poc.rerank and the two-stage search of rag_poc.retrieval
+
+Includes
+--------
+- The store gives back the stored vectors of ids, for flat, IVF and HNSW indexes opened with mmap.
+- MMR trades relevance for diversity: a duplicate of the first pick is passed over for another event.
+- The lexical reranker promotes the candidates holding every query term, ties keep the first stage order.
+- The cross-encoder scores the best ranks first and leaves the rest in order once its budget is spent.
+- With a reranker, the search over-fetches, reranks, keeps k results and reports the stage timings.
+"""
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from langchain.schema import Document
+import numpy as np
+import pytest
+
+from rag_poc import config, faiss_index, retrieval
+from rag_poc.rerank import CrossEncoderReranker, LexicalReranker, MMRReranker, create_reranker
+from rag_poc.vector_store import VectorStore, documents_table, faiss_id, save_store
+from scripts import serve
+
+TEXTS = {"a": "concert jazz", "b": "concert jazz", "c": "concert rock", "d": "marché de noël"}
+
+
+@pytest.fixture
+def store(data_folders, make_store, fake_embeddings):
+    make_store(config.VECTORS_FOLDER, TEXTS)
+    return VectorStore.load(config.VECTORS_FOLDER, fake_embeddings)
+
+
+def candidates(store, query, k=4):
+    return store.similarity_search_with_score(query, k)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf-flat", "hnsw"])
+def test_get_vectors(tmp_path, index_type):
+    vectors = np.random.default_rng(0).standard_normal((config.ANN_MIN_VECTORS, 8)).astype(np.float32)
+    doc_ids = [f"doc-{i}" for i in range(len(vectors))]
+    index, params = faiss_index.create_index(index_type, vectors)
+    index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in doc_ids], dtype=np.int64))
+    documents = {doc_id: Document(page_content=doc_id, metadata={"content_hash": doc_id}) for doc_id in doc_ids}
+    save_store(tmp_path, index, documents_table(documents), params, config.EMBEDDING_MODEL)
+
+    store = VectorStore.load(tmp_path)
+    picked = [3, 999, 0, 3]
+
+    assert store.get_vectors([faiss_id(doc_ids[i]) for i in picked]) == pytest.approx(vectors[picked])
+    assert store.get_vectors([]).shape == (0, 8)
+
+
+def test_mmr_prefers_diverse_events(store, fake_embeddings):
+    query = fake_embeddings.embed_query("concert jazz")
+    results = candidates(store, "concert jazz", k=3)  # a, b, c
+
+    relevant = MMRReranker(diversity=1.0).rerank("concert jazz", query, results, store, k=2)
+    diverse = MMRReranker(diversity=0.3).rerank("concert jazz", query, results, store, k=2)
+
+    assert sorted(doc.id for doc, _ in relevant) == ["a", "b"]
+    assert diverse[0][0].id in ("a", "b")
+    assert diverse[1][0].id == "c"
+    assert diverse[0][1] > diverse[1][1]
+
+
+def test_lexical_reranker_keeps_first_stage_ties(store):
+    results = [(Document(id=doc_id, page_content=text), 0.0) for doc_id, text in TEXTS.items()]
+
+    reranked = LexicalReranker().rerank("rock", None, results, store, k=3)
+
+    assert [doc.id for doc, _ in reranked] == ["c", "a", "b"]
+    assert [score for _, score in reranked] == [1.0, 0.0, 0.0]
+
+
+def test_cross_encoder_budget():
+    class SlowModel:
+        calls = 0
+
+        def predict(self, pairs, batch_size):
+            SlowModel.calls += 1
+            if SlowModel.calls > 1:
+                raise AssertionError("Scored after the budget was spent.")
+            return [len(text) for _, text in pairs]
+
+    reranker = object.__new__(CrossEncoderReranker)
+    reranker.model, reranker.batch_size, reranker.budget_ms, reranker.max_chars = SlowModel(), 2, 0.0, 100
+    results = [[(Document(id=f"{q}{i}", page_content="x" * (i + 1)), 0.0) for i in range(3)] for q in "pq"]
+
+    reranked = reranker.rerank_many(["p", "q"], None, results, None, k=3)
+
+    # The first batch holds the first candidate of each query, the others keep their rank
+    assert [doc.id for doc, _ in reranked[0]] == ["p0", "p1", "p2"]
+    assert [score for _, score in reranked[1]] == [1.0, 1.0, 1.0]
+
+
+def test_create_reranker():
+    assert create_reranker(None) is None
+    assert isinstance(create_reranker("mmr"), MMRReranker)
+    with pytest.raises(ValueError):
+        create_reranker("bm25")
+
+
+def test_reranked_search(store, monkeypatch, fake_embeddings):
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(config, "RERANKER", "lexical")
+    monkeypatch.setattr(config, "RERANK_CANDIDATES", 4)
+    monkeypatch.setattr(retrieval, "get_reranker", lambda: create_reranker(config.RERANKER))
+    timings = {}
+
+    results = retrieval.search("rock jazz concert", k=2, timings=timings)
+    batched = retrieval.search_many(["rock jazz concert", "noël"], k=1)
+
+    assert len(results) == 2
+    assert set(timings) == {"embed_ms", "search_ms", "rerank_ms"}
+    assert [[doc.id for doc, _ in found] for found in batched] == [[results[0][0].id], ["d"]]
+
+    async def main():
+        async with TestClient(TestServer(serve.create_app(batch_max=1))) as client:
+            response = await client.post("/search", json={"query": "concert rock", "k": 1})
+            return await response.json()
+
+    response = asyncio.run(main())
+
+    assert response["documents"][0]["id"] == "c"
+    assert {"total_ms", "rerank_ms"} <= set(response["timings"])
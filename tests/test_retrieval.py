@@ -0,0 +1,101 @@
+"""
+Tests for rag_poc.retrieval and the reruns of scripts/chat.py
+
+Includes
+--------
+- Streamlit reruns of the chat app load the vector store and the clients once.
+- The vector store is reloaded when its manifest changes, and only then.
+- The API key is read once and the chat model is created once per temperature.
+- A streamed recommendation has its events before the generation, and records its time to first token.
+"""
+from types import SimpleNamespace
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from rag_poc import config, retrieval
+from rag_poc.answer_cache import MemoryAnswerCache
+from rag_poc.vector_store import VectorStore
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+EVENTS = {"a": "concert de jazz", "b": "exposition de peinture", "c": "marché de noël"}
+
+
+@pytest.fixture
+def resources(monkeypatch, fake_embeddings, make_chat_model):
+    """ Fake clients, and the list of the store loads. """
+    retrieval.clear_caches()
+    chat_model = make_chat_model()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: chat_model)
+
+    loads = []
+    load = VectorStore.load.__func__
+    monkeypatch.setattr(VectorStore, "load", classmethod(lambda cls, *args, **kwargs: loads.append(args) or load(cls, *args, **kwargs)))
+
+    return SimpleNamespace(chat_model=chat_model, loads=loads)
+
+
+def test_clients_are_created_once(monkeypatch):
+    retrieval.clear_caches()
+    reads = []
+    monkeypatch.setattr(config, "load_api_key", lambda: reads.append(1) or "test-key")
+
+    models = [retrieval.get_chat_model(t) for t in (0.2, 0.2, 0.7, 0.2)]
+
+    assert models[0] is models[1] is models[3] and models[2] is not models[0]
+    assert len(reads) == 1
+    retrieval.clear_caches()
+
+
+def test_reruns_load_the_store_once(make_store, resources):
+    make_store(config.VECTORS_FOLDER, EVENTS)
+    app = AppTest.from_file("../scripts/chat.py", default_timeout=30).run()
+
+    for temperature, question in ((0.2, "jazz"), (0.5, "peinture"), (0.5, "noël")):
+        app.sidebar.slider[0].set_value(temperature).run()
+        app.text_area[0].input(question)
+        app.button[0].click().run()
+
+    assert not app.exception
+    assert len(resources.loads) == 1
+    assert len(resources.chat_model.prompts) == 3
+    assert "concert de jazz" in resources.chat_model.prompts[0]
+    assert any("Allez au concert." in md.value for md in app.markdown)
+
+
+def test_stream_recommendation(make_store, resources, monkeypatch, make_chat_model):
+    make_store(config.VECTORS_FOLDER, EVENTS)
+    chat_model = make_chat_model(answer="Allez au concert de jazz.", first_token_delay=0.05, token_delay=0.01)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: chat_model)
+    cache = MemoryAnswerCache()
+
+    recommendation = retrieval.stream_recommendation("jazz", k=2, cache=cache)
+
+    assert recommendation.documents[0].id == "a" and not chat_model.prompts
+    assert "ttft_ms" not in recommendation.timings
+    chunks = list(recommendation)
+    assert len(chunks) == 5 and recommendation.answer == "Allez au concert de jazz."
+    timings = recommendation.timings
+    assert {"embed_ms", "search_ms"} <= set(timings)
+    assert 50 <= timings["ttft_ms"] <= timings["generate_ms"]
+    assert timings["generate_ms"] >= 50 + 4 * 10
+
+    cached = retrieval.stream_recommendation("jazz", k=2, cache=cache)
+    assert cached.cached and list(cached) == ["Allez au concert de jazz."]
+    assert len(chat_model.prompts) == 1
+
+
+def test_store_reloaded_when_manifest_changes(make_store, resources):
+    make_store(config.VECTORS_FOLDER, EVENTS)
+
+    first = retrieval.get_vector_store()
+    assert retrieval.get_vector_store() is first
+
+    make_store(config.VECTORS_FOLDER, {**EVENTS, "d": "festival de cinéma"})
+    second = retrieval.get_vector_store()
+
+    assert second is not first and len(second) == 4
+    assert retrieval.retrieve("cinéma", k=1)[0].id == "d"
+    assert len(resources.loads) == 2
@@ -0,0 +1,146 @@
+"""
+Tests for the retrieval API in scripts.serve
+
+Runs the aiohttp application in-process against a small store, with fake clients.
+
+Includes
+--------
+- /health reports the store version and size, opening the store in the worker pool.
+- /search returns the best documents with their fusion scores and metadata, with and without batching.
+- /recommend answers with the generated text, or streams NDJSON tokens, with their timings.
+- A near-duplicate /recommend question gets the cached answer, without a model call.
+- Invalid bodies are answered 400, and requests beyond `max_pending` 503.
+"""
+import asyncio
+import json
+import threading
+
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from rag_poc import config, retrieval
+from scripts import serve
+
+EVENTS = {"a": "concert de jazz", "b": "exposition de peinture", "c": "marché de noël"}
+ANSWER = "Allez au concert."
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, data_folders, make_store, fake_embeddings, make_chat_model):
+    retrieval.clear_caches()
+    make_store(config.VECTORS_FOLDER, EVENTS, metadata={"a": {"canonicalurl": "https://example.com/a"}})
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: make_chat_model(answer=ANSWER, first_token_delay=0.02))
+
+
+def call(requests, **app_options):
+    """ Run `requests(client)` against the app, return its result. """
+    async def main():
+        async with TestClient(TestServer(serve.create_app(**app_options))) as client:
+            return await requests(client)
+    return asyncio.run(main())
+
+
+def test_health_opens_the_store_off_the_loop(monkeypatch):
+    threads = []
+    get_vector_store = retrieval.get_vector_store
+
+    def recorded():
+        threads.append(threading.current_thread().name)
+        return get_vector_store()
+
+    monkeypatch.setattr(retrieval, "get_vector_store", recorded)
+
+    async def requests(client):
+        response = await client.get("/health")
+        return response.status, await response.json()
+
+    status, body = call(requests, batch_max=1)
+
+    assert status == 200 and body["status"] == "ok" and body["documents"] == 3
+    assert threads[-1].startswith("search")
+
+
+@pytest.mark.parametrize("batch_max", [1, 64])
+def test_search_returns_closest_documents(batch_max):
+    async def requests(client):
+        response = await client.post("/search", json={"query": "jazz", "k": 2})
+        return response.status, await response.json()
+
+    status, body = call(requests, batch_max=batch_max)
+
+    assert status == 200
+    assert len(body["documents"]) == 2
+    assert body["documents"][0]["id"] == "a"
+    assert body["documents"][0]["metadata"]["canonicalurl"] == "https://example.com/a"
+    assert body["documents"][0]["score"] >= body["documents"][1]["score"]  # hybrid search: fusion scores
+
+
+def test_recommend_answers_and_streams():
+    async def requests(client):
+        answer = await (await client.post("/recommend", json={"query": "jazz"})).json()
+        response = await client.post("/recommend", json={"query": "un concert de jazz", "stream": True})
+        lines = [json.loads(line) async for line in response.content]
+        return answer, response.headers["Content-Type"], lines
+
+    answer, content_type, lines = call(requests)
+
+    assert answer["answer"] == ANSWER and answer["documents"][0]["id"] == "a"
+    assert answer["timings"]["generate_ms"] >= 20 and "retrieval_ms" in answer["timings"]
+    assert content_type.startswith("application/x-ndjson")
+    assert lines[0]["documents"][0]["id"] == "a"
+    assert "".join(line["token"] for line in lines[1:-1]) == ANSWER
+    assert lines[-1]["done"] is True
+    assert set(lines[-1]["timings"]) == {"embed_ms", "retrieval_ms", "ttft_ms", "generate_ms"}
+    assert 20 <= lines[-1]["timings"]["ttft_ms"] <= lines[-1]["timings"]["generate_ms"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_recommend_reuses_the_cached_answer(monkeypatch, make_chat_model, stream):
+    model = make_chat_model(answer=ANSWER)
+    monkeypatch.setattr(retrieval, "get_chat_model", lambda temperature: model)
+
+    async def requests(client):
+        first = await (await client.post("/recommend", json={"query": "Concert de jazz"})).json()
+        response = await client.post("/recommend", json={"query": "concert de  jazz", "stream": stream})
+        if not stream:
+            return first, await response.json()
+        lines = [json.loads(line) async for line in response.content]
+        answer = "".join(line["token"] for line in lines[1:-1])
+        return first, {"answer": answer, "documents": lines[0]["documents"], "cached": lines[-1]["cached"]}
+
+    first, second = call(requests)
+
+    assert first["cached"] is False and second["cached"] is True
+    assert second["answer"] == first["answer"] == ANSWER
+    assert [d["id"] for d in second["documents"]] == [d["id"] for d in first["documents"]]
+    assert len(model.prompts) == 1
+
+
+@pytest.mark.parametrize("body", [
+    {"k": 2}, {"query": " "}, {"query": "jazz", "k": 0}, {"query": "jazz", "temperature": 3},
+    {"query": "jazz", "k": True}, {"query": "jazz", "temperature": True}, {"query": "jazz", "stream": "false"},
+    {"query": "jazz", "filters": {"radius_km": True}}, {"query": "jazz", "filters": {"radius_km": float("inf")}},
+    {"query": "jazz", "filters": {"radius_km": float("nan")}},
+    {"query": "jazz", "filters": {"near": {"lat": True, "lon": -1.7}}},
+    {"query": "jazz", "filters": {"near": {"lat": float("nan"), "lon": -1.7}}},
+    {"query": "jazz", "filters": {"near": {"lat": 48.1, "lon": float("-inf")}}},
+    {"query": "jazz", "filters": {"near": {"lat": 91, "lon": -1.7}}},
+    {"query": "jazz", "filters": {"near": {"lat": 48.1, "lon": 181}}},
+    {"query": "jazz", "filters": {"near": [48.1, -1.7]}},
+])
+def test_invalid_body_is_rejected(body):
+    async def requests(client):
+        response = await client.post("/search", json=body)
+        return response.status, await response.json()
+
+    status, error = call(requests)
+
+    assert status == 400 and "error" in error
+
+
+def test_requests_beyond_max_pending_are_rejected():
+    async def requests(client):
+        return (await client.post("/search", json={"query": "jazz"})).status
+
+    assert call(requests, max_pending=0) == 503
@@ -0,0 +1,147 @@
+"""
+Tests for the sharded vector store: rag_poc.sharding and scripts.indexing.build_shards
+
+Includes
+--------
+- One shard per region (or month), each a complete store of its events.
+- The fan-out search over the shards gives the results of a single store.
+- The filters route the search to the shards where events may match.
+- A shard is rebuilt on its own, and only it is reopened by the retrieval.
+- An unsharded build in the folder of a sharded store replaces it.
+"""
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import polars as pl
+import pytest
+
+from rag_poc import config, retrieval
+from rag_poc.filters import EventFilter
+from rag_poc.sharding import SHARDS_FILE, ShardedStore, read_layout
+from rag_poc.vector_store import VectorStore
+import scripts.indexing as indexing
+
+pytestmark = pytest.mark.usefixtures("data_folders")
+
+# uid: title, region, city, firstdate_begin
+EVENTS = {
+    "a": ("concert de jazz au port", "Bretagne", "Brest", datetime(2025, 6, 2, tzinfo=timezone.utc)),
+    "b": ("fest noz et danse bretonne", "Bretagne", "Rennes", datetime(2025, 7, 5, tzinfo=timezone.utc)),
+    "c": ("exposition de peinture", "Normandie", "Caen", datetime(2025, 6, 20, tzinfo=timezone.utc)),
+    "d": ("concert de musique classique", "Normandie", "Rouen", datetime(2025, 8, 1, tzinfo=timezone.utc)),
+    "e": ("marché de noël et concert", "Occitanie", "Toulouse", datetime(2025, 12, 1, tzinfo=timezone.utc)),
+}
+
+
+def write_source(path, events):
+    pl.DataFrame({
+        "uid": list(events),
+        "title_fr": [title for title, *_ in events.values()],
+        "canonicalurl": [f"https://example.com/{uid}" for uid in events],
+        "location_region": [region for _, region, *_ in events.values()],
+        "location_city": [city for _, _, city, _ in events.values()],
+        "firstdate_begin": [begin for *_, begin in events.values()],
+        "lastdate_end": [begin for *_, begin in events.values()],
+    }).write_parquet(path)
+
+
+@pytest.fixture
+def embeddings(fake_embeddings):
+    with patch.object(indexing, "get_embeddings", return_value=fake_embeddings):
+        yield fake_embeddings
+
+
+def build(source, destination, shard_by="region", **kwargs):
+    indexing.build_index(
+        source=source, destination=destination, columns=["title_fr"], id_column="uid",
+        shard_by=shard_by, shard_workers=1, **kwargs
+    )
+
+
+def test_one_shard_per_region(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, EVENTS)
+
+    build(source, destination)
+
+    store = ShardedStore.load(destination, embeddings)
+    assert read_layout(destination)["shard_by"] == "region"
+    assert sorted(store.shards) == ["Bretagne", "Normandie", "Occitanie"]
+    assert sorted(store.shards["Normandie"].documents.column("doc_id").to_pylist()) == ["c", "d"]
+    assert len(store) == len(EVENTS) and store.cities == ["Brest", "Caen", "Rennes", "Rouen", "Toulouse"]
+
+    build(source, tmp_path / "months", shard_by="month")
+    assert sorted(ShardedStore.load(tmp_path / "months").shards) == ["2025-06", "2025-07", "2025-08", "2025-12"]
+
+
+def test_fan_out_matches_a_single_store(tmp_path, embeddings):
+    source = tmp_path / "events.parquet"
+    write_source(source, EVENTS)
+    build(source, tmp_path / "sharded")
+    build(source, tmp_path / "single", shard_by=None)
+
+    sharded = ShardedStore.load(tmp_path / "sharded", embeddings)
+    single = VectorStore.load(tmp_path / "single", embeddings)
+
+    for query in ("concert", "danse bretonne", "peinture à Caen"):
+        expected = single.similarity_search_with_score(query, k=3)
+        found = sharded.similarity_search_with_score(query, k=3)
+        assert [doc.id for doc, _ in found] == [doc.id for doc, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+    hybrid = sharded.batch_hybrid_search_with_score(["jazz au port", "peinture"], k=2)
+    assert [results[0][0].id for results in hybrid] == ["a", "c"]
+    assert hybrid[0][0][0].metadata["location_city"] == "Brest"
+
+
+def test_filters_route_to_shards(tmp_path, embeddings):
+    source = tmp_path / "events.parquet"
+    write_source(source, EVENTS)
+    build(source, tmp_path / "regions")
+    build(source, tmp_path / "months", shard_by="month")
+    regions = ShardedStore.load(tmp_path / "regions", embeddings)
+    months = ShardedStore.load(tmp_path / "months", embeddings)
+
+    brest = EventFilter(cities=("brest",))
+    summer = EventFilter(start=datetime(2025, 7, 1, tzinfo=timezone.utc), end=datetime(2025, 9, 1, tzinfo=timezone.utc))
+
+    assert regions.route(brest) == [regions.shards["Bretagne"]]
+    assert months.route(summer) == [months.shards["2025-07"], months.shards["2025-08"]]
+    assert regions.route(EventFilter(cities=("Paris",))) == []
+    assert [doc.id for doc, _ in regions.hybrid_search_with_score("concert", k=3, filters=brest)] == ["a"]
+    assert {doc.id for doc, _ in months.similarity_search_with_score("concert", k=5, filters=summer)} == {"b", "d"}
+
+
+def test_rebuild_one_shard(tmp_path, embeddings, monkeypatch):
+    source = tmp_path / "events.parquet"
+    write_source(source, EVENTS)
+    build(source, config.VECTORS_FOLDER)
+    retrieval.clear_caches()
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda: embeddings)
+    before = retrieval.get_vector_store()
+
+    changed = {**EVENTS}
+    changed["c"] = ("exposition de sculpture", *EVENTS["c"][1:])
+    changed["a"] = ("concert de rock au port", *EVENTS["a"][1:])
+    write_source(source, changed)
+    embeddings.embedded.clear()
+    build(source, config.VECTORS_FOLDER, incremental=True, shards=["Normandie"])
+    after = retrieval.get_vector_store()
+
+    assert embeddings.embedded == ["exposition de sculpture"]
+    assert after.version != before.version
+    assert after.shards["Bretagne"] is before.shards["Bretagne"]
+    assert after.shards["Normandie"] is not before.shards["Normandie"]
+    assert retrieval.search("sculpture", k=1)[0][0].id == "c"
+
+
+def test_unsharded_build_replaces_the_shards(tmp_path, embeddings):
+    source, destination = tmp_path / "events.parquet", tmp_path / "vectors"
+    write_source(source, EVENTS)
+    build(source, destination)
+
+    build(source, destination, shard_by=None)
+
+    assert not (destination / SHARDS_FILE).exists()
+    assert not list(destination.glob("shard-*"))
+    assert len(VectorStore.load(destination)) == len(EVENTS)
@@ -0,0 +1,45 @@
+"""
+Tests for the startup time of the command line (run.py), with `python -X importtime`
+
+Includes
+--------
+- `run --help` imports none of the heavy dependencies, and `import run` stays within its time budget.
+- The `fetch` command imports neither FAISS, LangChain nor the API server.
+"""
+import pathlib
+import re
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+HEAVY = ("faiss", "langchain", "langchain_core", "langchain_mistralai", "polars", "pyarrow", "pydantic", "bs4", "numpy", "aiohttp", "streamlit")
+# Cumulative import time of run.py (~40 ms here, 1.3 s when it imported the commands)
+STARTUP_BUDGET_MS = 300
+
+_IMPORT_TIME = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times(*args) -> dict:
+    """ Cumulative import time (µs) of each module imported by `python -X importtime <args>`. """
+    process = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+    return {
+        match.group(3): int(match.group(1))
+        for match in map(_IMPORT_TIME.match, process.stderr.splitlines()) if match
+    }
+
+
+def test_help_imports_no_heavy_dependency():
+    imported = import_times("-m", "run", "--help")
+
+    assert "rag_poc.argument_parsing" in imported
+    assert not [module for module in imported if module.split(".")[0] in HEAVY]
+    assert import_times("-c", "import run")["run"] / 1000 < STARTUP_BUDGET_MS
+
+
+def test_fetch_imports_only_its_dependencies():
+    imported = import_times("-c", "import run; from scripts import fetching")
+
+    assert "polars" in imported and "pydantic" in imported
+    assert not [module for module in imported if module.split(".")[0] in ("faiss", "langchain", "langchain_core", "aiohttp", "streamlit")]
@@ -0,0 +1,102 @@
+"""
+Tests for the batch validation of rag_poc.validation
+
+Includes
+--------
+- On a corpus of valid and invalid records, `validate_batch` accepts the same
+  events with the same values as `Event`, and rejects the others with its errors.
+- Null and numeric dates are rejected, not raised.
+- HTML is cleaned like BeautifulSoup, plain text only stripped.
+- The accepted region is the one given, the events keep it.
+"""
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+import pytest
+
+from rag_poc import config, validation
+
+NOW = datetime.now(timezone.utc)
+
+
+def iso(days: float, timespec: str = "microseconds") -> str:
+    return (NOW + timedelta(days=days)).isoformat(timespec=timespec)
+
+
+@pytest.fixture
+def corpus(make_event):
+    """ Records covering the fast path and every reason to take the detailed one. """
+    variants = [
+        {},
+        {"location_region": "Normandie"},
+        {"firstdate_begin": iso(-config.SINCE - 1)},
+        {"lastdate_begin": iso(config.UNTIL + 1)},
+        {"firstdate_end": "not-a-date"},
+        {"firstdate_end": None},
+        {"lastdate_begin": 20251017},
+        {"firstdate_end": iso(2)[:19] + "Z"},
+        {"firstdate_end": iso(2, "milliseconds")},
+        {"firstdate_end": iso(2, "seconds")},
+        {"lastdate_end": (NOW + timedelta(days=5)).astimezone(timezone(timedelta(hours=-3, minutes=-30))).isoformat()},
+        {"title_fr": None},
+        {"title_fr": 2025},
+        {"keywords_fr": ("musique", "danse")},
+        {"keywords_fr": ["musique", None]},
+        {"keywords_fr": "musique"},
+        {"description_fr": 3},
+        {"location_coordinates": {"lat": 48, "lon": -2}},
+        {"location_coordinates": {"lat": "48.1", "lon": -1.6}},
+        {"location_coordinates": {"lat": 48.1}},
+        {"longdescription_fr": "  Texte   brut\n"},
+        {"longdescription_fr": "<p>Concert &amp; <b>danse</b></p>"},
+        {"longdescription_fr": ""},
+        {"description_fr": None, "conditions_fr": "Gratuit"},
+    ]
+    records = []
+    for i, variant in enumerate(variants):
+        record = {**make_event(i), **variant}
+        records.append(record)
+    missing = make_event(len(records))
+    del missing["location_city"]
+    return records + [missing]
+
+
+def test_batch_matches_the_model(corpus):
+    expected, expected_errors = [], []
+    for record in corpus:
+        try:
+            expected.append(validation.Event.model_validate(record).model_dump())
+        except Exception as e:
+            expected_errors.append((record["uid"], str(e).splitlines()[1]))
+
+    events, rejected = validation.validate_batch(corpus)
+
+    assert events.equals(pl.DataFrame(expected, schema=validation.EVENT_SCHEMA))
+    assert [(r["doc"]["uid"], str(r["error"]).splitlines()[1]) for r in rejected] == expected_errors
+    assert 0 < len(rejected) < len(corpus)
+
+
+def test_dates_that_are_not_strings_are_rejected(make_event):
+    records = [{**make_event(0), "firstdate_begin": None}, {**make_event(1), "lastdate_end": 1760659200}, make_event(2)]
+
+    events, rejected = validation.validate_batch(records)
+
+    assert events["uid"].to_list() == ["event00002"]
+    assert [r["doc"]["uid"] for r in rejected] == ["event00000", "event00001"]
+    assert all("ISO 8601" in str(r["error"]) for r in rejected)
+
+
+def test_clean_html():
+    assert validation.clean_html("<p>Un <b>concert</b>&nbsp;!</p>") == "Un  concert \xa0!"
+    assert validation.clean_html("  texte\n") == "texte"
+    assert validation.clean_html("") is None
+
+
+def test_region_of_the_fetch(make_event):
+    records = [make_event(0, region="Normandie"), make_event(1)]
+
+    events, rejected = validation.validate_batch(records, region="Normandie")
+
+    assert events["location_region"].to_list() == ["Normandie"]
+    assert [r["doc"]["uid"] for r in rejected] == ["event00001"]
+    assert validation.Event.model_validate(records[0], context={"region": "Normandie"}).location_region == "Normandie"
@@ -0,0 +1,88 @@
+"""
+Tests for rag_poc.vector_store
+
+Includes
+--------
+- A saved store is reopened memory-mapped, with its documents and metadata types.
+- Unknown ids return no document.
+- Saving a new version keeps the previous one for open readers and deletes the older ones.
+- The store contains no pickle, and the files of the LangChain layout are removed.
+"""
+from datetime import datetime, timezone
+
+from langchain.schema import Document
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import clustered_vectors
+from rag_poc import faiss_index
+from rag_poc.vector_store import VectorStore, documents_table, faiss_id, read_manifest, save_store
+
+
+def make_documents(n):
+    return {
+        f"doc{i}": Document(
+            page_content=f"texte {i}",
+            metadata={
+                "content_hash": f"h{i}",
+                "firstdate_begin": datetime(2025, 1, 1 + i % 28, tzinfo=timezone.utc),
+                "keywords_fr": ["a", "b"] if i % 2 else None,
+                "location_coordinates": {"lon": 2.0 + i, "lat": 48.0},
+            },
+        )
+        for i in range(n)
+    }
+
+
+def save(folder, n=40, index_type="flat"):
+    documents = make_documents(n)
+    vectors = clustered_vectors(n, 16, n_clusters=4)
+    index, params = faiss_index.create_index(index_type, vectors)
+    index.add_with_ids(vectors, np.array([faiss_id(doc_id) for doc_id in documents], dtype=np.int64))
+    save_store(folder, index, documents_table(documents), params, "test-model")
+    return documents, vectors
+
+
+def test_store_round_trip(tmp_path):
+    documents, vectors = save(tmp_path)
+
+    store = VectorStore.load(tmp_path)
+    results = store.similarity_search_with_score_by_vector(vectors[7], k=1)
+
+    assert len(store) == store.index.ntotal == 40
+    doc, distance = results[0]
+    assert doc.id == "doc7" and distance == pytest.approx(0, abs=1e-4)
+    assert doc.page_content == "texte 7"
+    assert doc.metadata == documents["doc7"].metadata
+
+
+def test_unknown_ids_return_none(tmp_path):
+    save(tmp_path)
+    store = VectorStore.load(tmp_path)
+
+    found = store.get_documents([faiss_id("doc3"), -1, faiss_id("nope")])
+
+    assert [doc and doc.id for doc in found] == ["doc3", None, None]
+
+
+def test_new_version_keeps_the_previous_one(tmp_path):
+    versions = []
+    for n in (10, 20, 30):
+        save(tmp_path, n)
+        versions.append(read_manifest(tmp_path)["path"])
+
+    assert sorted(p.name for p in tmp_path.glob("v-*")) == sorted(versions[1:])
+    assert len(VectorStore.load(tmp_path)) == 30
+
+
+def test_no_pickle_and_legacy_files_removed(tmp_path):
+    (tmp_path / "index.pkl").write_bytes(b"legacy")
+    save(tmp_path)
+
+    assert not list(tmp_path.rglob("*.pkl"))
+    assert VectorStore.load(tmp_path).manifest["embedding_model"] == "test-model"
+
+
+def test_missing_store_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        VectorStore.load(tmp_path)